@@ -0,0 +1,38 @@
+# recursive fib(12) with jal/jr, keeping $ra, n and fib(n - 1) in a stack
+# frame below $sp
+# end state: $s0 = fib(12) = 144, $s1 = calls, $s2 = lowest $sp, $sp back at 0x7ffc
+        addi $sp, $zero, 0x7ffc
+        add  $s1, $zero, $zero
+        add  $s2, $sp, $zero
+        addi $a0, $zero, 12
+        jal  fib
+        add  $s0, $v0, $zero
+end:
+        j end
+
+# $v0 = fib($a0)
+fib:
+        addi $s1, $s1, 1
+        slti $t0, $a0, 2
+        beq  $t0, $zero, fib_rec
+        add  $v0, $a0, $zero
+        jr   $ra
+fib_rec:
+        addi $sp, $sp, -12
+        slt  $t0, $sp, $s2
+        beq  $t0, $zero, deeper
+        add  $s2, $sp, $zero
+deeper:
+        sw   $ra, 8($sp)
+        sw   $a0, 4($sp)
+        addi $a0, $a0, -1
+        jal  fib
+        sw   $v0, 0($sp)
+        lw   $a0, 4($sp)
+        addi $a0, $a0, -2
+        jal  fib
+        lw   $t1, 0($sp)
+        add  $v0, $v0, $t1
+        lw   $ra, 8($sp)
+        addi $sp, $sp, 12
+        jr   $ra
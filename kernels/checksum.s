@@ -0,0 +1,32 @@
+# Fletcher-style checksum over 512 words of RAM at 0x4000, filled with
+# x = 5x + 7: a += low half of the word, b += a, both kept to 16 bits
+# end state: $s0 = a, $s1 = b, $s2 = b << 16 | a
+        addi $t0, $zero, 0x4000
+        addi $t1, $zero, 512
+        addi $t2, $zero, 5
+fill:
+        sw   $t2, 0($t0)
+        sll  $t3, $t2, 2
+        addu $t2, $t2, $t3
+        addi $t2, $t2, 7
+        addi $t0, $t0, 4
+        addi $t1, $t1, -1
+        bne  $t1, $zero, fill
+
+        add  $s0, $zero, $zero
+        add  $s1, $zero, $zero
+        addi $t0, $zero, 0x4000
+        addi $t4, $zero, 0x4800
+sum:
+        lw   $t2, 0($t0)
+        andi $t2, $t2, 0xffff
+        addu $s0, $s0, $t2
+        andi $s0, $s0, 0xffff
+        addu $s1, $s1, $s0
+        andi $s1, $s1, 0xffff
+        addi $t0, $t0, 4
+        bne  $t0, $t4, sum
+        sll  $s2, $s1, 16
+        or   $s2, $s2, $s0
+end:
+        j end
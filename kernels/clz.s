@@ -0,0 +1,38 @@
+# leading zero histogram: 32 values of x = 5x + 13, each shifted right by 3
+# until it is 0, counted in a table at 0x4000 by clz
+# end state: $s0 = sum of the leading zero counts, $s1 = values with the top
+# bit set, $s2 = buckets used
+        add  $s0, $zero, $zero
+        addi $t0, $zero, 32
+        addi $t6, $zero, 0x4000
+        addi $t1, $zero, 0x4d2
+values:
+        sll  $t2, $t1, 2
+        addu $t1, $t1, $t2
+        addi $t1, $t1, 13
+        add  $t2, $t1, $zero
+shifts:
+        clz  $t3, $t2
+        addu $s0, $s0, $t3
+        sll  $t3, $t3, 2
+        addu $t3, $t3, $t6
+        lw   $t4, 0($t3)
+        addi $t4, $t4, 1
+        sw   $t4, 0($t3)
+        srl  $t2, $t2, 3
+        bne  $t2, $zero, shifts
+        addi $t0, $t0, -1
+        bne  $t0, $zero, values
+
+        lw   $s1, 0($t6)
+        add  $s2, $zero, $zero
+        addi $t7, $t6, 128        # the 32 buckets of nonzero values
+buckets:
+        lw   $t4, 0($t6)
+        beq  $t4, $zero, empty
+        addi $s2, $s2, 1
+empty:
+        addi $t6, $t6, 4
+        bne  $t6, $t7, buckets
+end:
+        j end
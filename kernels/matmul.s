@@ -0,0 +1,68 @@
+# C = A * B for 5x5 integer matrices, multiplying with a shift-add leaf
+# routine: A at 0x4000 and B right after it hold the low 6 bits of
+# x = 5x + 7, C is at 0x4200
+# end state: $s0 = sum of C, $s1 = C[0][0], $s2 = C[4][4]
+        addi $t0, $zero, 0x4000
+        addi $t1, $zero, 50
+        addi $t2, $zero, 3
+fill:
+        andi $t3, $t2, 0x3f
+        sw   $t3, 0($t0)
+        sll  $t4, $t2, 2
+        addu $t2, $t2, $t4
+        addi $t2, $t2, 7
+        addi $t0, $t0, 4
+        addi $t1, $t1, -1
+        bne  $t1, $zero, fill
+
+        add  $s0, $zero, $zero
+        addi $t0, $zero, 0x4000   # &A[i][0]
+        addi $t1, $zero, 0x4200   # &C[i][j]
+        addi $t7, $zero, 5
+rows:
+        addi $t2, $zero, 0x4064   # &B[0][j]
+        addi $t6, $zero, 5
+cols:
+        add  $s6, $zero, $zero
+        add  $t3, $t0, $zero      # &A[i][k]
+        add  $t4, $t2, $zero      # &B[k][j]
+        addi $t5, $zero, 5
+dot:
+        lw   $a0, 0($t3)
+        lw   $a1, 0($t4)
+        jal  mul
+        addu $s6, $s6, $v0
+        addi $t3, $t3, 4
+        addi $t4, $t4, 20
+        addi $t5, $t5, -1
+        bne  $t5, $zero, dot
+        sw   $s6, 0($t1)
+        addu $s0, $s0, $s6
+        addi $t1, $t1, 4
+        addi $t2, $t2, 4
+        addi $t6, $t6, -1
+        bne  $t6, $zero, cols
+        addi $t0, $t0, 20
+        addi $t7, $t7, -1
+        bne  $t7, $zero, rows
+
+        addi $t1, $zero, 0x4200
+        lw   $s1, 0($t1)
+        lw   $s2, 96($t1)
+end:
+        j end
+
+# $v0 = $a0 * $a1
+mul:
+        add  $v0, $zero, $zero
+mul_loop:
+        beq  $a1, $zero, mul_done
+        andi $t8, $a1, 1
+        beq  $t8, $zero, mul_skip
+        addu $v0, $v0, $a0
+mul_skip:
+        sll  $a0, $a0, 1
+        srl  $a1, $a1, 1
+        j    mul_loop
+mul_done:
+        jr   $ra
@@ -0,0 +1,43 @@
+# memcpy: fills 256 words at 0x4000 with x = 5x + 7, copies them to 0x5000
+# four words at a time and adds up the copy
+# end state: $s0 = sum of the copy, $s1 = words copied, $s2 = last word copied
+        addi $t0, $zero, 0x4000
+        addi $t1, $zero, 256
+        addi $t2, $zero, 1
+fill:
+        sw   $t2, 0($t0)
+        sll  $t3, $t2, 2
+        addu $t2, $t2, $t3
+        addi $t2, $t2, 7
+        addi $t0, $t0, 4
+        addi $t1, $t1, -1
+        bne  $t1, $zero, fill
+
+        addi $t0, $zero, 0x4000
+        addi $t1, $zero, 0x5000
+        addi $t4, $zero, 0x4400
+copy:
+        lw   $t2, 0($t0)
+        lw   $t3, 4($t0)
+        sw   $t2, 0($t1)
+        sw   $t3, 4($t1)
+        lw   $t2, 8($t0)
+        lw   $t3, 12($t0)
+        sw   $t2, 8($t1)
+        sw   $t3, 12($t1)
+        addi $t0, $t0, 16
+        addi $t1, $t1, 16
+        bne  $t0, $t4, copy
+
+        add  $s0, $zero, $zero
+        add  $s1, $zero, $zero
+        addi $t1, $zero, 0x5000
+        addi $t4, $zero, 0x5400
+sum:
+        lw   $s2, 0($t1)
+        addu $s0, $s0, $s2
+        addi $s1, $s1, 1
+        addi $t1, $t1, 4
+        bne  $t1, $t4, sum
+end:
+        j end
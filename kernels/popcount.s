@@ -0,0 +1,29 @@
+# population count of 64 values of x = 5x + 13, clearing the lowest set bit
+# each pass (x & (x - 1))
+# end state: $s0 = total set bits, $s1 = last value, $s2 = largest count
+        add  $s0, $zero, $zero
+        add  $s2, $zero, $zero
+        addi $t0, $zero, 64
+        addi $s1, $zero, 0x1234
+values:
+        sll  $t1, $s1, 2
+        addu $s1, $s1, $t1
+        addi $s1, $s1, 13
+        add  $t2, $s1, $zero
+        add  $t3, $zero, $zero
+bits:
+        beq  $t2, $zero, counted
+        addi $t4, $t2, -1
+        and  $t2, $t2, $t4
+        addi $t3, $t3, 1
+        j    bits
+counted:
+        addu $s0, $s0, $t3
+        slt  $t5, $s2, $t3
+        beq  $t5, $zero, smaller
+        add  $s2, $t3, $zero
+smaller:
+        addi $t0, $t0, -1
+        bne  $t0, $zero, values
+end:
+        j end
@@ -0,0 +1,52 @@
+# insertion sort of 48 words at 0x4000, filled with the low 10 bits of
+# x = 5x + 7, then a pass counting the pairs in order
+# end state: $s0 = pairs in order (47 when sorted), $s1 = smallest, $s2 = largest
+        addi $s3, $zero, 0x4000
+        add  $t0, $s3, $zero
+        addi $t1, $zero, 48
+        addi $t2, $zero, 11
+fill:
+        andi $t3, $t2, 0x3ff
+        sw   $t3, 0($t0)
+        sll  $t4, $t2, 2
+        addu $t2, $t2, $t4
+        addi $t2, $t2, 7
+        addi $t0, $t0, 4
+        addi $t1, $t1, -1
+        bne  $t1, $zero, fill
+
+        addi $t0, $s3, 4          # &a[i]
+        addi $t9, $s3, 192        # &a[48]
+outer:
+        lw   $t2, 0($t0)          # key
+        addi $t1, $t0, -4         # &a[j]
+inner:
+        slt  $t5, $t1, $s3
+        bne  $t5, $zero, place
+        lw   $t3, 0($t1)
+        slt  $t5, $t2, $t3
+        beq  $t5, $zero, place
+        sw   $t3, 4($t1)
+        addi $t1, $t1, -4
+        j    inner
+place:
+        sw   $t2, 4($t1)
+        addi $t0, $t0, 4
+        bne  $t0, $t9, outer
+
+        add  $s0, $zero, $zero
+        lw   $s1, 0($s3)
+        add  $t0, $s3, $zero
+        addi $t9, $s3, 188        # &a[47]
+check:
+        lw   $t2, 0($t0)
+        lw   $t3, 4($t0)
+        slt  $t5, $t3, $t2
+        bne  $t5, $zero, next
+        addi $s0, $s0, 1
+next:
+        addi $t0, $t0, 4
+        bne  $t0, $t9, check
+        lw   $s2, 0($t9)
+end:
+        j end
@@ -0,0 +1,11 @@
+addi $s0, $zero, 25000
+addi $s1, $zero, 0
+loop:
+beq $s0, $zero, done
+addi $s1, $s1, 3
+addi $s0, $s0, -1
+j loop
+done:
+add $s2, $s1, $s1
+end:
+j end
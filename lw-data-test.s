@@ -0,0 +1,6 @@
+.data
+val: .word 0x1234abcd
+.text
+la $t0, val
+lw $s0, 0($t0)
+li $s1, 0x1234abcd
@@ -3,12 +3,18 @@
 set -o nounset
 asmfile=$1
 
-# creates a header file that will be prepended to the hex files created
-echo "v2.0 raw" > header.tmp
-
 # .text starts at address 0x0000
 # .data starts at address 0x2000
 
+# tests/assembler.py writes $asmfile.text.hex and $asmfile.data.hex in one pass, the same
+# images as the MARS commands below (which run instead with ASSEMBLER=mars)
+if [ "${ASSEMBLER:-python}" != "mars" ]; then
+  exec python "$(dirname "$0")/tests/assembler.py" "$asmfile"
+fi
+
+# creates a header file that will be prepended to the hex files created
+echo "v2.0 raw" > header.tmp
+
 # runs mars on the assembly file
 # outputs the text segment in $asmfile.text.hex
 java -jar mars.jar a dump .text HexText text_t.hex nc mc CompactTextAtZero $asmfile
@@ -18,11 +24,15 @@ cat header.tmp text_t.hex > $asmfile.text.hex
 # outputs the memory contents of data segment in $asmfile.data.hex
 java -jar mars.jar a dump .data HexText data_t.hex nc mc CompactTextAtZero $asmfile
 
-# filler before .data segment
-echo 00000000 | awk '{for(i=0;i<8192;i++)print}' > filler_t.hex
+# filler before .data segment, as one run (Logisim reads count*word): RAM is
+# word addressed, so 0x2000 is word 0x800 = 2048
+echo 2048*00000000 > filler_t.hex
 
 cat header.tmp filler_t.hex data_t.hex > $asmfile.data.hex
 
+# collapses the zero blocks MARS dumps after the data into runs too
+python "$(dirname "$0")/tests/memimage.py" $asmfile.data.hex
+
 rm text_t.hex
 rm data_t.hex
 rm filler_t.hex
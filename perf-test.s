@@ -0,0 +1,16 @@
+addi $s0, $zero, 1
+sw $t0, 64($zero)
+beq $s0, $zero, skip
+addi $s1, $zero, 2
+skip:
+bne $s0, $zero, over
+addi $s1, $zero, 7
+over:
+j next
+addi $s2, $zero, 9
+next:
+jal last
+addi $s2, $zero, 5
+last:
+lw $t1, 64($zero)
+add $s2, $s0, $s1
@@ -0,0 +1,503 @@
+#!/usr/bin/env python
+"""
+    Assembler for the MIPS subset cpu.circ implements, writing the same
+    `v2.0 raw` images mars-assem.sh gets out of MARS:
+
+        python assembler.py program.s      # program.s.text.hex and program.s.data.hex
+
+    The memory layout is MARS's CompactTextAtZero: .text at 0x0000 and .data at
+    0x2000, dumped the way MARS dumps them (the data segment in whole 1024 word
+    blocks) and with mars-assem.sh's 0x800 filler words in front of the data,
+    so it starts at word 0x2000 >> 2 as mem.circ addresses it, written as the
+    one run 2048*0 (see memimage.py).
+    Besides the instructions listed in README.md it takes the MARS pseudo
+    instructions that expand to them (nop, move, li, la, beqz, bnez, blt, bgt,
+    ble, bge, lw/sw of a label and out-of-range immediates), expanded the way
+    MARS does in a compact memory configuration, and the .text,
+    .data, .word, .half, .byte, .space, .align, .ascii, .asciiz and .globl
+    directives.
+
+    Assembled images are cached by a hash of the source, in memory and in
+    $MIPS_ASM_CACHE (default: a directory in /tmp).
+"""
+
+import argparse
+import hashlib
+import os
+import os.path
+import re
+import sys
+import tempfile
+
+import memimage
+import mipsmodel
+import resultcache
+
+TEXT_BASE = 0x0000
+TEXT_LIMIT = 0x0ffc
+DATA_BASE = 0x2000
+DATA_LIMIT = 0x3ffc
+# MARS keeps data memory in blocks of 1024 words (4K bytes) counted from the .extern base,
+# and a dump runs to the end of the last block written to
+BLOCK_BASE = 0x1000
+BLOCK_BYTES = 4096
+# the zero words mars-assem.sh writes in front of the data segment: RAM is word addressed
+DATA_FILLER = DATA_BASE >> 2
+
+AT = 1
+
+FUNCTS = dict((name, funct) for funct, name in mipsmodel.R_FUNCTS.items())
+OPCODES = dict((name, op) for op, name in mipsmodel.OPCODES.items())
+REGISTERS = dict(('$' + name, n) for n, name in enumerate(mipsmodel.REG_NAMES))
+REGISTERS.update(('${}'.format(n), n) for n in range(32))
+
+# immediate instructions: (the R-type instruction MARS falls back to for a 32 bit value,
+# whether the 16 bit immediate is signed)
+IMMEDIATES = {'addi': ('add', True), 'addiu': ('addu', True), 'slti': ('slt', True),
+              'sltiu': ('sltu', True), 'andi': ('and', False), 'ori': ('or', False)}
+
+# pseudo branches: (slt operands swapped, branch taken when slt is 1)
+COMPARE_BRANCHES = {'blt': (False, True), 'bgt': (True, True), 'bge': (False, False), 'ble': (True, False)}
+
+class AssemblerException(Exception):
+    pass
+
+_token_re = re.compile(r"""\s*(\$\w+|-?0[xX][0-9a-fA-F]+|-?\d+|'(?:\\.|[^'\\])'|[A-Za-z_.][\w.]*|[(),+-])""")
+_string_re = re.compile(r'"((?:\\.|[^"\\])*)"')
+_label_re = re.compile(r'\s*([A-Za-z_.][\w.]*)\s*:')
+
+ESCAPES = {'n': '\n', 't': '\t', 'r': '\r', '0': '\0', '\\': '\\', '"': '"', "'": "'"}
+
+def _unescape(s):
+    return re.sub(r'\\(.)', lambda m: ESCAPES.get(m.group(1), m.group(1)), s)
+
+def _strip_comment(line):
+    # '#' starts a comment unless it is inside a string or character literal
+    quote = None
+    for i, c in enumerate(line):
+        if quote:
+            if c == '\\':
+                continue
+            if c == quote and line[i - 1] != '\\':
+                quote = None
+        elif c in '"\'':
+            quote = c
+        elif c == '#':
+            return line[:i]
+    return line
+
+def _tokens(text):
+    tokens = []
+    pos = 0
+    text = text.rstrip()
+    while pos < len(text):
+        m = _token_re.match(text, pos)
+        if not m:
+            raise AssemblerException("cannot parse '{}'".format(text[pos:].strip()))
+        tokens.append(m.group(1))
+        pos = m.end()
+    return tokens
+
+class Operand(object):
+    """
+        kind is 'reg' (value is the register number), 'imm' (value), 'label' (name plus
+        offset in value) or 'mem' (base register in reg, displacement in disp as an Operand).
+    """
+    __slots__ = ('kind', 'value', 'name', 'reg', 'disp')
+
+    def __init__(self, kind, value=0, name=None, reg=None, disp=None):
+        self.kind = kind
+        self.value = value
+        self.name = name
+        self.reg = reg
+        self.disp = disp
+
+def _number(tok):
+    if tok.startswith("'"):
+        return ord(_unescape(tok[1:-1]))
+    return int(tok, 0) if not re.match(r'-?0\d', tok) else int(tok, 10)
+
+def _operand(tokens):
+    # one operand from the front of tokens: register, number, label[+-number], or displacement(register)
+    tok = tokens.pop(0)
+    if tok in REGISTERS:
+        return Operand('reg', REGISTERS[tok])
+    if tok.startswith('$'):
+        raise AssemblerException("unknown register {}".format(tok))
+    if tok == '(':
+        tokens.insert(0, tok)
+        disp = Operand('imm', 0)
+    elif tok[0] in "-'" or tok[0].isdigit():
+        disp = Operand('imm', _number(tok))
+    elif tok in ('(', ')', ',', '+', '-'):
+        raise AssemblerException("unexpected '{}'".format(tok))
+    else:
+        disp = Operand('label', 0, tok)
+        # label+4 comes as ['+', '4'], label-4 as ['-4']
+        if len(tokens) >= 2 and tokens[0] == '+' and tokens[1][0].isdigit():
+            tokens.pop(0)
+            disp.value = _number(tokens.pop(0))
+        elif tokens and tokens[0].startswith('-') and len(tokens[0]) > 1:
+            disp.value = _number(tokens.pop(0))
+    if tokens and tokens[0] == '(':
+        tokens.pop(0)
+        reg = tokens.pop(0) if tokens else None
+        if reg not in REGISTERS or not tokens or tokens.pop(0) != ')':
+            raise AssemblerException("bad memory operand")
+        return Operand('mem', reg=REGISTERS[reg], disp=disp)
+    return disp
+
+def _operands(text):
+    tokens = _tokens(text)
+    ops = []
+    while tokens:
+        if tokens[0] == ',':
+            tokens.pop(0)
+            continue
+        ops.append(_operand(tokens))
+    return ops
+
+def _fits(value, signed):
+    return -0x8000 <= value < 0x8000 if signed else 0 <= value < 0x10000
+
+def _r(op, rs, rt, rd, shamt=0):
+    return (rs << 21) | (rt << 16) | (rd << 11) | (shamt << 6) | FUNCTS[op]
+
+def _i(op, rs, rt, imm):
+    return (OPCODES[op] << 26) | (rs << 21) | (rt << 16) | (imm & 0xffff)
+
+def _hi(value):
+    return (value >> 16) & 0xffff
+
+class Statement(object):
+    __slots__ = ('line', 'addr', 'op', 'operands')
+
+    def __init__(self, line, addr, op, operands):
+        self.line = line
+        self.addr = addr
+        self.op = op
+        self.operands = operands
+
+class Assembler(object):
+    """
+        Two passes over the source: the first lays out both segments and collects the labels,
+        the second encodes the instructions.  An instruction (pseudo or not) expands to the
+        same number of words in both passes.
+    """
+
+    def __init__(self, source, name='<source>'):
+        self.name = name
+        self.labels = {}
+        self.statements = []
+        self.data = {}
+        self.line = 0
+        self._layout(source)
+
+    def error(self, msg, line=None):
+        return AssemblerException("{}:{}: {}".format(self.name, line or self.line, msg))
+
+    # --- first pass ------------------------------------------------------------
+
+    def _layout(self, source):
+        segment = 'text'
+        pc = {'text': TEXT_BASE, 'data': DATA_BASE}
+        self.pending = []
+        for self.line, raw in enumerate(source.splitlines(), 1):
+            text = _strip_comment(raw)
+            while True:
+                m = _label_re.match(text)
+                if not m:
+                    break
+                self._define(m.group(1), pc[segment])
+                text = text[m.end():]
+            text = text.strip()
+            if not text:
+                continue
+            op, rest = re.match(r'(\S+)\s*(.*)', text).groups()
+            op = op.lower()
+            try:
+                if op in ('.text', '.data'):
+                    if rest.strip():
+                        raise AssemblerException("{} at a given address is not supported".format(op))
+                    segment = op[1:]
+                elif op in ('.globl', '.global', '.extern', '.ent', '.end'):
+                    pass
+                elif op.startswith('.'):
+                    if segment != 'data':
+                        raise AssemblerException("{} is only supported in .data".format(op))
+                    pc['data'] = self._directive(op, rest, pc['data'])
+                else:
+                    if segment != 'text':
+                        raise AssemblerException("instruction {} in .data".format(op))
+                    stmt = Statement(self.line, pc['text'], op, _operands(rest))
+                    self.statements.append(stmt)
+                    pc['text'] += 4 * len(self._expand(stmt, layout=True))
+                    if pc['text'] - 4 > TEXT_LIMIT:
+                        raise AssemblerException("text segment is full")
+            except AssemblerException as e:
+                if str(e).startswith(self.name + ':'):
+                    raise
+                raise self.error(e)
+        self.text_end = pc['text']
+        # .word label values, now that every label is known
+        for addr, operand, line in self.pending:
+            self._store(addr, self._value(operand, line) & 0xffffffff, 4)
+
+    def _define(self, label, addr):
+        if label in self.labels:
+            raise self.error("label {} defined twice".format(label))
+        self.labels[label] = addr
+
+    def _store(self, addr, value, size):
+        if addr + size - 1 > DATA_LIMIT:
+            raise self.error("data segment is full")
+        for i in range(size):
+            self.data[addr + i] = (value >> (8 * i)) & 0xff
+
+    def _directive(self, op, rest, addr):
+        sizes = {'.word': 4, '.half': 2, '.byte': 1}
+        if op in sizes:
+            size = sizes[op]
+            addr += -addr % size
+            for operand in _operands(rest):
+                if operand.kind == 'label' and size == 4:
+                    self.pending.append((addr, operand, self.line))
+                elif operand.kind == 'imm':
+                    self._store(addr, operand.value, size)
+                else:
+                    raise AssemblerException("bad {} value".format(op))
+                addr += size
+            return addr
+        if op in ('.ascii', '.asciiz'):
+            strings = _string_re.findall(rest)
+            if not strings:
+                raise AssemblerException("{} needs a string".format(op))
+            for s in strings:
+                s = _unescape(s) + ('\0' if op == '.asciiz' else '')
+                for c in s:
+                    self._store(addr, ord(c), 1)
+                    addr += 1
+            return addr
+        ops = _operands(rest)
+        if len(ops) != 1 or ops[0].kind != 'imm':
+            raise AssemblerException("{} needs a number".format(op))
+        if op == '.space':
+            return addr + ops[0].value
+        if op == '.align':
+            return addr + (-addr % (1 << ops[0].value))
+        raise AssemblerException("unsupported directive {}".format(op))
+
+    # --- second pass -----------------------------------------------------------
+
+    def text(self):
+        words = []
+        for stmt in self.statements:
+            self.line = stmt.line
+            try:
+                words.extend(self._expand(stmt))
+            except AssemblerException as e:
+                raise self.error(e)
+        return words
+
+    def data_words(self):
+        """
+            The data segment as MARS dumps it: from DATA_BASE to the end of the last of the
+            consecutive 4K blocks written to, or nothing if the first one was never written.
+        """
+        blocks = set((a - BLOCK_BASE) // BLOCK_BYTES for a in self.data)
+        block = (DATA_BASE - BLOCK_BASE) // BLOCK_BYTES
+        while block in blocks:
+            block += 1
+        end = min(BLOCK_BASE + block * BLOCK_BYTES, DATA_LIMIT + 4)
+        return [sum(self.data.get(a + i, 0) << (8 * i) for i in range(4)) for a in range(DATA_BASE, end, 4)]
+
+    def _value(self, operand, line=None):
+        if operand.kind == 'imm':
+            return operand.value
+        if operand.name not in self.labels:
+            raise self.error("undefined label {}".format(operand.name), line)
+        return self.labels[operand.name] + operand.value
+
+    def _expand(self, stmt, layout=False):
+        """
+            The words of one instruction.  While laying out, labels read as 0.
+        """
+        op, ops, pc = stmt.op, stmt.operands, stmt.addr
+        value = (lambda o: 0 if o.kind == 'label' else o.value) if layout else self._value
+
+        def kinds(*expected):
+            if tuple(o.kind for o in ops) != expected:
+                raise AssemblerException("wrong operands for {}".format(op))
+
+        def reg(o):
+            return o.value
+
+        def branch(target, at):
+            offset = value(target) - (at + 4) if not (layout and target.kind == 'label') else 0
+            if offset % 4 or not _fits(offset >> 2, True):
+                raise AssemblerException("branch target out of range")
+            return (offset >> 2) & 0xffff
+
+        if op in ('add', 'addu', 'and', 'or', 'slt', 'sltu'):
+            kinds('reg', 'reg', 'reg')
+            return [_r(op, reg(ops[1]), reg(ops[2]), reg(ops[0]))]
+        if op in ('sll', 'srl', 'sra'):
+            kinds('reg', 'reg', 'imm')
+            if not 0 <= ops[2].value < 32:
+                raise AssemblerException("shift amount out of range")
+            return [_r(op, 0, reg(ops[1]), reg(ops[0]), ops[2].value)]
+        if op == 'jr':
+            kinds('reg')
+            return [_r(op, reg(ops[0]), 0, 0)]
+        if op == 'clz':
+            kinds('reg', 'reg')
+            return [(mipsmodel.SPECIAL2 << 26) | (reg(ops[1]) << 21) | (reg(ops[0]) << 11) | mipsmodel.CLZ_FUNCT]
+        if op in ('j', 'jal'):
+            if len(ops) != 1 or ops[0].kind not in ('label', 'imm'):
+                raise AssemblerException("wrong operands for {}".format(op))
+            return [(OPCODES[op] << 26) | ((value(ops[0]) >> 2) & 0x3ffffff)]
+        if op in ('beq', 'bne'):
+            if len(ops) != 3 or ops[0].kind != 'reg' or ops[1].kind != 'reg':
+                raise AssemblerException("wrong operands for {}".format(op))
+            return [_i(op, reg(ops[0]), reg(ops[1]), branch(ops[2], pc))]
+        if op in ('beqz', 'bnez'):
+            if len(ops) != 2 or ops[0].kind != 'reg':
+                raise AssemblerException("wrong operands for {}".format(op))
+            return [_i(op[:3], reg(ops[0]), 0, branch(ops[1], pc))]
+        if op in COMPARE_BRANCHES:
+            if len(ops) != 3 or ops[0].kind != 'reg' or ops[1].kind != 'reg':
+                raise AssemblerException("wrong operands for {}".format(op))
+            swap, taken = COMPARE_BRANCHES[op]
+            a, b = (ops[1], ops[0]) if swap else (ops[0], ops[1])
+            return [_r('slt', reg(a), reg(b), AT),
+                    _i('bne' if taken else 'beq', AT, 0, branch(ops[2], pc + 4))]
+        if op in IMMEDIATES:
+            kinds('reg', 'reg', 'imm')
+            imm = ops[2].value
+            fallback, signed = IMMEDIATES[op]
+            if _fits(imm, signed):
+                return [_i(op, reg(ops[1]), reg(ops[0]), imm)]
+            if not -0x80000000 <= imm <= 0xffffffff:
+                raise AssemblerException("immediate out of range")
+            return [_i('lui', 0, AT, _hi(imm)), _i('ori', AT, AT, imm),
+                    _r(fallback, reg(ops[1]), AT, reg(ops[0]))]
+        if op == 'lui':
+            kinds('reg', 'imm')
+            if not _fits(ops[1].value, False):
+                raise AssemblerException("immediate out of range")
+            return [_i(op, 0, reg(ops[0]), ops[1].value)]
+        if op in ('lw', 'sw'):
+            if len(ops) != 2 or ops[0].kind != 'reg' or ops[1].kind not in ('mem', 'label'):
+                raise AssemblerException("wrong operands for {}".format(op))
+            if ops[1].kind == 'mem' and ops[1].disp.kind == 'imm':
+                if not _fits(ops[1].disp.value, True):
+                    raise AssemblerException("offset out of range")
+                return [_i(op, ops[1].reg, reg(ops[0]), ops[1].disp.value)]
+            # a label, possibly plus a base register: in the compact layout every address fits
+            # the 16 bit offset, and MARS uses its COMPACT expansion (no $at)
+            base = ops[1].reg if ops[1].kind == 'mem' else 0
+            addr = value(ops[1].disp if ops[1].kind == 'mem' else ops[1])
+            return [_i(op, base, reg(ops[0]), addr)]
+        if op == 'nop':
+            kinds()
+            return [0]
+        if op == 'move':
+            kinds('reg', 'reg')
+            return [_r('addu', 0, reg(ops[1]), reg(ops[0]))]
+        if op == 'li':
+            kinds('reg', 'imm')
+            imm = ops[1].value
+            if _fits(imm, True):
+                return [_i('addiu', 0, reg(ops[0]), imm)]
+            if _fits(imm, False):
+                return [_i('ori', 0, reg(ops[0]), imm)]
+            if not -0x80000000 <= imm <= 0xffffffff:
+                raise AssemblerException("immediate out of range")
+            return [_i('lui', 0, AT, _hi(imm)), _i('ori', AT, reg(ops[0]), imm)]
+        if op == 'la':
+            kinds('reg', 'label')
+            # MARS's COMPACT expansion, again
+            return [_i('addi', 0, reg(ops[0]), value(ops[1]))]
+        raise AssemblerException("unsupported instruction {}".format(op))
+
+class Program(object):
+    """
+        Assembled segments: text and data are lists of words.
+    """
+
+    def __init__(self, text, data):
+        self.text = text
+        self.data = data
+
+    def text_image(self):
+        return image(self.text)
+
+    def data_image(self):
+        # the filler is the one token 2048*0, not 2048 lines
+        return memimage.Image.from_words(self.data, DATA_FILLER).raw()
+
+def image(words):
+    return 'v2.0 raw\n' + ''.join('{:08x}\n'.format(w) for w in words)
+
+def default_cache_dir():
+    return os.environ.get('MIPS_ASM_CACHE',
+                          os.path.join(tempfile.gettempdir(), 'mips-asm-cache-{}'.format(os.getuid())))
+
+_own_digest = None
+_memo = {}
+
+def source_key(source):
+    # the assembler's own code is part of the key, so a fixed assembler never serves stale images
+    global _own_digest
+    if _own_digest is None:
+        _own_digest = resultcache.file_digest(os.path.splitext(__file__)[0] + '.py')
+    if not isinstance(source, bytes):
+        source = source.encode('utf-8')
+    return hashlib.sha1(_own_digest.encode('utf-8') + source).hexdigest()
+
+def assemble(source, name='<source>', cache=None):
+    """
+        Assembles source text into a Program.  cache is an optional resultcache.DiskCache.
+    """
+    key = source_key(source)
+    program = _memo.get(key)
+    if program is not None:
+        return program
+    entry = cache.load(key) if cache is not None else None
+    if entry is not None:
+        program = Program(entry['text'], entry['data'])
+    else:
+        asm = Assembler(source, name)
+        program = Program(asm.text(), asm.data_words())
+        if cache is not None:
+            cache.store(key, {'text': program.text, 'data': program.data})
+    _memo[key] = program
+    return program
+
+def assemble_file(asmfile, cache=None):
+    """
+        Writes asmfile.text.hex and asmfile.data.hex, like mars-assem.sh.
+    """
+    with open(asmfile) as f:
+        program = assemble(f.read(), asmfile, cache)
+    with open(asmfile + '.text.hex', 'w') as f:
+        f.write(program.text_image())
+    with open(asmfile + '.data.hex', 'w') as f:
+        f.write(program.data_image())
+    return program
+
+def main():
+    parser = argparse.ArgumentParser(description="Assembles MIPS programs into Logisim v2.0 raw images, like mars-assem.sh.")
+    parser.add_argument('asmfiles', nargs='+', metavar='asmfile')
+    parser.add_argument('--no-cache', action='store_true', help="don't read or write the on-disk cache")
+    args = parser.parse_args()
+
+    cache = None if args.no_cache else resultcache.DiskCache(default_cache_dir())
+    for asmfile in args.asmfiles:
+        try:
+            assemble_file(asmfile, cache)
+        except (AssemblerException, IOError) as e:
+            sys.exit(str(e))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,301 @@
+#!/usr/bin/env python
+"""
+    Runs many CPU programs in one simulation, to pay for starting Logisim and
+    loading cpu.circ once instead of once per program.
+
+        python batch.py --name fuzzbatch prog1.s prog2.s and-test.circ ...
+        python batch.py --check and-test.circ beq-test.circ j-sw-test.circ
+
+    CPU-batch_test.circ is the starter harness with the upper 12 bits of the
+    ROM address taken from a segment register, which counts the fetches of
+    j 0 (0x08000000).  Every program gets a 4096 word segment of the ROM and
+    starts at address 0 of it.  Past its last time step it runs off its end,
+    through zero words (nops), into a reset stub that zeroes every register
+    and every RAM word in the runs of words it or the next program uses, and
+    ends with j 0: the next program starts in the state a fresh harness
+    starts in, even if the CPU under test stored to a word it should not
+    have.  The one -tty table stream is cut back into the rows of every
+    program by Time Step, which is renumbered from 0 for each.
+
+    mipsmodel.py decides whether a program can be batched: it must not have
+    a data image, must not fetch j 0 itself, and must be running straight
+    through the addresses past its end at its last time step (a program that
+    ends in a loop never reaches the stub).  --check simulates the batch with
+    circsim.py and compares every program with mipsmodel.py.
+"""
+
+import argparse
+import io
+import os
+import os.path
+import sys
+
+import assembler
+import decode_out as dec
+import harnessgen
+import memimage
+import mipsmodel
+
+DEFAULT_TEMPLATE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'CPU-batch_test.circ')
+
+# word address bits of a segment; the segment register supplies the other 12 of the ROM's 24
+SEGMENT_BITS = 12
+SEGMENT_WORDS = 1 << SEGMENT_BITS
+SEGMENTS = 1 << (24 - SEGMENT_BITS)
+
+# time steps of one program: the model runs each one to its end when it is added
+MAX_STEPS = 1 << 20
+
+# RAM words a reset stub also clears between two words a program uses, rather than skipping
+SPAN_GAP = 16
+
+NEXT_SEGMENT = 0x08000000  # j 0
+AT = 1
+
+# formats with a Time Step to cut the rows apart by
+FORMATS = ('cpu', 'cpu-lite')
+
+class BatchException(Exception):
+    pass
+
+def clear_register(reg):
+    # add reg, $zero, $zero
+    return (reg << 11) | 0x20
+
+def store_zero(base, offset):
+    # sw $zero, offset(base)
+    return (0x2b << 26) | (base << 21) | (offset & 0xffff)
+
+def lui(reg, imm):
+    return (0x0f << 26) | (reg << 16) | imm
+
+class Segment(object):
+    """
+        One program of a batch: its rows are time steps start..start + halt of the batch, and
+        the stub after it takes len(stub) more.  spans are the (lowest, highest) RAM words of
+        the runs of words the program reads or writes, runs at most SPAN_GAP words apart
+        taken as one.
+    """
+
+    def __init__(self, name, text, halt):
+        self.name = name
+        self.text = list(text)
+        self.halt = halt
+        self.start = None
+        self._run()
+        self.stub = self._stub(self.spans)
+
+    def _run(self):
+        if self.halt > MAX_STEPS:
+            raise BatchException("{} runs for {} time steps, more than a batch takes ({})".format(self.name, self.halt, MAX_STEPS))
+        machine = mipsmodel.Machine(self.text)
+        cycles = mipsmodel.SingleCycle(machine).cycles()
+        top = len(self.text) * 4
+        used = set()
+        last = None
+        for cycle in cycles:
+            if cycle.instruction == NEXT_SEGMENT:
+                raise BatchException("{} fetches j 0 at time step {}, which would end its segment".format(self.name, cycle.step))
+            top = max(top, cycle.fetch_addr + 4)
+            if cycle.retired is not None and cycle.retired.mem_addr is not None:
+                used.add((cycle.retired.mem_addr & mipsmodel.MASK) >> 2)
+            if cycle.step == self.halt:
+                last = cycle
+                break
+        r = last.retired
+        if r.next_pc != r.pc + 4 or r.next_pc < top:
+            raise BatchException("{} is not running off its end at time step {} (fetching 0x{:x}, next 0x{:x})".format(
+                self.name, self.halt, r.pc, r.next_pc))
+        self.stub_addr = r.next_pc
+        self.spans = []
+        for addr in sorted(used):
+            if self.spans and addr - self.spans[-1][1] <= SPAN_GAP:
+                self.spans[-1] = (self.spans[-1][0], addr)
+            else:
+                self.spans.append((addr, addr))
+
+    def _stub(self, spans):
+        """
+            Zeroes every RAM word of the given spans and every register but $zero, then fetches
+            j 0.  The CPU under test runs the stub, so a word or register it wrote by mistake is
+            still cleared if a later program can see it.
+        """
+        # the registers are cleared last, so the stub can use $at for far addresses
+        words = []
+        high = None
+        cleared = set()
+        for span in spans:
+            for addr in range(span[0], span[1] + 1):
+                if addr in cleared:
+                    continue
+                cleared.add(addr)
+                offset = addr * 4
+                if offset < 0x8000:
+                    words.append(store_zero(0, offset))
+                    continue
+                lo = offset & 0xffff
+                if lo & 0x8000:
+                    lo -= 0x10000
+                if (offset - lo) != high:
+                    high = offset - lo
+                    words.append(lui(AT, (high >> 16) & 0xffff))
+                words.append(store_zero(AT, lo))
+        words.extend(clear_register(reg) for reg in range(1, 32))
+        words.append(NEXT_SEGMENT)
+        if self.stub_addr // 4 + len(words) > SEGMENT_WORDS:
+            raise BatchException("{} and its reset stub do not fit in a {} word segment".format(self.name, SEGMENT_WORDS))
+        return words
+
+    def reset_for(self, following):
+        """
+            Makes the stub also clear the RAM words of the program that runs next.
+        """
+        self.stub = self._stub(self.spans + following.spans)
+
+    @property
+    def words(self):
+        # the segment's ROM words: the program, nops up to the stub, the stub
+        return self.text + [0] * (self.stub_addr // 4 - len(self.text)) + self.stub
+
+class Batch(object):
+    """
+        Programs laid out one after another in the segments of a batch harness.
+    """
+
+    def __init__(self, template=None):
+        self.template = template or harnessgen.Template(DEFAULT_TEMPLATE)
+        self.segments = []
+        self.steps = 0
+
+    def add(self, name, text, halt, data=None):
+        """
+            Adds a program that runs for time steps 0..halt; raises BatchException when it cannot be batched.
+        """
+        if data is not None and not memimage.blank(data):
+            raise BatchException("{} has a data image, which a batch cannot load".format(name))
+        if len(self.segments) >= SEGMENTS:
+            raise BatchException("a batch holds at most {} programs".format(SEGMENTS))
+        segment = Segment(name, text, halt)
+        if self.segments:
+            previous = self.segments[-1]
+            previous.reset_for(segment)
+            self.steps = previous.start + previous.halt + 1 + len(previous.stub)
+        segment.start = self.steps
+        self.segments.append(segment)
+        self.steps += halt + 1 + len(segment.stub)
+        return segment
+
+    @property
+    def halt(self):
+        # the last program's stub is never run
+        last = self.segments[-1]
+        return last.start + last.halt
+
+    @property
+    def rows(self):
+        return self.halt + 1
+
+    def rom(self):
+        # a memimage.Image, so the gaps between the segments take no room
+        image = memimage.Image()
+        for i, segment in enumerate(self.segments):
+            image.extend(i * SEGMENT_WORDS, segment.words)
+        return image
+
+    def render(self, directory='.'):
+        # the harness text, with its library paths relative to directory
+        if not self.segments:
+            raise BatchException("the batch is empty")
+        return self.template.render(self.rom(), self.halt, directory)
+
+    def write(self, circfile):
+        text = self.render(os.path.dirname(circfile) or '.')
+        with open(circfile, 'w') as f:
+            f.write(text)
+        return circfile
+
+    def split(self, rows, oformat):
+        """
+            The rows of every segment, in order, with Time Steps counted from its start.
+        """
+        if 'Time Step' not in oformat.headers:
+            raise BatchException("{} rows have no Time Step to split a batch by".format(oformat.typ))
+        column = oformat.headers.index('Time Step')
+        out = [[] for _ in self.segments]
+        i = 0
+        for row in rows:
+            step = row[column]
+            while i < len(self.segments) and step > self.segments[i].start + self.segments[i].halt:
+                i += 1
+            if i == len(self.segments):
+                break
+            segment = self.segments[i]
+            if step >= segment.start:
+                row = list(row)
+                row[column] = step - segment.start
+                out[i].append(row)
+        return out
+
+def read_program(path):
+    """
+        (text, data, halt step) of a .s file, .text.hex image or harness .circ; halt is None
+        unless the harness gives it.
+    """
+    if path.endswith('.circ'):
+        return mipsmodel.read_rom(path), None, mipsmodel.halt_step(path)
+    text, data = harnessgen.read_program(path)
+    return text, data, None
+
+def check(batch, circfile, typ='cpu'):
+    """
+        (segment, passed) for every program, simulating the batch with circsim.py.
+    """
+    import circsim
+    oformat = dec.get_test_format(typ)
+    stream = circsim.open_run(circfile, batch.rows)
+    try:
+        rows = [values for block in dec.decode_stream(io.StringIO(u''.join(stream)), oformat) for values in block.rows()]
+    finally:
+        stream.close()
+    results = []
+    for segment, got in zip(batch.segments, batch.split(rows, oformat)):
+        expected = list(mipsmodel.trace(mipsmodel.simulate(segment.text), typ, segment.halt))
+        results.append((segment, got == expected))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Writes a harness that runs many programs in one simulation.")
+    parser.add_argument('programs', nargs='+', metavar='program', help=".s file, .text.hex image or harness .circ")
+    parser.add_argument('--name', default='batch', help="harness name (default: %(default)s)")
+    parser.add_argument('--outdir', default='.', help="where the harness goes (default: %(default)s)")
+    parser.add_argument('--template', default=DEFAULT_TEMPLATE, help="batch harness to copy (default: %(default)s)")
+    parser.add_argument('--check', action='store_true', help="simulate the batch with circsim.py and compare every program with the model")
+    args = parser.parse_args()
+
+    try:
+        batch = Batch(harnessgen.Template(args.template))
+        for path in args.programs:
+            text, data, halt = read_program(path)
+            try:
+                batch.add(path, text, halt if halt is not None else len(text) + 1, data)
+            except BatchException as e:
+                sys.stderr.write("skipped: {}\n".format(e))
+        circfile = batch.write(os.path.join(args.outdir, args.name + '.circ'))
+    except (BatchException, harnessgen.HarnessException, assembler.AssemblerException,
+            mipsmodel.ModelException, IOError, OSError) as e:
+        sys.exit(str(e))
+    print("{}: {} programs, {} time steps".format(circfile, len(batch.segments), batch.rows))
+    for i, segment in enumerate(batch.segments):
+        print("{:>5} steps {:>7}..{:<7} {}".format(i, segment.start, segment.start + segment.halt, segment.name))
+    if args.check:
+        failed = 0
+        for segment, passed in check(batch, circfile):
+            if not passed:
+                print("FAILED: {}".format(segment.name))
+                failed += 1
+        print("{} of {} programs match the model".format(len(batch.segments) - failed, len(batch.segments)))
+        if failed:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
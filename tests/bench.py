@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+"""
+    Benchmarks the test suites of test.py.
+
+        python bench.py p2sc --repeat 5
+
+    Every test of the suite is run --repeat times, one at a time and without
+    the result cache, and timed from start to finish.  A test's record holds
+    the fastest and the median wall-clock time, the rows read from the
+    simulation (a TestProfile counts them), the cycles simulated and rows/s
+    at the median time.  Cycles come from the last row read, the halt row:
+    its Time Step for the CPU formats that have one; for cpu-end the halt
+    constant of the harness, or the time step mipsmodel.py first prints that
+    row on; otherwise one per row.  The run is appended to a JSON history file;
+    any test whose median is more than --threshold slower than in the last
+    run of the same suite and backend is reported as a regression and the
+    script exits with status 1.
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+import decode_out as dec
+import mipsmodel
+import test
+
+DEFAULT_HISTORY = 'bench-history.json'
+DEFAULT_THRESHOLD = 0.10
+
+def median(values):
+    values = sorted(values)
+    mid = len(values) // 2
+    return values[mid] if len(values) % 2 else (values[mid - 1] + values[mid]) / 2.0
+
+# time steps the model runs looking for the halt row of a harness without a halt constant
+MAX_STEPS = 1 << 20
+
+def cycles(oformat, case, rows, last):
+    """
+        The time steps up to the halt row last, the rows-th row read: its Time Step; for cpu-end,
+        the halt constant of the harness or else the step the model first prints that row on.
+        Every row of the other formats is a cycle.
+    """
+    if last is not None and 'Time Step' in oformat.headers:
+        return last[oformat.headers.index('Time Step')] + 1
+    if last is None or not oformat.typ.startswith('cpu'):
+        return rows
+    halt = mipsmodel.halt_step(case.circfile)
+    if halt is not None:
+        return halt + 1
+    data = mipsmodel.read_image(case.load) if case.load else None
+    prev = None
+    printed = 0
+    for cycle in mipsmodel.simulate(mipsmodel.read_rom(case.circfile), data):
+        values = mipsmodel.row(cycle, oformat.typ)
+        if values != prev:
+            printed += 1
+            if printed == rows:
+                return cycle.step + 1 if values == last else rows
+        prev = values
+        if cycle.step >= MAX_STEPS:
+            break
+    return rows
+
+def bench_test(description, case, typ, repeat):
+    """
+        The record of one test: times in seconds, and whether every run passed.
+    """
+    times = []
+    passed = True
+    for _ in range(repeat):
+        profile = test.TestProfile()
+        start = time.time()
+        _, test_passed, reason, output, _ = test._run_captured((description, case, typ), profile)
+        times.append(time.time() - start)
+        passed = passed and test_passed
+    # what the last run read from the simulation, the skipped rows included
+    rows = case.skip + profile.rows
+    mid = median(times)
+    return {
+        'passed': passed,
+        'min': min(times),
+        'median': mid,
+        'rows': rows,
+        'cycles': cycles(dec.get_test_format(typ), case, rows, profile.last_row),
+        'rows_per_sec': rows / mid if mid else None,
+    }
+
+def bench_suite(suite, repeat):
+    records = {}
+    for description, case, typ in test.test_suites[suite]:
+        records[description] = bench_test(description, case, typ, repeat)
+    return records
+
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return json.load(f)
+
+def save_history(path, history):
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(history, f, indent=1, sort_keys=True)
+    os.rename(tmp, path)
+
+def baseline(history, suite, backend):
+    for run in reversed(history):
+        if run['suite'] == suite and run['backend'] == backend:
+            return run
+    return None
+
+def regressions(run, base, threshold):
+    """
+        (description, old median, new median) for the tests more than threshold slower than in base.
+    """
+    slower = []
+    for description, record in sorted(run['tests'].items()):
+        old = base['tests'].get(description)
+        if old and record['median'] > old['median'] * (1 + threshold):
+            slower.append((description, old['median'], record['median']))
+    return slower
+
+def report(run, base):
+    print("{:<40} {:>9} {:>9} {:>6} {:>7} {:>10} {:>8}".format('test', 'min s', 'median s', 'rows', 'cycles', 'rows/s', 'change'))
+    for description, record in sorted(run['tests'].items()):
+        old = base['tests'].get(description) if base else None
+        change = '{:+.1%}'.format(record['median'] / old['median'] - 1) if old and old['median'] else ''
+        print("{:<40} {:>9.4f} {:>9.4f} {:>6} {:>7} {:>10.1f} {:>8}{}".format(
+            description[:40], record['min'], record['median'], record['rows'], record['cycles'],
+            record['rows_per_sec'] or 0, change, '' if record['passed'] else '  (FAILED)'))
+
+def main():
+    parser = argparse.ArgumentParser(description="Times the tests of a suite and keeps a history of the timings.")
+    parser.add_argument('suite', choices=sorted(test.test_suites))
+    parser.add_argument('--repeat', type=int, default=5, help="runs of every test (default: %(default)s)")
+    parser.add_argument('--history', default=DEFAULT_HISTORY, help="JSON file the runs are appended to (default: %(default)s)")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="slowdown of the median, as a fraction, reported as a regression (default: %(default)s)")
+    parser.add_argument('--backend', choices=['auto', 'logisim', 'native'], default=os.environ.get('LOGISIM_BACKEND', 'auto'))
+    parser.add_argument('--no-save', action='store_true', help="compare with the history but do not add this run to it")
+    args = parser.parse_args()
+    if args.repeat < 1:
+        sys.exit("--repeat must be at least 1")
+    os.environ['LOGISIM_BACKEND'] = args.backend
+
+    try:
+        history = load_history(args.history)
+    except (IOError, ValueError) as e:
+        sys.exit("cannot read {}: {}".format(args.history, e))
+    backend = test.simulation_backend()
+    base = baseline(history, args.suite, backend)
+    run = {
+        'suite': args.suite,
+        'backend': backend,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'host': platform.node(),
+        'python': platform.python_version(),
+        'repeat': args.repeat,
+        'tests': bench_suite(args.suite, args.repeat),
+    }
+    report(run, base)
+    if not args.no_save:
+        history.append(run)
+        save_history(args.history, history)
+
+    slower = regressions(run, base, args.threshold) if base else []
+    for description, old, new in slower:
+        print("REGRESSION: {} took {:.4f}s, was {:.4f}s (run of {})".format(description, new, old, base['time']))
+    if slower:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
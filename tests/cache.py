@@ -0,0 +1,283 @@
+#!/usr/bin/env python
+"""
+    Instruction and data cache model for a program run.
+
+        python cache.py --icache 1024:16:2 --dcache 4096:32:4:fifo --miss-penalty 20 kernel.s
+        python cache.py --sweep --sizes 256,1024,4096 --lines 8,32 --ways 1,2,4 kernel.s
+
+    The program (a .s file, a .text.hex image or a harness .circ) runs on
+    mipsmodel.py and every instruction fetch and lw/sw address goes through a
+    split pair of caches in front of the flat memory of mem.circ.  A cache is
+    size:line:ways[:policy] in bytes, with lru (the default) or fifo
+    replacement; stores allocate like loads.  Every miss stalls the
+    single-cycle datapath for --miss-penalty cycles, which gives the estimated
+    CPI next to the hit rates.
+
+    --sweep evaluates every combination of --sizes, --lines, --ways and
+    --policies for both streams in one pass over the address trace: the LRU
+    configurations sharing a line size and number of sets are all answered by
+    one LRU stack per set (a hit in a w-way cache is a reuse at stack depth
+    below w), and the FIFO ones are simulated side by side.
+"""
+
+import argparse
+import array
+import json
+import sys
+
+import harnessgen
+import mipsmodel
+
+POLICIES = ('lru', 'fifo')
+
+# instructions a run is cut off at when neither --steps nor the harness halt step say otherwise
+MAX_STEPS = 1 << 20
+
+class CacheException(Exception):
+    pass
+
+def _power_of_two(n):
+    return n > 0 and not n & (n - 1)
+
+class Config(object):
+    """
+        size and line in bytes; sets follows from them and ways.
+    """
+
+    def __init__(self, size, line, ways, policy='lru'):
+        if not (_power_of_two(size) and _power_of_two(line) and ways > 0):
+            raise CacheException("cache size and line size must be powers of two, ways positive")
+        if line < 4 or size < line * ways or size % (line * ways):
+            raise CacheException("a {} byte cache cannot hold {} ways of {} byte lines".format(size, ways, line))
+        if policy not in POLICIES:
+            raise CacheException("unknown replacement policy {}".format(policy))
+        self.size = size
+        self.line = line
+        self.ways = ways
+        self.policy = policy
+        self.sets = size // (line * ways)
+
+    @classmethod
+    def parse(cls, text):
+        parts = text.split(':')
+        if len(parts) not in (3, 4):
+            raise CacheException("a cache is size:line:ways[:policy], not {}".format(text))
+        try:
+            size, line, ways = [int(p, 0) for p in parts[:3]]
+        except ValueError:
+            raise CacheException("a cache is size:line:ways[:policy], not {}".format(text))
+        return cls(size, line, ways, *parts[3:])
+
+    def __str__(self):
+        return '{}:{}:{}:{}'.format(self.size, self.line, self.ways, self.policy)
+
+class Cache(object):
+    """
+        One set associative cache; access() returns whether the address hit.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.blocks = [[] for _ in range(config.sets)]
+        self.shift = config.line.bit_length() - 1
+        self.hits = 0
+        self.misses = 0
+
+    def access(self, addr):
+        block = addr >> self.shift
+        lines = self.blocks[block % self.config.sets]
+        if block in lines:
+            self.hits += 1
+            if self.config.policy == 'lru':
+                lines.remove(block)
+                lines.append(block)
+            return True
+        self.misses += 1
+        if len(lines) >= self.config.ways:
+            # the oldest line: least recently used, or first in
+            del lines[0]
+        lines.append(block)
+        return False
+
+class StackDistances(object):
+    """
+        LRU stacks for every set of a (line, sets) geometry: counts[d] is the number of accesses
+        that found their line at depth d, so a w-way LRU cache hits sum(counts[:w]) times.
+    """
+
+    def __init__(self, line, sets, depth):
+        self.shift = line.bit_length() - 1
+        self.sets = sets
+        self.depth = depth
+        self.stacks = [[] for _ in range(sets)]
+        self.counts = [0] * depth
+        self.accesses = 0
+
+    def access(self, addr):
+        block = addr >> self.shift
+        stack = self.stacks[block % self.sets]
+        self.accesses += 1
+        try:
+            d = stack.index(block)
+        except ValueError:
+            if len(stack) >= self.depth:
+                stack.pop()
+        else:
+            self.counts[d] += 1
+            del stack[d]
+        stack.insert(0, block)
+
+    def hits(self, ways):
+        return sum(self.counts[:ways])
+
+class Result(object):
+    def __init__(self, stream, config, hits, misses):
+        self.stream = stream
+        self.config = config
+        self.hits = hits
+        self.misses = misses
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return float(self.hits) / total if total else None
+
+    def as_dict(self, penalty):
+        return {'stream': self.stream, 'cache': str(self.config), 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hit_rate, 'stall_cycles': self.misses * penalty}
+
+class AddressTrace(object):
+    """
+        Byte addresses of the instruction fetches and of the lw/sw accesses of a run, in order.  The
+        run ends after a jump to itself, when it leaves the program, or after steps instructions.
+    """
+
+    def __init__(self, text, data=None, steps=MAX_STEPS):
+        self.fetches = array.array('I')
+        self.data = array.array('I')
+        self.stores = 0
+        end = len(text) * 4
+        for cycle in mipsmodel.simulate(text, data):
+            r = cycle.retired
+            if (steps is not None and cycle.step >= steps) or r.pc >= end:
+                break
+            self.fetches.append(r.pc)
+            if r.mem_addr is not None:
+                self.data.append(r.mem_addr & mipsmodel.MASK)
+                self.stores += r.mem_write
+            if r.taken and r.next_pc == r.pc:
+                break
+
+    @property
+    def instructions(self):
+        return len(self.fetches)
+
+    def streams(self):
+        return (('instruction', self.fetches), ('data', self.data))
+
+def simulate(trace, icache, dcache):
+    """
+        [instruction Result, data Result] for one cache per stream.
+    """
+    results = []
+    for (stream, addrs), config in zip(trace.streams(), (icache, dcache)):
+        cache = Cache(config)
+        access = cache.access
+        for addr in addrs:
+            access(addr)
+        results.append(Result(stream, config, cache.hits, cache.misses))
+    return results
+
+def sweep(trace, configs):
+    """
+        A Result for every stream and config, each stream read once.
+    """
+    results = []
+    for stream, addrs in trace.streams():
+        groups = {}
+        for c in configs:
+            if c.policy == 'lru':
+                key = (c.line, c.sets)
+                groups[key] = max(groups.get(key, 0), c.ways)
+        stacks = dict((key, StackDistances(key[0], key[1], depth)) for key, depth in groups.items())
+        fifos = [(c, Cache(c)) for c in configs if c.policy == 'fifo']
+        accesses = [s.access for s in stacks.values()] + [cache.access for c, cache in fifos]
+        for addr in addrs:
+            for access in accesses:
+                access(addr)
+        for c in configs:
+            if c.policy == 'lru':
+                hits = stacks[(c.line, c.sets)].hits(c.ways)
+                results.append(Result(stream, c, hits, len(addrs) - hits))
+        results.extend(Result(stream, c, cache.hits, cache.misses) for c, cache in fifos)
+    return results
+
+def cpi(trace, results, penalty):
+    # single-cycle datapath: one cycle per instruction plus the miss stalls
+    if not trace.instructions:
+        return None
+    return float(trace.instructions + sum(r.misses for r in results) * penalty) / trace.instructions
+
+def _ints(text):
+    return [int(v, 0) for v in text.split(',')]
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs a program through instruction and data cache models.")
+    parser.add_argument('program', help=".s file, .text.hex image or harness .circ")
+    parser.add_argument('--data', help="data image for the model")
+    parser.add_argument('--steps', type=int, help="instructions to run at most (default: the harness halt step, or until the program jumps to itself or runs off its end, at most %d)" % MAX_STEPS)
+    parser.add_argument('--icache', default='1024:16:1', help="instruction cache size:line:ways[:policy] (default: %(default)s)")
+    parser.add_argument('--dcache', default='1024:16:1', help="data cache size:line:ways[:policy] (default: %(default)s)")
+    parser.add_argument('--miss-penalty', type=int, default=10, help="stall cycles per miss (default: %(default)s)")
+    parser.add_argument('--sweep', action='store_true', help="evaluate every combination of the lists below instead")
+    parser.add_argument('--sizes', type=_ints, default=[256, 1024, 4096, 16384])
+    parser.add_argument('--lines', type=_ints, default=[4, 16, 64])
+    parser.add_argument('--ways', type=_ints, default=[1, 2, 4, 8])
+    parser.add_argument('--policies', type=lambda s: s.split(','), default=list(POLICIES))
+    parser.add_argument('--json', action='store_true', help="print the results as JSON")
+    args = parser.parse_args()
+
+    try:
+        if args.program.endswith('.circ'):
+            text, data = mipsmodel.read_rom(args.program), None
+            if args.steps is None:
+                args.steps = mipsmodel.halt_step(args.program)
+        else:
+            text, data = harnessgen.read_program(args.program)
+        if args.data:
+            data = mipsmodel.read_image(args.data)
+        trace = AddressTrace(text, data, args.steps if args.steps is not None else MAX_STEPS)
+        if args.sweep:
+            configs = []
+            for size in args.sizes:
+                for line in args.lines:
+                    for ways in args.ways:
+                        for policy in args.policies:
+                            if size >= line * ways:
+                                configs.append(Config(size, line, ways, policy))
+            results = sweep(trace, configs)
+        else:
+            results = simulate(trace, Config.parse(args.icache), Config.parse(args.dcache))
+    except (CacheException, mipsmodel.ModelException, IOError) as e:
+        sys.exit(str(e))
+
+    penalty = args.miss_penalty
+    if args.json:
+        out = {'instructions': trace.instructions, 'loads': len(trace.data) - trace.stores, 'stores': trace.stores,
+               'miss_penalty': penalty, 'results': [r.as_dict(penalty) for r in results]}
+        if not args.sweep:
+            out['cpi'] = cpi(trace, results, penalty)
+        json.dump(out, sys.stdout, indent=1, sort_keys=True)
+        sys.stdout.write('\n')
+        return
+    print("{} instructions, {} loads, {} stores".format(trace.instructions, len(trace.data) - trace.stores, trace.stores))
+    print("{:<12} {:<20} {:>9} {:>9} {:>9} {:>8}".format('stream', 'cache', 'hits', 'misses', 'hit rate', 'stalls'))
+    for r in sorted(results, key=lambda r: (r.stream, r.config.size, r.config.line, r.config.ways, r.config.policy)):
+        rate = '-' if r.hit_rate is None else '{:.2%}'.format(r.hit_rate)
+        print("{:<12} {:<20} {:>9} {:>9} {:>9} {:>8}".format(r.stream, str(r.config), r.hits, r.misses, rate, r.misses * penalty))
+    if not args.sweep:
+        estimate = cpi(trace, results, penalty)
+        print("estimated CPI {}".format('-' if estimate is None else '{:.3f}'.format(estimate)))
+
+if __name__ == '__main__':
+    main()
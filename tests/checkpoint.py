@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+"""
+    Checkpoints of a program run, for tests that only care about a window deep
+    into the program.
+
+        python checkpoint.py --at 100000 --window 40 ../loop-long.s
+        python checkpoint.py --at 100000 --window 40 --python ../loop-long.s
+
+    mipsmodel.py runs the program (a .s file, .text.hex image or harness
+    .circ) on the single-cycle timing for --at cycles and takes a snapshot of
+    the PC, the register file and the RAM.  The snapshot goes into a new
+    harness, <name>.circ: the RAM as a <name>.load.hex image, the registers
+    through a preload stub appended to the program in the ROM.  The word at
+    address 0 becomes a jump to the stub, which sets every nonzero register
+    with lui/addi (the CPU's ori sign-extends its immediate) and jumps to the
+    checkpoint PC.  The harness halts --window steps after the stub is done.
+
+    The stub's rows come first; the script prints how many, which is the skip
+    of the TestCase, and with --python the expected rows of the window (Time
+    Steps counted from the start of the harness, as the simulation prints
+    them).  A window that fetches address 0 again cannot be checkpointed.
+"""
+
+import argparse
+import os
+import os.path
+import sys
+
+import assembler
+import harnessgen
+import memimage
+import mipsmodel
+
+FORMATS = ('cpu', 'cpu-lite')
+
+class CheckpointException(Exception):
+    pass
+
+def lui(rt, imm):
+    return (0x0f << 26) | (rt << 16) | imm
+
+def addi(rt, rs, imm):
+    return (0x08 << 26) | (rs << 21) | (rt << 16) | (imm & 0xffff)
+
+def jump(addr):
+    return (0x02 << 26) | ((addr >> 2) & 0x3ffffff)
+
+def load_register(reg, value):
+    """
+        The words setting reg to value: lui of the upper half, adjusted for the sign of the
+        lower half that addi adds.
+    """
+    lo = value & 0xffff
+    if lo & 0x8000:
+        lo -= 0x10000
+    hi = ((value - lo) >> 16) & 0xffff
+    words = []
+    if hi:
+        words.append(lui(reg, hi))
+    if lo or not hi:
+        words.append(addi(reg, reg if hi else 0, lo))
+    return words
+
+class Snapshot(object):
+    """
+        Architectural state at the start of a cycle: PC, registers and RAM (a mipsmodel.Memory).
+    """
+
+    def __init__(self, cycle, pc, regs, ram):
+        self.cycle = cycle
+        self.pc = pc
+        self.regs = regs
+        self.ram = ram
+
+    def ram_image(self):
+        # the nonzero RAM words as a memimage.Image
+        image = memimage.Image()
+        for addr, value in self.ram.used():
+            image.extend(addr, [value])
+        return image
+
+    def stub(self):
+        words = []
+        for reg in range(1, 32):
+            if self.regs[reg]:
+                words.extend(load_register(reg, self.regs[reg]))
+        words.append(jump(self.pc))
+        return words
+
+def take(text, data, cycle):
+    """
+        The Snapshot after cycle cycles of the program on the single-cycle datapath.
+    """
+    machine = mipsmodel.Machine(text, data)
+    cycles = mipsmodel.SingleCycle(machine).cycles()
+    for _ in range(cycle):
+        next(cycles)
+    return Snapshot(cycle, machine.pc, machine.regs[:], machine.ram)
+
+def restore(text, snapshot):
+    """
+        (ROM words, rows the stub takes) of a program that starts from snapshot.
+    """
+    if snapshot.pc == 0:
+        raise CheckpointException("cycle {} fetches address 0, which the jump to the preload stub replaces".format(snapshot.cycle))
+    base = len(text) * 4
+    rom = [jump(base)] + list(text[1:]) + snapshot.stub()
+    return rom, 1 + len(rom) - len(text)
+
+def window_rows(text, data, snapshot, window, typ, skip):
+    """
+        Expected rows of the window: the run from snapshot.cycle on, with Time Steps counted
+        from the start of the checkpoint harness.
+    """
+    offset = skip - snapshot.cycle
+    def shifted(cycles):
+        for c in cycles:
+            if c.step >= snapshot.cycle:
+                if c.fetch_addr == 0:
+                    raise CheckpointException("the window fetches address 0 at cycle {}, which the jump to the preload stub replaces".format(c.step))
+                yield mipsmodel.Cycle(c.step + offset, c.regs, c.fetch_addr, c.instruction, c.retired)
+    return list(mipsmodel.trace(shifted(mipsmodel.simulate(text, data)), typ, skip + window))
+
+def checkpoint(template, name, text, data, cycle, window, typ='cpu', outdir='.'):
+    """
+        Writes the checkpoint harness (and its RAM image); returns (circuit path, RAM image path or None,
+        rows to skip, expected rows of the window).
+    """
+    snapshot = take(text, data, cycle)
+    rom, skip = restore(text, snapshot)
+    rows = window_rows(text, data, snapshot, window, typ, skip)
+    circfile, image = harnessgen.generate(template, name, rom, snapshot.ram_image(), skip + window, outdir)
+    return circfile, image, skip, rows
+
+def read_program(path):
+    if path.endswith('.circ'):
+        return mipsmodel.read_rom(path), None
+    return harnessgen.read_program(path)
+
+def main():
+    parser = argparse.ArgumentParser(description="Writes a harness that starts a program from a snapshot of a model run.")
+    parser.add_argument('program', help=".s file, .text.hex image or harness .circ")
+    parser.add_argument('--at', type=int, required=True, help="cycle to take the snapshot at")
+    parser.add_argument('--window', type=int, required=True, help="time steps to simulate from the snapshot")
+    parser.add_argument('--name', help="harness name (default: the program's, plus -checkpoint)")
+    parser.add_argument('--outdir', default='.', help="where the harness goes (default: %(default)s)")
+    parser.add_argument('--template', default=harnessgen.DEFAULT_TEMPLATE, help="harness to copy (default: %(default)s)")
+    parser.add_argument('--format', default='cpu', choices=FORMATS)
+    parser.add_argument('--python', action='store_true', help="print the expected rows of the window as a Python list for test.py")
+    args = parser.parse_args()
+    if args.at < 0 or args.window < 1:
+        sys.exit("--at must not be negative and --window must be positive")
+
+    name = args.name
+    if name is None:
+        name = os.path.basename(args.program)
+        for ext in ('.text.hex', '.s', '.asm', '.circ'):
+            if name.endswith(ext):
+                name = name[:-len(ext)]
+                break
+        name += '-checkpoint'
+    try:
+        text, data = read_program(args.program)
+        template = harnessgen.Template(args.template)
+        circfile, image, skip, rows = checkpoint(template, name, text, data, args.at, args.window, args.format, args.outdir)
+    except (CheckpointException, harnessgen.HarnessException, assembler.AssemblerException,
+            mipsmodel.ModelException, IOError, OSError) as e:
+        sys.exit(str(e))
+    print("{}{}: skip {} rows (the preload stub), then cycles {}..{}".format(
+        circfile, ' ' + image if image else '', skip, args.at, args.at + args.window))
+    if args.python:
+        print('[' + ',\n '.join('[' + ', '.join('0x{:x}'.format(v) for v in row) + ']' for row in rows) + ']')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,1239 @@
+#!/usr/bin/env python
+"""
+    Native Python simulator for Logisim .circ files.
+
+    Loads a circuit (and every .circ library it uses), flattens the subcircuit
+    hierarchy into a single netlist, resolves wires, tunnels and splitters down
+    to individual bits and compiles the result into one generated Python
+    function that settles the whole circuit in topological order.  Clocked
+    parts (registers, counters, RAM, the register file) sample their inputs on
+    the rising clock edge, and the run loop reproduces `logisim -tty table`:
+
+        python circsim.py cpu-test.circ
+        python circsim.py --load data.img --rows 20 mem-test.circ
+
+    A wire driven by several components is an error value in Logisim while
+    the drivers disagree.  Such a settle is repeated with the disputed bits
+    read the other way: output bits that come out different print as E, as
+    Logisim prints them, and a clock edge that would store a different value
+    stops the run with a ConflictException.  A conflict that changes neither
+    is only named on standard error by the command line.
+
+    A run ends when the halt pin goes high.  A circuit without one, or one
+    that never gets there, stops with a CycleLimitException after max_cycles
+    clock cycles (--max-cycles, MAX_CYCLES on the command line): its outputs
+    may have stopped changing, so --rows alone does not bound the run.
+
+    Only the components this project's circuits use are supported; anything
+    else raises a CircuitException naming the component.
+"""
+
+import argparse
+import copy
+import os
+import os.path
+import sys
+import xml.etree.ElementTree as ET
+
+import decode_out as dec
+import memimage
+
+class CircuitException(Exception):
+    pass
+
+class ConflictException(CircuitException):
+    pass
+
+class CycleLimitException(CircuitException):
+    pass
+
+# clock cycles the command line runs a circuit for at most, since a stuck circuit may never change its outputs again
+MAX_CYCLES = 1 << 16
+
+def _mask(width):
+    return (1 << width) - 1
+
+def _hex(value):
+    return '{:#x}'.format(value)
+
+def _int(text, default=0):
+    if text is None:
+        return default
+    return int(text, 0)
+
+def _loc(text):
+    x, y = text.strip('()').split(',')
+    return (int(x), int(y))
+
+def _attrs(elem):
+    attrs = {}
+    for a in elem.findall('a'):
+        attrs[a.get('name')] = a.get('val') if a.get('val') is not None else (a.text or '')
+    return attrs
+
+def read_contents(text):
+    """
+        Parses the contents attribute of a ROM/RAM ("addr/data: A D" and hex words).
+    """
+    lines = text.strip().split('\n', 1)
+    if not lines[0].startswith('addr/data:'):
+        raise CircuitException("bad memory contents header: {}".format(lines[0]))
+    try:
+        return list(memimage.Image.parse(lines[1])) if len(lines) > 1 else []
+    except memimage.ImageException as e:
+        raise CircuitException(str(e))
+
+def read_image(path):
+    """
+        Reads a Logisim "v2.0 raw" memory image, as given to -load, into a memimage.Image.
+    """
+    try:
+        return memimage.read(path)
+    except memimage.ImageException as e:
+        raise CircuitException(str(e))
+
+# --- circuit files -----------------------------------------------------------
+
+class Component(object):
+    def __init__(self, elem):
+        self.lib = elem.get('lib')
+        self.name = elem.get('name')
+        self.loc = _loc(elem.get('loc'))
+        self.attrs = _attrs(elem)
+
+    def get(self, name, default=None):
+        return self.attrs.get(name, default)
+
+class Circuit(object):
+    def __init__(self, elem, project):
+        self.name = elem.get('name')
+        self.project = project
+        self.comps = [Component(c) for c in elem.findall('comp')]
+        self.wires = [(_loc(w.get('from')), _loc(w.get('to'))) for w in elem.findall('wire')]
+        self.appear = elem.find('appear')
+        self._offsets = None
+
+    def pins(self):
+        return [c for c in self.comps if c.lib == '0' and c.name == 'Pin']
+
+    def port_offsets(self):
+        """
+            Maps the location of each Pin to its port's offset from the subcircuit's anchor.
+        """
+        if self._offsets is None:
+            if self.appear is not None:
+                self._offsets = self._custom_offsets()
+            else:
+                self._offsets = self._default_offsets()
+        return self._offsets
+
+    def _custom_offsets(self):
+        anchor = self.appear.find('circ-anchor')
+        if anchor.get('facing', 'east') != 'east':
+            raise CircuitException("{}: only east facing anchors are supported".format(self.name))
+        def center(e):
+            return (int(e.get('x')) + int(e.get('width')) // 2, int(e.get('y')) + int(e.get('height')) // 2)
+        ax, ay = center(anchor)
+        offsets = {}
+        for port in self.appear.findall('circ-port'):
+            px, py = center(port)
+            offsets[_loc(port.get('pin'))] = (px - ax, py - ay)
+        return offsets
+
+    def _default_offsets(self):
+        # Logisim's DefaultAppearance: pins go on the edge opposite the way they face,
+        # sorted along it, with the anchor on the first east (else north, west, south) port
+        edges = {'north': [], 'south': [], 'east': [], 'west': []}
+        opposite = {'north': 'south', 'south': 'north', 'east': 'west', 'west': 'east'}
+        for pin in self.pins():
+            edges[opposite[pin.get('facing', 'east')]].append(pin.loc)
+        for side, locs in edges.items():
+            if side in ('north', 'south'):
+                locs.sort()
+            else:
+                locs.sort(key=lambda l: (l[1], l[0]))
+        n, s, e, w = [len(edges[side]) for side in ('north', 'south', 'east', 'west')]
+        max_vert, max_horz = max(n, s), max(e, w)
+
+        def offset(facing, opposite, others):
+            most = max(facing, opposite)
+            if most <= 1:
+                base = 15 if others == 0 else 10
+            elif most == 2:
+                base = 10
+            else:
+                base = 5 if others == 0 else 10
+            return base + 10 * ((most - facing) // 2)
+
+        def dimension(this, others):
+            if this < 3:
+                return 30
+            return 10 * this if others == 0 else 10 * this + 10
+
+        offs_n, offs_s = offset(n, s, max_horz), offset(s, n, max_horz)
+        offs_e, offs_w = offset(e, w, max_vert), offset(w, e, max_vert)
+        width, height = dimension(max_vert, max_horz), dimension(max_horz, max_vert)
+        if e:
+            ax, ay = width, offs_e
+        elif n:
+            ax, ay = offs_n, 0
+        elif w:
+            ax, ay = 0, offs_w
+        elif s:
+            ax, ay = offs_s, height
+        else:
+            ax, ay = 0, 0
+
+        offsets = {}
+        for side, x, y, dx, dy in (('west', 0, offs_w, 0, 10), ('east', width, offs_e, 0, 10),
+                                   ('north', offs_n, 0, 10, 0), ('south', offs_s, height, 10, 0)):
+            for i, loc in enumerate(edges[side]):
+                offsets[loc] = (x + i * dx - ax, y + i * dy - ay)
+        return offsets
+
+class Project(object):
+    """
+        One parsed .circ file.
+    """
+
+    def __init__(self, path, loader):
+        self.path = os.path.abspath(path)
+        root = ET.parse(self.path).getroot()
+        self.libs = dict((lib.get('name'), lib.get('desc')) for lib in root.findall('lib'))
+        main = root.find('main')
+        self.circuits = dict((c.get('name'), Circuit(c, self)) for c in root.findall('circuit'))
+        self.main = main.get('name') if main is not None else None
+        self.loader = loader
+
+    def resolve(self, comp):
+        """
+            Returns ('circuit', Circuit), ('jar', component name) or ('builtin', component name).
+        """
+        if comp.lib is None:
+            return ('circuit', self.circuits[comp.name])
+        desc = self.libs.get(comp.lib)
+        if desc is None:
+            raise CircuitException("{}: unknown library {}".format(self.path, comp.lib))
+        if desc.startswith('file#'):
+            lib = self.loader.load(self._library_path(desc[len('file#'):]))
+            return ('circuit', lib.circuits[comp.name])
+        if desc.startswith('jar#'):
+            return ('jar', comp.name)
+        return ('builtin', comp.name)
+
+    def _library_path(self, name):
+        here = os.path.dirname(self.path)
+        path = os.path.join(here, name)
+        if not os.path.exists(path):
+            # libraries saved with an absolute path from someone else's machine
+            path = os.path.join(here, os.path.basename(name))
+        return os.path.abspath(path)
+
+class Loader(object):
+    def __init__(self):
+        self.projects = {}
+
+    def load(self, path):
+        path = os.path.abspath(path)
+        if path not in self.projects:
+            self.projects[path] = Project(path, self)
+        return self.projects[path]
+
+# --- component geometry ------------------------------------------------------
+
+class Port(object):
+    __slots__ = ('name', 'dx', 'dy', 'width', 'output')
+
+    def __init__(self, name, dx, dy, width, output=False):
+        self.name = name
+        self.dx = dx
+        self.dy = dy
+        self.width = width
+        self.output = output
+
+GATES = {'AND Gate': '&', 'OR Gate': '|', 'XOR Gate': '^',
+         'NAND Gate': '&', 'NOR Gate': '|', 'XNOR Gate': '^'}
+
+def _gate_ports(comp):
+    # AbstractGate.getInputOffset
+    inputs = _int(comp.get('inputs'), 5)
+    size = _int(comp.get('size'), 50)
+    width = _int(comp.get('width'), 1)
+    facing = comp.get('facing', 'east')
+    length = size + (10 if comp.name in ('XOR Gate', 'XNOR Gate') else 0)
+    if comp.name in ('NAND Gate', 'NOR Gate', 'XNOR Gate'):
+        length += 10
+    if inputs <= 3:
+        if size < 40:
+            start, dist, lower = -5, 10, 10
+        elif size < 60 or inputs <= 2:
+            start, dist, lower = -10, 20, 20
+        else:
+            start, dist, lower = -15, 30, 30
+    elif inputs == 4 and size >= 60:
+        start, dist, lower = -5, 20, 0
+    else:
+        start, dist, lower = -5, 10, 10
+    ports = [Port('out', 0, 0, width, True)]
+    for i in range(inputs):
+        if inputs % 2:
+            dy = start * (inputs - 1) + dist * i
+        else:
+            dy = start * inputs + dist * i
+            if i >= inputs // 2:
+                dy += lower
+        dx = length
+        if facing == 'north':
+            x, y = dy, dx
+        elif facing == 'south':
+            x, y = dy, -dx
+        elif facing == 'west':
+            x, y = dx, dy
+        else:
+            x, y = -dx, dy
+        ports.append(Port('in{}'.format(i), x, y, width))
+    return ports
+
+def _rotate(ports, facing):
+    # offsets are given facing east; turn them the way the component faces
+    for p in ports:
+        if facing == 'north':
+            p.dx, p.dy = p.dy, -p.dx
+        elif facing == 'south':
+            p.dx, p.dy = -p.dy, p.dx
+        elif facing == 'west':
+            p.dx, p.dy = -p.dx, -p.dy
+    return ports
+
+def _mux_ports(comp):
+    if _int(comp.get('select'), 1) != 1:
+        raise CircuitException("only 2-input multiplexers are supported")
+    width = _int(comp.get('width'), 1)
+    facing = comp.get('facing', 'east')
+    if facing == 'west':
+        ends, sel, en = [(30, -10), (30, 10)], (20, 20), (10, 20)
+    elif facing == 'north':
+        ends, sel, en = [(-10, 30), (10, 30)], (-20, 20), (-20, 10)
+    elif facing == 'south':
+        ends, sel, en = [(-10, -30), (10, -30)], (-20, -20), (-20, -10)
+    else:
+        ends, sel, en = [(-30, -10), (-30, 10)], (-20, 20), (-10, 20)
+    return [Port('out', 0, 0, width, True),
+            Port('in0', ends[0][0], ends[0][1], width),
+            Port('in1', ends[1][0], ends[1][1], width),
+            Port('sel', sel[0], sel[1], 1),
+            Port('en', en[0], en[1], 1)]
+
+def splitter_layout(comp):
+    """
+        Returns (end offsets, bit -> end index or None) for a Splitter, following SplitterParameters.
+    """
+    fanout = _int(comp.get('fanout'), 2)
+    incoming = _int(comp.get('incoming'), 2)
+    facing = comp.get('facing', 'east')
+    appear = comp.get('appear', 'left')
+    justify = {'center': 0, 'legacy': 0, 'right': 1}.get(appear, -1)
+    if facing in ('north', 'south'):
+        m = 1 if facing == 'north' else -1
+        if justify == 0:
+            x0 = 10 * ((fanout + 1) // 2 - 1)
+        else:
+            x0 = -10 if m * justify < 0 else 10 * fanout
+        ends = [(x0 - 10 * i, -m * 20) for i in range(fanout)]
+    else:
+        m = -1 if facing == 'west' else 1
+        if justify == 0:
+            y0 = -10 * (fanout // 2)
+        else:
+            y0 = 10 if m * justify > 0 else -10 * fanout
+        ends = [(m * 20, y0 + 10 * i) for i in range(fanout)]
+
+    # SplitterAttributes.computeDistribution, then the saved overrides.  The file leaves out
+    # bit attributes equal to the factory default (two ends of one bit each), and loading keeps
+    # those two bits when the fanout and width grow, so only the rest get the even distribution
+    bits = []
+    if fanout >= incoming:
+        bits = list(range(incoming))
+    else:
+        per_end, extra = divmod(incoming, fanout)
+        for end in range(fanout):
+            bits.extend([end] * (per_end + (1 if end < extra else 0)))
+    for i in range(min(2, incoming, fanout)):
+        bits[i] = i
+    for i in range(incoming):
+        val = comp.get('bit{}'.format(i))
+        if val is not None:
+            bits[i] = None if val == 'none' else int(val)
+    return ends, bits
+
+def component_ports(kind, comp):
+    """
+        Port list (offsets relative to comp.loc) of a builtin or jar component.
+    """
+    a = comp.get
+    w = _int(a('width'), 8)
+    if kind == 'jar':
+        if comp.name == 'ALU':
+            return [Port('X', -60, -20, 32), Port('Y', -60, 20, 32), Port('Switch', -30, 30, 4),
+                    Port('OF', 0, -20, 1, True), Port('Result', 0, 20, 32, True), Port('Equal', 0, 0, 1, True)]
+        if comp.name == 'RegisterFile':
+            return [Port('W', -160, -10, 32), Port('A', 0, -50, 32, True), Port('B', 0, 50, 32, True),
+                    Port('WE', -120, 90, 1), Port('clk', -160, 80, 1),
+                    Port('rW', -90, 90, 5), Port('rA', -50, 90, 5), Port('rB', -30, 90, 5)]
+        raise CircuitException("unsupported jar component {}".format(comp.name))
+    name = comp.name
+    if name == 'Constant':
+        return [Port('out', 0, 0, _int(a('width'), 1), True)]
+    if name == 'Clock':
+        return [Port('out', 0, 0, 1, True)]
+    if name in GATES:
+        return _gate_ports(comp)
+    if name in ('NOT Gate', 'Buffer'):
+        size = _int(a('size'), 30)
+        return _rotate([Port('out', 0, 0, _int(a('width'), 1), True),
+                        Port('in', -size, 0, _int(a('width'), 1))], a('facing', 'east'))
+    if name == 'Multiplexer':
+        return _mux_ports(comp)
+    if name in ('Adder', 'Subtractor'):
+        return [Port('A', -40, -10, w), Port('B', -40, 10, w), Port('out', 0, 0, w, True),
+                Port('cin', -20, -20, 1), Port('cout', -20, 20, 1, True)]
+    if name == 'Comparator':
+        return [Port('A', -40, -10, w), Port('B', -40, 10, w), Port('gt', 0, -10, 1, True),
+                Port('eq', 0, 0, 1, True), Port('lt', 0, 10, 1, True)]
+    if name == 'Shifter':
+        dist = max(1, (w - 1).bit_length())
+        return [Port('in', -40, -10, w), Port('dist', -40, 10, dist), Port('out', 0, 0, w, True)]
+    if name == 'BitFinder':
+        return [Port('present', -20, 20, 1, True),
+                Port('index', 0, 0, max(1, (w - 1).bit_length()), True), Port('in', -40, 0, w)]
+    if name == 'Bit Extender':
+        ports = [Port('out', 0, 0, _int(a('out_width'), 16), True), Port('in', -40, 0, _int(a('in_width'), 8))]
+        if a('type') == 'input':
+            ports.append(Port('ext', -20, -20, 1))
+        return ports
+    if name == 'Register':
+        return [Port('out', 0, 0, w, True), Port('in', -30, 0, w), Port('clk', -20, 20, 1),
+                Port('clr', -10, 20, 1), Port('en', -30, 10, 1)]
+    if name == 'Counter':
+        return [Port('out', 0, 0, w, True), Port('in', -30, 0, w), Port('clk', -20, 20, 1),
+                Port('clr', 0, 20, 1), Port('ld', -30, -10, 1), Port('ct', -30, 10, 1),
+                Port('carry', 0, 10, 1, True)]
+    if name in ('ROM', 'RAM'):
+        addr, data = _int(a('addrWidth'), 8), _int(a('dataWidth'), 8)
+        ports = [Port('data', 0, 0, data, True), Port('addr', -140, 0, addr), Port('cs', -90, 40, 1)]
+        if name == 'RAM':
+            if a('bus', 'combined') != 'separate':
+                raise CircuitException("only RAMs with separate load/store ports are supported")
+            ports += [Port('oe', -50, 40, 1), Port('clr', -30, 40, 1), Port('clk', -70, 40, 1),
+                      Port('we', -110, 40, 1), Port('din', -140, 20, data)]
+        return ports
+    raise CircuitException("unsupported component {}".format(name))
+
+# --- flattening --------------------------------------------------------------
+
+class UnionFind(object):
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, k):
+        parent = self.parent
+        root = k
+        while parent.get(root, root) != root:
+            root = parent[root]
+        while k != root:
+            parent[k], k = root, parent[k]
+        return root
+
+    def union(self, a, b):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            self.parent[ra] = rb
+
+class Prim(object):
+    """
+        A leaf component of the flattened netlist; ports maps port name -> (point, Port).
+    """
+
+    def __init__(self, kind, comp, path):
+        self.kind = kind
+        self.comp = comp
+        self.path = path
+        self.ports = {}
+
+    def describe(self):
+        return "{} at {} in {}".format(self.comp.name, self.comp.loc, '/'.join(self.path))
+
+IGNORED = ('Text', 'Probe')
+
+class Netlist(object):
+    """
+        The flattened circuit: primitives, splitters and top-level pins, all attached to
+        points (scope, x, y) that union-find merges into nets.
+    """
+
+    def __init__(self, project, circuit=None):
+        self.project = project
+        self.uf = UnionFind()
+        self.prims = []
+        self.splitters = []
+        self.pins = []
+        self.widths = {}
+        self.scopes = 0
+        top = project.circuits[circuit or project.main]
+        self._flatten(top, self._scope(), (top.name,), True)
+
+    def _scope(self):
+        self.scopes += 1
+        return self.scopes
+
+    def _attach(self, point, width):
+        self.widths[point] = max(self.widths.get(point, 0), width)
+
+    def _flatten(self, circuit, scope, path, top):
+        uf = self.uf
+        project = circuit.project
+        for a, b in circuit.wires:
+            uf.union((scope,) + a, (scope,) + b)
+        self._junctions(circuit, scope)
+        for comp in circuit.comps:
+            x, y = comp.loc
+            here = (scope, x, y)
+            kind, what = project.resolve(comp)
+            if kind == 'circuit':
+                child = self._scope()
+                for pin_loc, (dx, dy) in what.port_offsets().items():
+                    uf.union((scope, x + dx, y + dy), (child,) + pin_loc)
+                self._flatten(what, child, path + (comp.get('label') or what.name,), False)
+            elif kind == 'builtin' and what in IGNORED:
+                continue
+            elif kind == 'builtin' and what == 'Tunnel':
+                uf.union(here, (scope, 'tunnel', comp.get('label', '')))
+                self._attach(here, _int(comp.get('width'), 1))
+            elif kind == 'builtin' and what == 'Pin':
+                width = _int(comp.get('width'), 1)
+                self._attach(here, width)
+                if top:
+                    self.pins.append((comp, here))
+            elif kind == 'builtin' and what == 'Splitter':
+                ends, bits = splitter_layout(comp)
+                ends = [(scope, x + dx, y + dy) for dx, dy in ends]
+                self.splitters.append((here, ends, bits))
+                self._attach(here, len(bits))
+                for i, end in enumerate(ends):
+                    self._attach(end, bits.count(i))
+            else:
+                prim = Prim(what, comp, path)
+                if kind == 'jar':
+                    prim.kind = 'jar:' + what
+                for port in component_ports(kind, comp):
+                    point = (scope, x + port.dx, y + port.dy)
+                    prim.ports[port.name] = (point, port)
+                    self._attach(point, port.width)
+                self.prims.append(prim)
+
+    def _junctions(self, circuit, scope):
+        # a wire ending on the middle of another wire is connected to it
+        ends = set()
+        for a, b in circuit.wires:
+            ends.add(a)
+            ends.add(b)
+        for a, b in circuit.wires:
+            if a[0] == b[0]:
+                lo, hi = sorted((a[1], b[1]))
+                hits = [e for e in ends if e[0] == a[0] and lo < e[1] < hi]
+            elif a[1] == b[1]:
+                lo, hi = sorted((a[0], b[0]))
+                hits = [e for e in ends if e[1] == a[1] and lo < e[0] < hi]
+            else:
+                continue
+            for e in hits:
+                self.uf.union((scope,) + a, (scope,) + e)
+
+# --- compiling ---------------------------------------------------------------
+
+def _alu(x, y, op):
+    # edu.uiowa.cs.alu.ALU: returns (overflow, result)
+    if op == 0:
+        return 0, (y << (x & 31)) & 0xffffffff
+    if op == 1:
+        return 0, y >> (x & 31)
+    if op == 2:
+        return 0, ((y - ((y >> 31) << 32)) >> (x & 31)) & 0xffffffff
+    if op in (3, 4):
+        r = (x + y) & 0xffffffff
+        return (op == 3 and ((~(x ^ y) & (x ^ r)) >> 31) & 1), r
+    if op in (5, 6):
+        r = (x - y) & 0xffffffff
+        return (op == 5 and (((x ^ y) & (x ^ r)) >> 31) & 1), r
+    if op == 7:
+        return 0, x & y
+    if op == 8:
+        return 0, x | y
+    if op == 9:
+        return 0, x ^ y
+    if op == 10:
+        return 0, 1 if (x ^ 0x80000000) < (y ^ 0x80000000) else 0
+    if op == 11:
+        return 0, 1 if x < y else 0
+    return 0, 0
+
+class Compiler(object):
+    """
+        Turns a Netlist into the source of settle(q, clk, inputs...) and edges(q, old, new).
+        Conditionals go through select() and boolean() so a subclass can generate code for
+        other value types (see vecsim.py).
+    """
+
+    def __init__(self, netlist):
+        self.netlist = netlist
+        uf = netlist.uf
+        self.width = {}
+        for point, width in netlist.widths.items():
+            root = uf.find(point)
+            self.width[root] = max(self.width.get(root, 0), width)
+
+        # bits of nets joined by splitters are the same bit
+        self.bits = UnionFind()
+        for combined, ends, bits in netlist.splitters:
+            rc = uf.find(combined)
+            used = [0] * len(ends)
+            for i, end in enumerate(bits):
+                if end is None:
+                    continue
+                self.bits.union((rc, i), (uf.find(ends[end]), used[end]))
+                used[end] += 1
+
+        self.names = {}      # (prim, port) -> variable name
+        self.consts = {}     # variable name -> constant value
+        self.drivers = {}    # bit -> (variable, bit index, prim)
+        self.shared = {}     # bit -> further drivers of a bit driven more than once
+        self.flip_index = {} # bit driven more than once -> its bit in settle()'s flip argument
+        for n, prim in enumerate(netlist.prims):
+            for name, (point, port) in sorted(prim.ports.items()):
+                if not port.output:
+                    continue
+                var = 'v{}_{}'.format(n, name)
+                self.names[(prim, name)] = var
+                root = uf.find(point)
+                for b in range(port.width):
+                    bit = self.bits.find((root, b))
+                    if bit in self.drivers:
+                        self.flip_index.setdefault(bit, len(self.flip_index))
+                        self.shared.setdefault(bit, []).append((var, b, prim))
+                    else:
+                        self.drivers[bit] = (var, b, prim)
+            if prim.kind == 'Constant':
+                var = self.names[(prim, 'out')]
+                self.consts[var] = _int(prim.comp.get('value'), 1) & _mask(prim.ports['out'][1].width)
+
+        # top-level input pins drive their nets from arguments of settle()
+        self.inputs = []
+        for comp, point in sorted(netlist.pins, key=lambda p: (p[0].loc[1], p[0].loc[0])):
+            if comp.get('output') == 'true':
+                continue
+            var = 'i{}'.format(len(self.inputs))
+            width = _int(comp.get('width'), 1)
+            self.inputs.append((comp.get('label', ''), width, var))
+            root = uf.find(point)
+            for b in range(width):
+                self.drivers.setdefault(self.bits.find((root, b)), (var, b, None))
+        self.var_widths = dict((v, prim.ports[name][1].width) for (prim, name), v in self.names.items())
+        self.var_widths.update((var, width) for label, width, var in self.inputs)
+        self.namespace = {'_alu': _alu}
+        self.initial = []    # initial values of q
+        self.seq = []        # (trigger, clock expr, next-state expr, apply code)
+
+    def gather(self, point, width):
+        """
+            Returns (expression, variables used, mask of undriven bits) for a width-bit value read at point.
+        """
+        root = self.netlist.uf.find(point)
+        width = min(width, self.width.get(root, width))
+        runs = []
+        const = 0
+        undriven = 0
+        flipped = []
+        used = set()
+        for b in range(width):
+            bit = self.bits.find((root, b))
+            driver = self.drivers.get(bit)
+            if driver is None:
+                undriven |= 1 << b
+                continue
+            var, src, prim = driver
+            if bit in self.flip_index:
+                # a disputed bit reads as its first driver, or the other way when flip says so
+                value = str((self.consts[var] >> src) & 1) if var in self.consts else '(({} >> {}) & 1)'.format(var, src)
+                if var not in self.consts:
+                    used.add(var)
+                flipped.append('(({} ^ ((flip >> {}) & 1)) << {})'.format(value, self.flip_index[bit], b))
+            elif var in self.consts:
+                const |= ((self.consts[var] >> src) & 1) << b
+            elif runs and runs[-1][0] == var and runs[-1][1] + runs[-1][3] == src and runs[-1][2] + runs[-1][3] == b:
+                runs[-1][3] += 1
+            else:
+                runs.append([var, src, b, 1])
+        terms = []
+        for var, src, dst, n in runs:
+            term = var
+            if src:
+                term = '({} >> {})'.format(term, src)
+            if src or n < self.var_widths[var]:
+                term = '({} & {})'.format(term, _hex(_mask(n)))
+            if dst:
+                term = '({} << {})'.format(term, dst)
+            terms.append(term)
+        terms.extend(flipped)
+        if const or not terms:
+            terms.append(_hex(const))
+        return ' | '.join(terms), set(r[0] for r in runs) | used, undriven
+
+    def connected(self, prim, name):
+        point, port = prim.ports[name]
+        root = self.netlist.uf.find(point)
+        return any(self.bits.find((root, b)) in self.drivers for b in range(port.width))
+
+    def compile(self):
+        netlist = self.netlist
+        blocks = []
+        for prim in netlist.prims:
+            self.deps = set()
+            self.lines = []
+            emit = getattr(self, '_emit_' + prim.kind.replace(':', '_').replace(' ', '_'), None)
+            if emit is None:
+                raise CircuitException("unsupported component {}".format(prim.describe()))
+            emit(prim, *[self.names.get((prim, n)) for n in self._outputs(prim)])
+            produced = set(v for (p, n), v in self.names.items() if p is prim)
+            blocks.append((self.lines, self.deps - produced, produced))
+        body = self._schedule(blocks)
+
+        pins = sorted(((comp.loc[1], comp.loc[0]), comp, point) for comp, point in netlist.pins
+                      if comp.get('output') == 'true')
+        self.headers, self.pinwidths, self.undriven, outs = [], [], [], []
+        halt = '0'
+        for key, comp, point in pins:
+            width = _int(comp.get('width'), 1)
+            expr, deps, undriven = self.gather(point, width)
+            if comp.get('label') == 'halt':
+                halt = expr
+                continue
+            self.headers.append(comp.get('label', ''))
+            self.pinwidths.append(width)
+            self.undriven.append(undriven)
+            outs.append(expr)
+
+        returns = outs + [halt]
+        self.triggers = [trigger for trigger, clock, nxt, apply in self.seq]
+        edge_lines = []
+        for i, (trigger, clock, nxt, apply) in enumerate(self.seq):
+            c = len(returns)
+            returns += [clock, nxt]
+            test = 'not old[{0}] and new[{0}]' if trigger == 'rising' else 'old[{0}] and not new[{0}]'
+            edge_lines.append('    if {}:'.format(test.format(c)))
+            edge_lines.append('        n = old[{}]'.format(c + 1))
+            edge_lines.extend('        ' + l for l in apply)
+            edge_lines.append('        fired = True')
+
+        src = ['def settle({}):'.format(', '.join(['q', 'clk'] + [var + '=0' for label, width, var in self.inputs] + ['flip=0']))]
+        src.extend('    ' + l for l in body + self._conflict_checks())
+        # the disputed bits of this settle come last
+        src.append('    return ({},)'.format(', '.join(returns + ['conflict'])))
+        src.append('')
+        src.append('def edges(q, old, new):')
+        src.append('    fired = False')
+        src.extend(edge_lines)
+        src.append('    return fired')
+        self.source = '\n'.join(src) + '\n'
+        self.outputs = len(outs)
+        return self
+
+    def _conflict_checks(self):
+        # a wire with several drivers reads as its first driver; Logisim shows an error value
+        # when they disagree, so record that (and which bits) instead of silently picking one
+        def value(var, index):
+            if var in self.consts:
+                return str((self.consts[var] >> index) & 1)
+            return '(({} >> {}) & 1)'.format(var, index)
+        self.namespace['conflicts'] = set()
+        lines = ['conflict = 0']
+        for bit, i in sorted(self.flip_index.items(), key=lambda item: item[1]):
+            var, index, prim = self.drivers[bit]
+            for other, other_index, other_prim in self.shared[bit]:
+                lines.append('if {}:'.format(self.differs(['{} != {}'.format(value(var, index), value(other, other_index))])))
+                lines.append('    conflict |= {}'.format(_hex(1 << i)))
+                lines.append('    conflicts.add({!r})'.format('{} and {}'.format(prim.describe(), other_prim.describe())))
+        return lines
+
+    def _outputs(self, prim):
+        return [n for n, (point, port) in sorted(prim.ports.items()) if port.output]
+
+    def _schedule(self, blocks):
+        # levelize: a block goes after the blocks producing every variable it reads
+        producer = {}
+        for i, (lines, deps, produced) in enumerate(blocks):
+            for v in produced:
+                producer[v] = i
+        waiting = [set(producer[v] for v in deps if v in producer) for lines, deps, produced in blocks]
+        users = [[] for b in blocks]
+        for i, needs in enumerate(waiting):
+            for j in needs:
+                users[j].append(i)
+        ready = [i for i, needs in enumerate(waiting) if not needs]
+        body = []
+        done = 0
+        while ready:
+            i = ready.pop()
+            body.extend(blocks[i][0])
+            done += 1
+            for j in users[i]:
+                waiting[j].discard(i)
+                if not waiting[j]:
+                    ready.append(j)
+        if done != len(blocks):
+            stuck = [self.netlist.prims[i].describe() for i, needs in enumerate(waiting) if needs]
+            raise CircuitException("combinational loop through: {}".format('; '.join(stuck[:5])))
+        return body
+
+    # helpers for the emitters
+
+    def inp(self, prim, name, width=None):
+        point, port = prim.ports[name]
+        expr, deps, undriven = self.gather(point, width or port.width)
+        self.deps |= deps
+        return '(' + expr + ')' if ' ' in expr else expr
+
+    def enabled(self, prim, name):
+        # optional control inputs left unconnected count as enabled
+        return self.inp(prim, name) if self.connected(prim, name) else None
+
+    def select(self, cond, a, b):
+        return '({} if {} else {})'.format(a, cond, b)
+
+    def boolean(self, cond):
+        return '(1 if {} else 0)'.format(cond)
+
+    def differs(self, tests):
+        return ' or '.join(tests)
+
+    def emit(self, line, *args):
+        self.lines.append(line.format(*args))
+
+    def state(self, value=0):
+        self.initial.append(value)
+        return 'q[{}]'.format(len(self.initial) - 1)
+
+    def memory(self, contents):
+        name = 'M{}'.format(len(self.namespace))
+        self.namespace[name] = contents
+        return name
+
+    def sampled(self, build):
+        # next-state expressions are only read at a clock edge, so they never order the settle
+        deps = set(self.deps)
+        try:
+            return build()
+        finally:
+            self.deps = deps
+
+    def clocked(self, prim, nxt, apply):
+        trigger = prim.comp.get('trigger', 'rising')
+        if trigger not in ('rising', 'falling'):
+            raise CircuitException("{}: only edge triggered parts are supported".format(prim.describe()))
+        self.seq.append((trigger, self.sampled(lambda: self.inp(prim, 'clk')), nxt, apply))
+
+    # one emitter per component type; arguments are the output variables in port name order
+
+    def _emit_Constant(self, prim, out):
+        pass
+
+    def _emit_Clock(self, prim, out):
+        self.emit('{} = clk', out)
+
+    def _gate(self, prim, out):
+        ins = [self.inp(prim, n) for n in sorted(prim.ports) if n.startswith('in') and self.connected(prim, n)]
+        op = GATES[prim.kind]
+        if not ins:
+            self.emit('{} = 0', out)
+            return
+        if op == '^' and len(ins) > 2:
+            raise CircuitException("{}: XOR gates with more than two inputs are not supported".format(prim.describe()))
+        expr = ' {} '.format(op).join(ins)
+        if prim.kind in ('NAND Gate', 'NOR Gate', 'XNOR Gate'):
+            expr = '({}) ^ {}'.format(expr, _hex(_mask(prim.ports['out'][1].width)))
+        self.emit('{} = {}', out, expr)
+
+    _emit_AND_Gate = _emit_OR_Gate = _emit_XOR_Gate = _gate
+    _emit_NAND_Gate = _emit_NOR_Gate = _emit_XNOR_Gate = _gate
+
+    def _emit_NOT_Gate(self, prim, out):
+        self.emit('{} = {} ^ {}', out, self.inp(prim, 'in'), _hex(_mask(prim.ports['out'][1].width)))
+
+    def _emit_Buffer(self, prim, out):
+        self.emit('{} = {}', out, self.inp(prim, 'in'))
+
+    def _emit_Multiplexer(self, prim, out):
+        expr = self.select(self.inp(prim, 'sel'), self.inp(prim, 'in1'), self.inp(prim, 'in0'))
+        en = self.enabled(prim, 'en')
+        if en is not None:
+            expr = self.select(en, expr, '0')
+        self.emit('{} = {}', out, expr)
+
+    def _emit_Adder(self, prim, cout, out):
+        w = prim.ports['out'][1].width
+        cin = self.enabled(prim, 'cin')
+        t = out + '_t'
+        self.emit('{} = {} + {}{}', t, self.inp(prim, 'A'), self.inp(prim, 'B'), ' + ' + cin if cin else '')
+        self.emit('{} = {} & {}', out, t, _hex(_mask(w)))
+        self.emit('{} = {} >> {}', cout, t, w)
+
+    def _emit_Subtractor(self, prim, cout, out):
+        w = prim.ports['out'][1].width
+        bin = self.enabled(prim, 'cin')
+        t = out + '_t'
+        self.emit('{} = {} - {}{}', t, self.inp(prim, 'A'), self.inp(prim, 'B'), ' - ' + bin if bin else '')
+        self.emit('{} = {} & {}', out, t, _hex(_mask(w)))
+        # a negative difference has every bit above the result set
+        self.emit('{} = ({} >> {}) & 1', cout, t, w)
+
+    def _emit_Comparator(self, prim, eq, gt, lt):
+        a, b = self.inp(prim, 'A'), self.inp(prim, 'B')
+        if prim.comp.get('mode', 'twosComplement') != 'unsigned':
+            # flipping the sign bit makes an unsigned compare order two's complement values
+            sign = _hex(1 << (prim.ports['A'][1].width - 1))
+            a, b = '({} ^ {})'.format(a, sign), '({} ^ {})'.format(b, sign)
+        self.emit('{} = {}', gt, self.boolean('{} > {}'.format(a, b)))
+        self.emit('{} = {}', eq, self.boolean('{} == {}'.format(a, b)))
+        self.emit('{} = {}', lt, self.boolean('{} < {}'.format(a, b)))
+
+    def _emit_Shifter(self, prim, out):
+        w = prim.ports['out'][1].width
+        m = _hex(_mask(w))
+        a, d = self.inp(prim, 'in'), self.inp(prim, 'dist')
+        shift = prim.comp.get('shift', 'll')
+        if shift == 'll':
+            expr = '({} << {}) & {}'.format(a, d, m)
+        elif shift == 'lr':
+            expr = '{} >> {}'.format(a, d)
+        elif shift == 'ar':
+            expr = '(({0} - (({0} >> {1}) << {2})) >> {3}) & {4}'.format(a, w - 1, w, d, m)
+        elif shift == 'rl':
+            expr = '(({0} << {1}) | ({0} >> ({2} - {1}))) & {3}'.format(a, d, w, m)
+        else:
+            expr = '(({0} >> {1}) | ({0} << ({2} - {1}))) & {3}'.format(a, d, w, m)
+        self.emit('{} = {}', out, expr)
+
+    def _emit_BitFinder(self, prim, index, present):
+        a = self.inp(prim, 'in')
+        typ = prim.comp.get('type', 'low1')
+        if typ.endswith('0'):
+            a = '({} ^ {})'.format(a, _hex(_mask(prim.ports['in'][1].width)))
+        t = index + '_t'
+        self.emit('{} = {}', t, a)
+        self.emit('{} = 1 if {} else 0', present, t)
+        if typ.startswith('high'):
+            self.emit('{} = {}.bit_length() - 1 if {} else 0', index, t, t)
+        else:
+            self.emit('{} = ({} & -{}).bit_length() - 1 if {} else 0', index, t, t, t)
+
+    def _emit_Bit_Extender(self, prim, out):
+        a = self.inp(prim, 'in')
+        win, wout = prim.ports['in'][1].width, prim.ports['out'][1].width
+        typ = prim.comp.get('type', 'zero')
+        fill = _hex(_mask(wout) ^ _mask(win)) if wout > win else '0'
+        if wout < win:
+            self.emit('{} = {} & {}', out, a, _hex(_mask(wout)))
+        elif typ == 'zero':
+            self.emit('{} = {}', out, a)
+        elif typ == 'one':
+            self.emit('{} = {} | {}', out, a, fill)
+        else:
+            sign = '{} >> {}'.format(a, win - 1) if typ == 'sign' else self.inp(prim, 'ext')
+            self.emit('{} = {}', out, self.select(sign, '{} | {}'.format(a, fill), a))
+
+    def _emit_Register(self, prim, out):
+        q = self.state()
+        clr = self.enabled(prim, 'clr')
+        self.emit('{} = {}', out, q if clr is None else '0 if {} else {}'.format(clr, q))
+
+        def nxt():
+            d = self.inp(prim, 'in')
+            en = self.enabled(prim, 'en')
+            if en is not None:
+                d = '{} if {} else {}'.format(d, en, q)
+            if clr is not None:
+                d = '0 if {} else {}'.format(clr, d)
+            return '(' + d + ')'
+        self.clocked(prim, self.sampled(nxt), [q + ' = n'])
+
+    def _emit_Counter(self, prim, carry, out):
+        w = prim.ports['out'][1].width
+        top = _int(prim.comp.get('max'), _mask(w)) & _mask(w)
+        if prim.comp.get('ontarget', 'wrap') != 'wrap':
+            raise CircuitException("{}: only wrapping counters are supported".format(prim.describe()))
+        q = self.state()
+        ct = self.enabled(prim, 'ct') or '1'
+        ld = self.enabled(prim, 'ld') or '0'
+        clr = self.enabled(prim, 'clr') or '0'
+        goal = _hex(top) if ld == '0' else '(0 if {} else {})'.format(ld, _hex(top))
+        self.emit('{} = {}', out, q)
+        self.emit('{} = 1 if {} and {} == {} else 0', carry, ct, q, goal)
+
+        def nxt():
+            # Counter.propagate: ct counts (down when ld is also set), ld alone loads
+            up = '0 if {0} == {1} else {0} + 1'.format(q, _hex(top))
+            down = '{1} if {0} == 0 else {0} - 1'.format(q, _hex(top))
+            count = up if ld == '0' else '({}) if {} else ({})'.format(down, ld, up)
+            d = '({}) if {} else ({} if {} else {})'.format(count, ct, self.inp(prim, 'in'), ld, q)
+            if clr != '0':
+                d = '0 if {} else ({})'.format(clr, d)
+            return '(' + d + ')'
+        self.clocked(prim, self.sampled(nxt), [q + ' = n'])
+
+    def _emit_ROM(self, prim, out):
+        words = read_contents(prim.comp.get('contents', 'addr/data: 8 8\n'))
+        rom = self.memory(words)
+        prim.memory = rom
+        a = self.inp(prim, 'addr')
+        expr = '{0}[{1}] if {1} < len({0}) else 0'.format(rom, a)
+        cs = self.enabled(prim, 'cs')
+        if cs is not None:
+            expr = '({}) if {} else 0'.format(expr, cs)
+        self.emit('{} = {}', out, expr)
+
+    def _emit_RAM(self, prim, out):
+        ram = self.memory({})
+        prim.memory = ram
+        a = self.inp(prim, 'addr')
+        on = [c for c in (self.enabled(prim, 'cs'), self.enabled(prim, 'oe')) if c is not None]
+        expr = '{}.get({}, 0)'.format(ram, a)
+        if on:
+            expr = '{} if {} else 0'.format(expr, ' and '.join(on))
+        self.emit('{} = {}', out, expr)
+        clr = self.sampled(lambda: self.enabled(prim, 'clr'))
+
+        def nxt():
+            write = [c for c in (self.enabled(prim, 'cs'), self.enabled(prim, 'we')) if c is not None]
+            d = '({}, {})'.format(a, self.inp(prim, 'din'))
+            if write:
+                d = '({} if {} else None)'.format(d, ' and '.join(write))
+            if clr is not None:
+                # the clear is applied with the next clock edge rather than immediately
+                d = "('clear' if {} else {})".format(clr, d)
+            return d
+        apply = ['if n is not None:', '    {}[n[0]] = n[1]'.format(ram)]
+        if clr is not None:
+            apply = ["if n == 'clear':", '    {}.clear()'.format(ram), 'elif n is not None:',
+                     '    {}[n[0]] = n[1]'.format(ram)]
+        self.clocked(prim, self.sampled(nxt), apply)
+
+    def _emit_jar_ALU(self, prim, equal, of, result):
+        x, y = self.inp(prim, 'X'), self.inp(prim, 'Y')
+        self.emit('{}, {} = _alu({}, {}, {})', of, result, x, y, self.inp(prim, 'Switch'))
+        self.emit('{} = {}', equal, self.boolean('{} == {}'.format(x, y)))
+
+    def _emit_jar_RegisterFile(self, prim, a, b):
+        regs = self.memory([0] * 32)
+        prim.memory = regs
+        self.emit('{} = {}[{}]', a, regs, self.inp(prim, 'rA'))
+        self.emit('{} = {}[{}]', b, regs, self.inp(prim, 'rB'))
+        nxt = self.sampled(lambda: '(({0}, {1}) if {2} and {0} else None)'.format(
+            self.inp(prim, 'rW'), self.inp(prim, 'W'), self.inp(prim, 'WE')))
+        self.clocked(prim, nxt, ['if n is not None:', '    {}[n[0]] = n[1]'.format(regs)])
+
+# --- running -----------------------------------------------------------------
+
+class Compiled(object):
+    """
+        A compiled circuit, shared by every Simulation of the same file.
+    """
+
+    def __init__(self, circfile):
+        loader = Loader()
+        netlist = Netlist(loader.load(circfile))
+        compiler = Compiler(netlist).compile()
+        self.source = compiler.source
+        self.code = compile(compiler.source, '<{}>'.format(os.path.basename(circfile)), 'exec')
+        self.namespace = compiler.namespace
+        self.initial = compiler.initial
+        self.outputs = compiler.outputs
+        self.headers = compiler.headers
+        self.pinwidths = compiler.pinwidths
+        self.undriven = compiler.undriven
+        self.triggers = compiler.triggers
+        self.rams = [prim.memory for prim in netlist.prims if prim.kind == 'RAM']
+        # ROMs of the circuit itself (not of its subcircuits): the program ROM of a harness
+        self.roms = [prim.memory for prim in netlist.prims if prim.kind == 'ROM' and len(prim.path) == 1]
+        self.files = sorted(loader.projects)
+        self.stamp = _stamp(self.files)
+
+def _stamp(files):
+    return [os.path.getmtime(f) if os.path.exists(f) else None for f in files]
+
+_compiled = {}
+
+def load(circfile):
+    """
+        Returns the Compiled circuit for circfile, recompiling it if it or a library changed.
+    """
+    path = os.path.abspath(circfile)
+    compiled = _compiled.get(path)
+    if compiled is None or _stamp(compiled.files) != compiled.stamp:
+        compiled = _compiled[path] = Compiled(path)
+    return compiled
+
+class Simulation(object):
+    """
+        One run of a circuit from power-on.  load names a v2.0 raw image copied into every RAM,
+        as with logisim's -load option; rom, a list of words, replaces the contents of the
+        circuit's own ROMs, so one compiled harness can run many programs.
+    """
+
+    def __init__(self, circfile, load_image=None, rom=None):
+        compiled = load(circfile)
+        self.compiled = compiled
+        # memories and the conflict log belong to the run; the compiled circuit only holds their initial contents
+        namespace = dict((name, copy.copy(value)) for name, value in compiled.namespace.items())
+        if load_image is not None:
+            image = read_image(load_image)
+            for ram in compiled.rams:
+                namespace[ram].update(image.used())
+        if rom is not None:
+            for name in compiled.roms:
+                namespace[name] = list(rom)
+        exec(compiled.code, namespace)
+        self.settle = namespace['settle']
+        self.edges = namespace['edges']
+        self.conflicts = namespace['conflicts']
+        self.headers = compiled.headers
+        self.pinwidths = compiled.pinwidths
+        self.errors = None
+
+    def _settle(self, q, clk):
+        # (values, values with the disputed bits read the other way, or None when no wire is disputed)
+        cur = self.settle(q, clk)
+        if not cur[-1]:
+            return cur, None
+        return cur, self.settle(q, clk, flip=cur[-1])
+
+    def _check_edge(self, old, old_alt, new, new_alt):
+        """
+            Raises ConflictException when a disputed wire decides whether a clocked part fires on
+            this edge, or what it stores.
+        """
+        if old_alt is None and new_alt is None:
+            return
+        old_alt, new_alt = old_alt or old, new_alt or new
+        base = self.compiled.outputs + 1
+        for i, trigger in enumerate(self.compiled.triggers):
+            c = base + 2 * i
+            fired = [(not a and b) if trigger == 'rising' else (a and not b)
+                     for a, b in ((old[c], new[c]), (old_alt[c], new_alt[c]))]
+            if fired[0] != fired[1] or (fired[0] and old[c + 1] != old_alt[c + 1]):
+                raise ConflictException("{} drive different values onto a wire that decides what is stored "
+                                        "on a clock edge; Logisim would store an error value".format(
+                                            ', '.join(sorted(self.conflicts))))
+
+    def rows(self, max_cycles=None):
+        """
+            Yields the output pin values every time they change, like -tty table, until halt goes high.
+            self.errors then holds the bits of each value that a disputed wire decides (or None).
+            Raises CycleLimitException once the clock would rise for the (max_cycles + 1)th time.
+        """
+        edges = self.edges
+        q = list(self.compiled.initial)
+        n = self.compiled.outputs
+        clk = 0
+        cycles = 0
+        cur, alt = self._settle(q, clk)
+        prev = None
+        while True:
+            out = cur[:n]
+            errors = [a ^ b for a, b in zip(out, alt[:n])] if alt is not None and alt[:n] != out else None
+            if (out, errors) != prev:
+                self.errors = errors
+                yield list(out)
+                prev = (out, errors)
+            if cur[n]:
+                return
+            clk ^= 1
+            if clk:
+                cycles += 1
+                if max_cycles is not None and cycles > max_cycles:
+                    raise CycleLimitException("no halt after {} clock cycles".format(max_cycles))
+            new, new_alt = self._settle(q, clk)
+            self._check_edge(cur, alt, new, new_alt)
+            if edges(q, cur, new):
+                new, new_alt = self._settle(q, clk)
+            cur, alt = new, new_alt
+
+    def format_row(self, values, errors=None):
+        errors = errors or [0] * len(values)
+        return '\t'.join(_bits(v, w, x, e) for v, w, x, e in zip(values, self.pinwidths, self.compiled.undriven, errors))
+
+    def table(self, rows=None, max_cycles=None):
+        if rows is not None and rows <= 0:
+            return
+        for i, values in enumerate(self.rows(max_cycles)):
+            yield self.format_row(values, self.errors) + '\n'
+            if rows is not None and i + 1 >= rows:
+                return
+
+def _bits(value, width, undriven, errors=0):
+    text = dec.bin_string(value, width)
+    if not undriven and not errors:
+        return text
+    # undriven bits print as x and error bits as E; walk the digits from the low bit, skipping the group spaces
+    chars = list(text)
+    b = 0
+    for i in range(len(chars) - 1, -1, -1):
+        if chars[i] == ' ':
+            continue
+        if (errors >> b) & 1:
+            chars[i] = 'E'
+        elif (undriven >> b) & 1:
+            chars[i] = 'x'
+        b += 1
+    return ''.join(chars)
+
+class TableStream(object):
+    """
+        File-like view of a run's table rows, for code written against logisim's stdout.
+    """
+
+    def __init__(self, lines):
+        self.lines = lines
+
+    def readline(self):
+        return next(self.lines, '')
+
+    def __iter__(self):
+        return self.lines
+
+    def close(self):
+        self.lines.close()
+
+def open_run(circfile, rows=None, load_image=None, max_cycles=None):
+    """
+        Simulates circfile and returns a file-like object with its -tty table rows.
+    """
+    return TableStream(Simulation(circfile, load_image).table(rows, max_cycles))
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulates a Logisim circuit and prints its -tty table output.")
+    parser.add_argument('circfile')
+    parser.add_argument('--load', metavar='IMAGE', help="v2.0 raw image to load into RAM")
+    parser.add_argument('--rows', type=int, help="stop after this many rows")
+    parser.add_argument('--max-cycles', type=int, default=MAX_CYCLES,
+                        help="stop with an error after this many clock cycles without a halt (default: %(default)s)")
+    args = parser.parse_args()
+    try:
+        sim = Simulation(args.circfile, args.load)
+        for line in sim.table(args.rows, args.max_cycles):
+            sys.stdout.write(line)
+    except CircuitException as e:
+        sys.exit("{}: {}".format(args.circfile, e))
+    for conflict in sorted(sim.conflicts):
+        sys.stderr.write("warning: {} drive different values onto the same wire\n".format(conflict))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,332 @@
+#!/usr/bin/env python
+"""
+    Cycles per instruction of a program run, from its cpu trace.
+
+        python cpi.py CPU-starter_kit_test.circ reference_output/CPU-starter_kit_test.out
+        python cpi.py --timing pipeline --steps 500 kernel.s
+        python cpi.py --compare ../kernels/sort.s
+
+    The program is a harness .circ (its ROM), a .s file or a .text.hex image;
+    the trace holds rows of the cpu OutputFormat (logisim -tty table output, a
+    reference .out file or a packed trace from tracefile.py).  Without a
+    trace, the rows come from mipsmodel.py with the given --timing, up to the
+    harness halt step or else until the program jumps to itself or leaves its
+    text (--steps caps the run).
+
+    Only the Fetch Addr column is needed: a fetch that does not follow the
+    previous one means the control transfer executing in that cycle was taken.
+    On the 2-stage pipeline an instruction executes in the cycle after its
+    fetch; the instruction fetched behind a taken branch or jump executes too
+    (the delay slot) or, with --no-delay-slot, is squashed and its fetch slot
+    is wasted; with --early, transfers resolve in the fetch stage (with the
+    execute stage's result forwarded to the comparison), so the next fetch
+    already follows them.  The first cycle of the pipeline only fills it.  The report
+    gives retired instructions, cycles up to the last retirement, CPI, the
+    taken rate of beq/bne, the wasted fetch slots and, per instruction class,
+    the instructions and the cycles they account for (their own plus the slots
+    wasted behind them).  Load-use pairs (a lw whose result the next
+    instruction reads) are counted too: they cost nothing on this datapath,
+    but would stall a deeper pipeline.
+
+    --compare runs the program on the model with every timing in VARIANTS
+    until it executes a jump to itself or leaves the program, and prints the
+    cycles each took, next to the 2-stage pipeline that squashes (what the
+    pipeline costs on code written without delay slots).  A variant whose
+    registers and RAM end up different from the single-cycle run's is
+    marked: the delay slot variant runs instructions such code never meant
+    to run.
+"""
+
+import argparse
+import json
+import sys
+
+import decode_out as dec
+import harnessgen
+import mipsmodel
+import tracefile
+
+CLASSES = ['alu', 'shift', 'immediate', 'load', 'store', 'branch', 'jump', 'jr']
+
+# (name, timing, model options) for --compare; BASELINE is the one the others are measured against
+VARIANTS = [
+    ('single-cycle', 'single', {}),
+    ('2-stage, delay slot', 'pipeline', {'delay_slot': True}),
+    ('2-stage, squash', 'pipeline', {'delay_slot': False}),
+    ('2-stage, early + forwarding', 'pipeline', {'early': True}),
+]
+BASELINE = '2-stage, squash'
+
+# cycles a run of the model is cut off at when nothing else ends it
+MAX_STEPS = 1 << 20
+
+def classify(op):
+    if op in ('sll', 'srl', 'sra'):
+        return 'shift'
+    if op in ('addi', 'addiu', 'slti', 'sltiu', 'andi', 'ori', 'lui'):
+        return 'immediate'
+    if op == 'lw':
+        return 'load'
+    if op == 'sw':
+        return 'store'
+    if op in ('beq', 'bne'):
+        return 'branch'
+    if op in ('j', 'jal'):
+        return 'jump'
+    if op == 'jr':
+        return 'jr'
+    return 'alu'
+
+def reads(inst):
+    # registers an instruction reads
+    op = inst.op
+    if op in ('lui', 'j', 'jal'):
+        return ()
+    if op in ('sll', 'srl', 'sra'):
+        return (inst.rt,)
+    if op in ('beq', 'bne', 'sw') or (classify(op) == 'alu' and op != 'clz'):
+        return (inst.rs, inst.rt)
+    return (inst.rs,)
+
+class Analysis(object):
+    """
+        Retirement statistics of one trace; fetches is a list of fetch addresses, one per cycle.
+    """
+
+    def __init__(self, text, fetches, timing='pipeline', delay_slot=True, early=False):
+        self.retired = 0
+        self.cycles = 0
+        self.fill = 0
+        self.squashed = 0
+        self.idle = 0
+        self.branches = 0
+        self.taken = 0
+        self.load_use = 0
+        self.per_class = dict((c, {'instructions': 0, 'cycles': 0, 'taken': 0, 'wasted': 0}) for c in CLASSES)
+        self._run(text, fetches, timing, delay_slot, early)
+
+    def _run(self, text, fetches, timing, delay_slot, early):
+        decoded = {}
+        def decode(addr):
+            if addr & 3 or addr >> 2 >= len(text):
+                return None
+            if addr not in decoded:
+                try:
+                    decoded[addr] = mipsmodel.Instruction(text[addr >> 2])
+                except mipsmodel.ModelException:
+                    decoded[addr] = None
+            return decoded[addr]
+
+        pipelined = timing == 'pipeline'
+        pending = None
+        squashing = False
+        previous = None
+        last = -1
+        idle = []
+        for t, addr in enumerate(fetches):
+            executing = pending if pipelined else addr
+            # a fetch that does not follow on from this one is the control transfer executing now
+            redirected = t + 1 < len(fetches) and fetches[t + 1] != (addr + 4) & mipsmodel.MASK
+            if pipelined and early:
+                # resolved when it was fetched: the fetch after its own is the one that moved
+                redirected = executing is not None and addr != (executing + 4) & mipsmodel.MASK
+            inst = decode(executing) if executing is not None else None
+            if inst is None:
+                if pipelined and t == 0:
+                    self.fill += 1
+                elif not squashing:
+                    # running outside the program (or off its end)
+                    idle.append(t)
+                squashing = False
+                pending = addr
+                previous = None
+                continue
+            cls = classify(inst.op)
+            stats = self.per_class[cls]
+            stats['instructions'] += 1
+            stats['cycles'] += 1
+            self.retired += 1
+            last = t
+            if previous is not None and previous.op == 'lw' and previous.rt and previous.rt in reads(inst):
+                self.load_use += 1
+            previous = inst
+            taken = redirected and cls in ('branch', 'jump', 'jr')
+            if cls == 'branch':
+                self.branches += 1
+                self.taken += taken
+            stats['taken'] += taken
+            pending = addr
+            if taken and pipelined and not delay_slot and not early:
+                # the instruction fetched this cycle is thrown away
+                pending = None
+                squashing = True
+                self.squashed += 1
+                stats['wasted'] += 1
+                stats['cycles'] += 1
+        self.cycles = last + 1
+        # the cycles after the last retirement don't count
+        self.idle = len([t for t in idle if t < self.cycles])
+
+    @property
+    def cpi(self):
+        return float(self.cycles) / self.retired if self.retired else None
+
+    @property
+    def taken_rate(self):
+        return float(self.taken) / self.branches if self.branches else None
+
+    @property
+    def wasted(self):
+        return self.fill + self.squashed + self.idle
+
+    def as_dict(self):
+        return {'retired': self.retired, 'cycles': self.cycles, 'cpi': self.cpi,
+                'branches': self.branches, 'taken': self.taken, 'taken_rate': self.taken_rate,
+                'wasted_slots': self.wasted, 'fill': self.fill, 'squashed': self.squashed, 'idle': self.idle,
+                'load_use': self.load_use, 'classes': self.per_class}
+
+class Outcome(object):
+    """
+        A model run of one --compare variant: cycles up to and including the last instruction,
+        and whether it ended in the same state as the single-cycle run.
+    """
+
+    def __init__(self, name, cycles, retired, state):
+        self.name = name
+        self.cycles = cycles
+        self.retired = retired
+        self.state = state
+        self.same = True
+
+    @property
+    def cpi(self):
+        return float(self.cycles) / self.retired if self.retired else None
+
+    def as_dict(self, base):
+        return {'variant': self.name, 'cycles': self.cycles, 'retired': self.retired, 'cpi': self.cpi,
+                'wasted_slots': self.cycles - self.retired, 'same_result': self.same,
+                'change': float(self.cycles) / base.cycles - 1 if base and base.cycles else None}
+
+def run_variant(name, text, data, timing, options, steps):
+    """
+        The Outcome of running text with one timing until a jump to itself or a transfer out of the
+        program executes, or for steps cycles.
+    """
+    machine = mipsmodel.Machine(text, data)
+    model = mipsmodel.TIMINGS[timing](machine, **options)
+    machine.link = model.link
+    end = len(text) * 4
+    retired = 0
+    cycles = 0
+    for cycle in model.cycles():
+        cycles = cycle.step + 1
+        r = cycle.retired
+        if r is not None:
+            retired += 1
+            if (r.taken and r.next_pc == r.pc) or r.next_pc >= end:
+                break
+        if cycles >= steps:
+            break
+    return Outcome(name, cycles, retired, (list(machine.regs), list(machine.ram.used())))
+
+def compare(text, data=None, steps=MAX_STEPS):
+    outcomes = [run_variant(name, text, data, timing, options, steps) for name, timing, options in VARIANTS]
+    for outcome in outcomes:
+        outcome.same = outcome.state == outcomes[0].state
+    return outcomes
+
+def report_compare(outcomes, out=sys.stdout):
+    base = dict((o.name, o) for o in outcomes).get(BASELINE)
+    out.write("{:<28} {:>9} {:>9} {:>7} {:>7} {:>8}\n".format('variant', 'cycles', 'retired', 'CPI', 'wasted', 'change'))
+    for o in outcomes:
+        change = '{:+.1%}'.format(float(o.cycles) / base.cycles - 1) if base and base.cycles else ''
+        out.write("{:<28} {:>9} {:>9} {:>7} {:>7} {:>8}{}\n".format(
+            o.name, o.cycles, o.retired, '-' if o.cpi is None else '{:.3f}'.format(o.cpi), o.cycles - o.retired,
+            change, '' if o.same else '  (different result)'))
+
+def fetch_addresses(rows, oformat):
+    column = oformat.headers.index('Fetch Addr')
+    return [row[column] for row in rows]
+
+def read_trace(path, oformat):
+    if tracefile.is_trace(path):
+        with tracefile.Trace(path) as trace:
+            if trace.format.typ != oformat.typ:
+                raise dec.OutputFormatException("{} holds {} rows, not {} rows".format(path, trace.format.typ, oformat.typ))
+            return list(trace.rows())
+    with open(path) as f:
+        return [values for block in dec.decode_stream(f, oformat) for values in block.rows()]
+
+def read_text(program):
+    if program.endswith('.circ'):
+        return mipsmodel.read_rom(program)
+    return harnessgen.read_program(program)[0]
+
+def report(analysis, out=sys.stdout):
+    a = analysis
+    rate = lambda v: '-' if v is None else '{:.1%}'.format(v)
+    out.write("retired instructions  {}\n".format(a.retired))
+    out.write("cycles                {}\n".format(a.cycles))
+    out.write("CPI                   {}\n".format('-' if a.cpi is None else '{:.3f}'.format(a.cpi)))
+    out.write("branches taken        {} of {} ({})\n".format(a.taken, a.branches, rate(a.taken_rate)))
+    out.write("wasted fetch slots    {} (fill {}, squashed {}, idle {})\n".format(a.wasted, a.fill, a.squashed, a.idle))
+    out.write("load-use pairs        {}\n".format(a.load_use))
+    out.write("\n{:<10} {:>12} {:>8} {:>8} {:>7} {:>8}\n".format('class', 'instructions', 'share', 'cycles', 'taken', 'wasted'))
+    for cls in CLASSES:
+        s = a.per_class[cls]
+        if not s['instructions']:
+            continue
+        out.write("{:<10} {:>12} {:>8} {:>8} {:>7} {:>8}\n".format(
+            cls, s['instructions'], rate(float(s['instructions']) / a.retired), s['cycles'], s['taken'], s['wasted']))
+
+def main():
+    parser = argparse.ArgumentParser(description="Reports CPI, taken branches and wasted fetch slots of a program run.")
+    parser.add_argument('program', help="harness .circ, .s file or .text.hex image")
+    parser.add_argument('trace', nargs='?', help="cpu rows of the run (default: run the program on mipsmodel.py)")
+    parser.add_argument('--timing', choices=sorted(mipsmodel.TIMINGS), default='pipeline', help="datapath the trace comes from (default: %(default)s)")
+    parser.add_argument('--no-delay-slot', action='store_true', help="the instruction behind a taken branch is squashed")
+    parser.add_argument('--early', action='store_true', help="branches and jumps resolve in the fetch stage, with forwarding")
+    parser.add_argument('--compare', action='store_true', help="compare the cycles the program takes with every timing of the model")
+    parser.add_argument('--steps', type=int, help="time steps to run the model for at most (default: the harness halt step, or until the program jumps to itself or leaves its text)")
+    parser.add_argument('--data', help="data image for the model")
+    parser.add_argument('--json', action='store_true', help="print the report as JSON")
+    args = parser.parse_args()
+
+    oformat = dec.get_test_format('cpu')
+    try:
+        text = read_text(args.program)
+        if args.compare:
+            data = mipsmodel.read_image(args.data) if args.data else None
+            outcomes = compare(text, data, args.steps or MAX_STEPS)
+            base = dict((o.name, o) for o in outcomes).get(BASELINE)
+            if args.json:
+                json.dump([o.as_dict(base) for o in outcomes], sys.stdout, indent=1, sort_keys=True)
+                sys.stdout.write('\n')
+            else:
+                report_compare(outcomes)
+            return
+        if args.trace:
+            rows = read_trace(args.trace, oformat)
+        else:
+            kwargs = {'delay_slot': not args.no_delay_slot, 'early': args.early} if args.timing == 'pipeline' else {}
+            steps = args.steps
+            if steps is None and args.program.endswith('.circ'):
+                steps = mipsmodel.halt_step(args.program)
+            data = mipsmodel.read_image(args.data) if args.data else None
+            if steps is None or not args.program.endswith('.circ'):
+                # the whole run, as --compare takes it, with --steps as the cap
+                steps = run_variant(args.timing, text, data, args.timing, kwargs, steps or MAX_STEPS).cycles - 1
+            cycles = mipsmodel.simulate(text, data, args.timing, **kwargs)
+            rows = list(mipsmodel.trace(cycles, 'cpu', steps))
+    except (mipsmodel.ModelException, dec.OutputFormatException, IOError) as e:
+        sys.exit(str(e))
+
+    analysis = Analysis(text, fetch_addresses(rows, oformat), args.timing, not args.no_delay_slot, args.early)
+    if args.json:
+        json.dump(analysis.as_dict(), sys.stdout, indent=1, sort_keys=True)
+        sys.stdout.write('\n')
+    else:
+        report(analysis)
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,11 @@
+import binascii
 import csv
 import sys
+from array import array
+
+# array type for decoded values: the narrowest one that holds a 32 bit pin
+WORD = 'I' if array('I').itemsize >= 4 else 'L'
+CHUNK = 1 << 20
 
 def bin2hex(s):
     b = ''.join(s.split(' '))
@@ -8,10 +14,15 @@ def bin2hex(s):
         return 'x' * n
     return "{:x}".format(int(b, 2)).zfill(n)
 
+def bin_string(v, width):
+    # the way logisim -tty table prints a value: binary, in groups of 4 counted from the low bit
+    b = "{:b}".format(v).zfill(width)
+    return ' '.join(b[max(0, i - 4):i] for i in range(len(b), 0, -4)[::-1])
+
 def print_usage():
-    print("Usage: {} <alu|regfile|cpu>".format(sys.argv[0]))
+    print("Usage: {} <alu|regfile|cpu|cpu-lite|cpu-end> [file]".format(sys.argv[0]))
     print()
-    print("\tTakes the logisim output on standard input and writes decoded version to standard output.")
+    print("\tTakes the logisim output on standard input (or from file) and writes decoded version to standard output.")
     print("\tThe first argument states what circuit produced the input.")
     sys.exit(-1)
 
@@ -19,11 +30,13 @@ class OutputFormatException(Exception):
     pass
 
 class OutputFormat:
-    def __init__(self, typ, headers, bitwidths):
+    def __init__(self, typ, headers, bitwidths, pinwidths=None):
         self.typ = typ
         assert len(headers) == len(bitwidths)
         self.headers = headers
         self.bitwidths = bitwidths
+        # widths of the harness pins, i.e. how many bits logisim prints (Time Step is a 32 bit pin)
+        self.pinwidths = pinwidths or bitwidths
 
     def validate(self, values):
         if not (len(values) == len(self.bitwidths)):
@@ -34,18 +47,147 @@ class OutputFormat:
             if not (values[i] < 2**self.bitwidths[i]):
                 raise OutputFormatException("incorrect bitwidth in item {0} of {1}".format(i, values))
 
+    def format_row(self, values):
+        return '\t'.join(bin_string(v, w) for v, w in zip(values, self.pinwidths))
+
     def header(self, wtr):
         wtr.writerow(self.headers)
 
+class Block(object):
+    """
+        Consecutive decoded rows: values holds them row after row, one entry per column.
+    """
+
+    def __init__(self, values, columns, first=0):
+        self.values = values
+        self.columns = columns
+        self.first = first
+
+    def __len__(self):
+        return len(self.values) // self.columns
+
+    def row(self, i):
+        return list(self.values[i * self.columns:(i + 1) * self.columns])
+
+    def rows(self):
+        for i in range(len(self)):
+            yield self.row(i)
+
+    def column(self, c):
+        return self.values[c::self.columns]
+
+def parse_row(line, oformat):
+    """
+        Decodes a single line of -tty table output.
+    """
+    values_bin = [''.join(v.split(' ')) for v in line.split('\t')]
+    try:
+        values = [int(v, 2) for v in values_bin]
+    except ValueError:
+        raise OutputFormatException("you have a non-integer in this list: {}".format(values_bin))
+    oformat.validate(values)
+    return values
+
+def decode_block(text, oformat, first=0):
+    """
+        Decodes complete lines of -tty table output into a Block, checking the width of each column for
+        the whole block at once.  Errors name the row (counting from 0) they were found in.
+    """
+    columns = len(oformat.bitwidths)
+    if max(oformat.pinwidths) > 8 * array(WORD).itemsize:
+        raise OutputFormatException("{} has columns wider than the decoder handles".format(oformat.typ))
+    if not text:
+        return Block(array(WORD), columns, first)
+    rows = text.count('\n') + (0 if text.endswith('\n') else 1)
+    try:
+        values = _packed(text, oformat.pinwidths, rows)
+        if values is None:
+            fields = text.replace('\r', '').replace(' ', '').replace('\n', '\t').split('\t')
+            if text.endswith('\n'):
+                fields.pop()
+            if len(fields) != rows * columns:
+                raise ValueError
+            values = array(WORD, map(int, fields, [2] * len(fields)))
+        for c, width in enumerate(oformat.bitwidths):
+            if max(values[c::columns]) >> width:
+                raise ValueError
+    except (ValueError, OverflowError):
+        # something in the block is off; find the row the slow way to report it
+        for i, line in enumerate(text.split('\n')[:rows]):
+            try:
+                parse_row(line.rstrip('\r'), oformat)
+            except OutputFormatException as e:
+                raise OutputFormatException("row {}: {}".format(first + i, e))
+        raise
+    return Block(values, columns, first)
+
+def _packed(text, pinwidths, rows):
+    # Fast path for blocks where every pin fills an array item, laid out exactly the way Logisim
+    # prints them: with the tabs and newlines checked in place, the digits of the whole block are
+    # one big binary number whose bytes are the array.  Returns None when the layout doesn't match.
+    bits = 8 * array(WORD).itemsize
+    if set(pinwidths) != set([bits]):
+        return None
+    field = bits + (bits - 1) // 4
+    line = len(pinwidths) * (field + 1)
+    if len(text) != rows * line:
+        return None
+    for end in range(field, line, field + 1):
+        if text[end::line] != ('\n' if end == line - 1 else '\t') * rows:
+            return None
+    if not isinstance(text, bytes):
+        text = text.encode('latin-1')
+    digits = text.translate(None, b' \t\n')
+    if len(digits) != rows * len(pinwidths) * bits:
+        return None
+    data = binascii.unhexlify('%0*x' % (len(digits) // 4, int(digits, 2)))
+    values = array(WORD)
+    if hasattr(values, 'frombytes'):
+        values.frombytes(data)
+    else:
+        values.fromstring(data)
+    if sys.byteorder == 'little':
+        values.byteswap()
+    return values
+
+def read_chunks(f, size=CHUNK):
+    """
+        Yields the text of f in pieces of about size characters that end on a line boundary.
+    """
+    rest = ''
+    while True:
+        data = f.read(size)
+        if not data:
+            break
+        data = rest + data
+        cut = data.rfind('\n') + 1
+        rest = data[cut:]
+        if cut:
+            yield data[:cut]
+    if rest.strip():
+        yield rest
+
+def decode_stream(f, oformat, size=CHUNK):
+    """
+        Yields Blocks for all of the -tty table output read from f.
+    """
+    first = 0
+    for text in read_chunks(f, size):
+        block = decode_block(text, oformat, first)
+        first += len(block)
+        yield block
+
 def get_test_format(typ):
     if typ == 'alu':
         return OutputFormat('alu', ["Test #", "OF", "Eq", "Result"], [8,1,1,32])  
     elif typ == 'regfile':
         return OutputFormat('regfile', ["Test #", "$s0 Value", "$s1 Value", "$s2 Value", "$ra Value", "$sp Value", "Read Data 1", "Read Data 2"], [8, 32, 32, 32, 32, 32, 32, 32])
     elif typ == 'cpu':
-       return OutputFormat('cpu',  ['$s0 Value', '$s1 Value', '$s2 Value', '$ra Value', '$sp Value', 'Time Step', 'Fetch Addr', 'Instruction'], [32,32,32,32,32,8,32,32])
+       return OutputFormat('cpu',  ['$s0 Value', '$s1 Value', '$s2 Value', '$ra Value', '$sp Value', 'Time Step', 'Fetch Addr', 'Instruction'], [32,32,32,32,32,32,32,32], [32]*8)
+    elif typ == 'cpu-perf':
+        return OutputFormat('cpu-perf',  ['$s0 Value', '$s1 Value', '$s2 Value', '$ra Value', '$sp Value', 'Time Step', 'Fetch Addr', 'Instruction', 'Cycles', 'Retired', 'Taken', 'Mem Ops'], [32]*12, [32]*12)
     elif typ == 'cpu-lite':
-        return OutputFormat('cpu-lite',  ['$s0 Value', '$s1 Value', '$s2 Value', '$ra Value', '$sp Value', 'Time Step'], [32,32,32,32,32,8])
+        return OutputFormat('cpu-lite',  ['$s0 Value', '$s1 Value', '$s2 Value', '$ra Value', '$sp Value', 'Time Step'], [32]*6, [32]*6)
     elif typ == 'cpu-end':
         return OutputFormat('cpu-end',  ['$s0 Value', '$s1 Value', '$s2 Value', '$sp Value'], [32,32,32,32])
     else:
@@ -55,15 +197,30 @@ def main():
     if len(sys.argv) < 2:
         print_usage()
 
-    typ = sys.argv[1]
-    rdr = csv.reader(sys.stdin, delimiter='\t')
-    wtr = csv.writer(sys.stdout, delimiter='\t')
-    
-    if not headers(wtr, typ):
+    oformat = get_test_format(sys.argv[1])
+    if not oformat:
         print_usage()
+    inp = open(sys.argv[2]) if len(sys.argv) > 2 else sys.stdin
+    wtr = csv.writer(sys.stdout, delimiter='\t')
+    oformat.header(wtr)
 
-    for row in rdr:
-        wtr.writerow([bin2hex(b) for b in row])
+    end = wtr.dialect.lineterminator
+    row_format = '\t'.join('%0{}x'.format((w + 3) // 4) for w in oformat.pinwidths) + end
+    first = 0
+    try:
+        for text in read_chunks(inp):
+            if 'x' in text or 'E' in text:
+                # undefined or error values cannot go in an array; print those rows a field at a time
+                for line in text.splitlines():
+                    wtr.writerow([bin2hex(b) for b in line.split('\t')])
+                first += text.count('\n')
+                continue
+            block = decode_block(text, oformat, first)
+            first += len(block)
+            sys.stdout.write(row_format * len(block) % tuple(block.values))
+    except OutputFormatException as e:
+        sys.stdout.flush()
+        sys.exit("error: {}".format(e))
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,342 @@
+#!/usr/bin/env python
+"""
+    Differential fuzzing of cpu.circ against the instruction set model.
+
+        python fuzz.py --programs 2000 --jobs 8
+
+    Every program is random but well behaved: branch and jump targets are
+    instructions of the program, jr only goes through registers holding such
+    an address ($ra from jal, or $t9 set with la), and lw/sw use word aligned
+    addresses near 0.  Workers run each program on the CPU harness (the native
+    simulator by default, which compiles the harness once and swaps the ROM
+    per program; Logisim with --backend logisim) and compare the rows with
+    mipsmodel's.  The first failing programs are shrunk to a minimal
+    reproducer, printed as assembly and, with --save, written out as a .s file
+    and harness.  Throughput (programs/s and cycles/s) is reported as it goes.
+"""
+
+import argparse
+import multiprocessing
+import os
+import os.path
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import assembler
+import circsim
+import decode_out as dec
+import harnessgen
+import mipsmodel
+
+# registers a program computes with; $ra and $t9 are kept for jal and jr
+VISIBLE = ['$s0', '$s1', '$s2', '$sp']
+SCRATCH = ['$zero', '$t0', '$t1', '$t2']
+JR_REG = '$t9'
+
+R3 = ['add', 'addu', 'and', 'or', 'slt', 'sltu']
+SHIFTS = ['sll', 'srl', 'sra']
+SIGNED_IMM = ['addi', 'addiu', 'slti', 'sltiu']
+UNSIGNED_IMM = ['andi', 'ori']
+OPS = R3 + SHIFTS + SIGNED_IMM + UNSIGNED_IMM + ['lui', 'clz', 'lw', 'sw', 'beq', 'bne', 'j', 'jal', 'jr']
+
+IMM_CORNERS = [0, 1, -1, 2, 0x7fff, -0x8000, 31, 32]
+MEM_WORDS = 64
+
+class Instr(object):
+    """
+        One instruction of a generated program; target is the index of the instruction
+        a branch, jump or la refers to.
+    """
+    __slots__ = ('op', 'regs', 'imm', 'target')
+
+    def __init__(self, op, regs=(), imm=None, target=None):
+        self.op = op
+        self.regs = tuple(regs)
+        self.imm = imm
+        self.target = target
+
+    def text(self):
+        args = list(self.regs)
+        if self.op in ('lw', 'sw'):
+            args.append('{}($zero)'.format(self.imm))
+        elif self.imm is not None:
+            args.append(str(self.imm))
+        if self.target is not None:
+            args.append('L{}'.format(self.target))
+        return '{} {}'.format(self.op, ', '.join(args)).strip()
+
+    def copy(self, **changes):
+        fields = dict((name, getattr(self, name)) for name in self.__slots__)
+        fields.update(changes)
+        return Instr(**fields)
+
+def source(program):
+    """
+        Assembly for a program (a list of Instrs); every instruction gets a label.
+    """
+    lines = ['L{}: {}'.format(i, instr.text()) for i, instr in enumerate(program)]
+    return '\n'.join(lines + ['L{}:'.format(len(program))]) + '\n'
+
+def words(program):
+    return assembler.assemble(source(program), '<fuzz>').text
+
+def _imm(rng, signed):
+    if rng.random() < 0.3:
+        v = rng.choice(IMM_CORNERS)
+        return v if signed else v & 0xffff
+    return rng.randint(-0x8000, 0x7fff) if signed else rng.randint(0, 0xffff)
+
+def generate(rng, length, ops=OPS):
+    """
+        A random program of about length instructions using ops.
+    """
+    program = []
+    dest = lambda: rng.choice(VISIBLE + SCRATCH[1:])
+    src = lambda: rng.choice(VISIBLE + SCRATCH + ['$ra'])
+    while len(program) < length:
+        op = rng.choice(ops)
+        target = rng.randrange(length)
+        if op in R3:
+            program.append(Instr(op, (dest(), src(), src())))
+        elif op in SHIFTS:
+            program.append(Instr(op, (dest(), src()), rng.randrange(32)))
+        elif op in SIGNED_IMM or op in UNSIGNED_IMM:
+            program.append(Instr(op, (dest(), src()), _imm(rng, op in SIGNED_IMM)))
+        elif op == 'lui':
+            program.append(Instr(op, (dest(),), _imm(rng, False)))
+        elif op == 'clz':
+            program.append(Instr(op, (dest(), src())))
+        elif op == 'lw':
+            program.append(Instr(op, (dest(),), 4 * rng.randrange(MEM_WORDS)))
+        elif op == 'sw':
+            program.append(Instr(op, (src(),), 4 * rng.randrange(MEM_WORDS)))
+        elif op in ('beq', 'bne'):
+            program.append(Instr(op, (src(), src()), target=target))
+        elif op in ('j', 'jal'):
+            program.append(Instr(op, target=target))
+        elif op == 'jr':
+            if rng.random() < 0.5:
+                program.append(Instr('la', (JR_REG,), target=target))
+                program.append(Instr('jr', (JR_REG,)))
+            else:
+                program.append(Instr('jr', ('$ra',)))
+    return program[:length]
+
+def without(program, start, stop):
+    """
+        program minus instructions start..stop-1, with targets moved to the instruction that
+        now follows the removed ones.
+    """
+    n = stop - start
+    kept = program[:start] + program[stop:]
+    moved = lambda t: t if t < start else (start if t < stop else t - n)
+    return [i.copy(target=moved(i.target)) if i.target is not None else i for i in kept]
+
+# --- running -----------------------------------------------------------------
+
+class Runner(object):
+    """
+        Runs programs on a CPU harness made from template, for cycles time steps, and
+        compares them with the model.  check() returns None or (row, student, expected).
+    """
+
+    def __init__(self, template, cycles, backend='native', timing='single', jar='logisim.jar'):
+        self.cycles = cycles
+        self.backend = backend
+        self.timing = timing
+        self.jar = os.path.abspath(jar)
+        self.workdir = tempfile.mkdtemp(prefix='cpu-fuzz-')
+        self.template = harnessgen.Template(template)
+        self.oformat = dec.get_test_format('cpu')
+        # the native backend compiles this harness once and swaps its ROM per program
+        self.harness, _ = harnessgen.generate(self.template, 'fuzz', [0], halt=cycles - 1, outdir=self.workdir)
+
+    def close(self):
+        shutil.rmtree(self.workdir, True)
+
+    def expected(self, text):
+        return list(mipsmodel.trace(mipsmodel.simulate(text, timing=self.timing), 'cpu', self.cycles - 1))
+
+    def student(self, text):
+        if self.backend == 'native':
+            sim = circsim.Simulation(self.harness, rom=text)
+            rows = []
+            for values in sim.rows():
+                rows.append(values)
+                if len(rows) >= self.cycles:
+                    break
+            return rows
+        harness, _ = harnessgen.generate(self.template, 'fuzz', text, halt=self.cycles - 1, outdir=self.workdir)
+        proc = subprocess.Popen(['java', '-jar', self.jar, '-tty', 'table', harness],
+                                stdin=open(os.devnull), stdout=subprocess.PIPE, universal_newlines=True)
+        try:
+            return [dec.parse_row(line.rstrip('\n'), self.oformat) for line, _ in zip(proc.stdout, range(self.cycles))]
+        finally:
+            if proc.poll() is None:
+                proc.terminate()
+            proc.stdout.close()
+            proc.wait()
+
+    def check(self, program):
+        text = words(program)
+        expected = self.expected(text)
+        try:
+            student = self.student(text)
+        except (circsim.CircuitException, dec.OutputFormatException) as e:
+            return (0, str(e), expected[0])
+        for row, (s, e) in enumerate(zip(student, expected)):
+            if s != e:
+                return (row, s, e)
+        if len(student) != len(expected):
+            return (min(len(student), len(expected)), student[len(expected):len(expected) + 1], expected[len(student):len(student) + 1])
+        return None
+
+def shrink(runner, program, deadline=None):
+    """
+        The smallest program found that still fails: removes ever smaller runs of
+        instructions, then simplifies immediates.
+    """
+    fails = lambda p: runner.check(p) is not None
+    chunk = max(1, len(program) // 2)
+    while chunk >= 1:
+        i = 0
+        changed = False
+        while i < len(program):
+            if deadline is not None and time.time() > deadline:
+                return program
+            candidate = without(program, i, min(len(program), i + chunk))
+            if candidate and fails(candidate):
+                program = candidate
+                changed = True
+            else:
+                i += chunk
+        if not changed:
+            chunk //= 2
+    for i, instr in enumerate(program):
+        if instr.imm is None or instr.op in ('lw', 'sw'):
+            continue
+        for simpler in (0, 1):
+            if abs(instr.imm) <= simpler:
+                break
+            candidate = program[:i] + [instr.copy(imm=simpler)] + program[i + 1:]
+            if fails(candidate):
+                program = candidate
+                break
+    return program
+
+# --- campaign ----------------------------------------------------------------
+
+_runner = None
+
+def _init_worker(args):
+    global _runner
+    _runner = Runner(*args)
+    multiprocessing.util.Finalize(None, _runner.close, exitpriority=10)
+
+def _fuzz_one(job):
+    seed, length, ops = job
+    program = generate(random.Random(seed), length, ops)
+    return seed, _runner.check(program)
+
+def campaign(programs, length, cycles, jobs=1, seed=0, ops=OPS, runner_args=(), report=None):
+    """
+        Yields (seed, program, failure) for every failing program; report(count, elapsed) is
+        called now and then with the number of programs checked so far.
+    """
+    jobs_list = ((seed + i, length, ops) for i in range(programs))
+    args = (runner_args[0], cycles) + tuple(runner_args[1:])
+    start = time.time()
+    last = start
+    if jobs <= 1:
+        _init_worker(args)
+        results = (_fuzz_one(job) for job in jobs_list)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(jobs, _init_worker, (args,))
+        results = pool.imap_unordered(_fuzz_one, jobs_list, 16)
+    try:
+        for count, (s, failure) in enumerate(results, 1):
+            if failure is not None:
+                yield s, generate(random.Random(s), length, ops), failure
+            if report is not None and time.time() - last >= 2:
+                last = time.time()
+                report(count, last - start)
+        if report is not None:
+            report(programs, time.time() - start)
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+def _row_text(oformat, row):
+    if isinstance(row, str):
+        return row
+    return '\t'.join('{:x}'.format(v) for v in row)
+
+def main():
+    parser = argparse.ArgumentParser(description="Fuzzes cpu.circ with random programs against the instruction set model.")
+    parser.add_argument('--programs', type=int, default=1000, help="programs to run (default: %(default)s)")
+    parser.add_argument('--length', type=int, default=24, help="instructions per program (default: %(default)s)")
+    parser.add_argument('--cycles', type=int, default=48, help="time steps to compare per program (default: %(default)s)")
+    parser.add_argument('-j', '--jobs', type=int, default=multiprocessing.cpu_count(), help="worker processes (default: number of cores)")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the first program; program i uses seed + i")
+    parser.add_argument('--ops', help="comma separated instructions to use (default: all of them)")
+    parser.add_argument('--template', default=harnessgen.DEFAULT_TEMPLATE, help="CPU harness to run the programs in")
+    parser.add_argument('--backend', choices=['native', 'logisim'], default='native')
+    parser.add_argument('--timing', choices=sorted(mipsmodel.TIMINGS), default='single', help="timing model of the reference")
+    parser.add_argument('--shrink', type=int, default=1, help="failing programs to shrink (default: %(default)s)")
+    parser.add_argument('--save', help="directory for the shrunk reproducers (.s and harness)")
+    args = parser.parse_args()
+
+    ops = args.ops.split(',') if args.ops else OPS
+    unknown = set(ops) - set(OPS)
+    if unknown:
+        sys.exit("unknown instructions: {}".format(', '.join(sorted(unknown))))
+    runner_args = (args.template, args.backend, args.timing)
+
+    def report(count, elapsed):
+        elapsed = max(elapsed, 1e-9)
+        sys.stderr.write("{} programs, {} failing: {:.1f} programs/s, {:.0f} cycles/s\n".format(
+            count, len(failures), count / elapsed, count * args.cycles / elapsed))
+
+    failures = []
+    for seed, program, failure in campaign(args.programs, args.length, args.cycles, args.jobs, args.seed,
+                                           ops, runner_args, report):
+        failures.append((seed, program, failure))
+
+    if not failures:
+        print("no differences in {} programs".format(args.programs))
+        return
+    print("{} of {} programs differ from the model (seeds {})".format(
+        len(failures), args.programs, ', '.join(str(s) for s, p, f in sorted(failures)[:20])))
+
+    runner = Runner(args.template, args.cycles, args.backend, args.timing)
+    oformat = dec.get_test_format('cpu')
+    try:
+        for seed, program, failure in sorted(failures)[:args.shrink]:
+            small = shrink(runner, program)
+            row, student, expected = runner.check(small)
+            print("")
+            print("seed {}: {} instructions shrunk to {}, first differing row {}".format(seed, len(program), len(small), row))
+            sys.stdout.write(source(small))
+            print("Format is student then expected")
+            print('\t'.join(oformat.headers))
+            print(_row_text(oformat, student))
+            print(_row_text(oformat, expected))
+            if args.save:
+                if not os.path.isdir(args.save):
+                    os.makedirs(args.save)
+                name = 'fuzz-{}'.format(seed)
+                with open(os.path.join(args.save, name + '.s'), 'w') as f:
+                    f.write(source(small))
+                harnessgen.generate(runner.template, name, words(small), halt=args.cycles - 1, outdir=args.save)
+    finally:
+        runner.close()
+    sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+"""
+    Generates CPU test harnesses from a template harness, the way
+    and-test.circ, beq-test.circ, ... were made by hand from
+    CPU-starter_kit_test.circ: the program goes into the ROM contents and the
+    halt constant is set to the last time step.
+
+        python harnessgen.py --outdir generated prog1.s prog2.s ...
+
+    Programs are .s files (assembled with assembler.py) or .text.hex images.
+    A program with data also gets a RAM image, <name>.load.hex, since Logisim
+    does not keep RAM contents in the circuit file; test.py hands it to the
+    simulation (-load) when the TestCase names it.
+
+    The template is scanned once; every harness after that is a handful of
+    string joins, so thousands of harnesses take a moment.
+
+    The RAM image is word addressed, like mem.circ (byte address >> 2), so
+    .data, at byte 0x2000, starts at word 0x800.  --check runs every harness
+    on mipsmodel.py loaded the way test.py loads it (the ROM of the circuit,
+    the RAM image next to it) and fails a program that does not end with $s0
+    equal to $s1: self-checking programs like ../lw-data-test.s load a .data
+    word through a label into $s0 and put the value it must have in $s1.
+
+        python harnessgen.py --check --outdir /tmp ../lw-data-test.s
+"""
+
+import argparse
+import os
+import os.path
+import re
+import sys
+
+import assembler
+import memimage
+import mipsmodel
+
+DEFAULT_TEMPLATE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'CPU-starter_kit_test.circ')
+
+_rom_re = re.compile(r'<comp lib="\d+" loc="[^"]*" name="ROM">.*?<a name="contents">(addr/data: (\d+) (\d+)\s*.*?)</a>', re.S)
+_halt_re = re.compile(r'<comp lib="\d+" loc="[^"]*" name="Constant">\s*<a name="width" val="32"/>\s*<a name="value" val="(0x[0-9a-fA-F]+)"/>')
+_lib_re = re.compile(r'<lib desc="file#([^"]+)"')
+
+class HarnessException(Exception):
+    pass
+
+class Template(object):
+    """
+        A harness split around the parts that change: the ROM contents, the halt
+        constant and the paths of the file libraries.
+    """
+
+    def __init__(self, path=DEFAULT_TEMPLATE):
+        self.path = os.path.abspath(path)
+        with open(path) as f:
+            xml = f.read()
+        rom = [m for m in _rom_re.finditer(xml) if m.group(3) == '32']
+        if not rom:
+            raise HarnessException("{} has no 32 bit ROM".format(path))
+        self.addr_bits = int(rom[0].group(2))
+        halt = _halt_re.search(xml)
+        if not halt:
+            raise HarnessException("{} has no halt constant".format(path))
+        spans = [(rom[0].start(1), rom[0].end(1), 'rom'), (halt.start(1), halt.end(1), 'halt')]
+        spans += [(m.start(1), m.end(1), m.group(1)) for m in _lib_re.finditer(xml)]
+        self.pieces = []
+        pos = 0
+        for start, end, what in sorted(spans):
+            self.pieces.append(xml[pos:start])
+            self.pieces.append(what)
+            pos = end
+        self.pieces.append(xml[pos:])
+        self._libs = {}
+
+    def _lib_paths(self, outdir):
+        # library paths as seen from outdir
+        outdir = os.path.abspath(outdir)
+        if outdir not in self._libs:
+            tdir = os.path.dirname(self.path)
+            self._libs[outdir] = dict((p, os.path.relpath(os.path.join(tdir, p), outdir).replace(os.sep, '/'))
+                                      for p in self.pieces[1::2] if p not in ('rom', 'halt'))
+        return self._libs[outdir]
+
+    def render(self, text, halt, outdir='.'):
+        """
+            The harness XML for program words text, halting at time step halt, to be saved in outdir.
+        """
+        if len(text) > 1 << self.addr_bits:
+            raise HarnessException("program does not fit the {} bit ROM".format(self.addr_bits))
+        fill = {'rom': memimage.contents(text, self.addr_bits, 32), 'halt': '0x{:x}'.format(halt)}
+        fill.update(self._lib_paths(outdir))
+        out = []
+        for i, piece in enumerate(self.pieces):
+            out.append(fill[piece] if i % 2 else piece)
+        return ''.join(out)
+
+def read_program(path):
+    """
+        (text words, data memimage.Image or None) of a .s file or a .text.hex image; a .text.hex
+        image brings along the .data.hex next to it, if there is one.
+    """
+    if path.endswith('.hex'):
+        text = list(mipsmodel.read_image(path))
+        data_path = path[:-len('.text.hex')] + '.data.hex' if path.endswith('.text.hex') else None
+        data = mipsmodel.read_image(data_path) if data_path and os.path.exists(data_path) else None
+        return text, data
+    with open(path) as f:
+        program = assembler.assemble(f.read(), path)
+    return program.text, memimage.Image.from_words(program.data, assembler.DATA_BASE >> 2) if program.data else None
+
+def run_model(circfile, image=None):
+    """
+        The registers at the halt step of a harness run on the model, from the files a test
+        runs: the ROM of circfile and the RAM image, if any.
+    """
+    data = mipsmodel.read_image(image) if image else None
+    machine = mipsmodel.Machine(mipsmodel.read_rom(circfile), data)
+    cycles = mipsmodel.SingleCycle(machine).cycles()
+    for _ in range(mipsmodel.halt_step(circfile)):
+        next(cycles)
+    return machine.regs
+
+def generate(template, name, text, data=None, halt=None, outdir='.'):
+    """
+        Writes outdir/name.circ (and outdir/name.load.hex when there is data); returns
+        (circuit path, RAM image path or None).  halt defaults to one step past the program,
+        as in CPU-starter_kit_test.circ.
+    """
+    if halt is None:
+        halt = len(text) + 1
+    circfile = os.path.join(outdir, name + '.circ')
+    with open(circfile, 'w') as f:
+        f.write(template.render(text, halt, outdir))
+    image = None
+    if data is not None and not memimage.blank(data):
+        image = os.path.join(outdir, name + '.load.hex')
+        with open(image, 'w') as f:
+            f.write(memimage.raw(data))
+    return circfile, image
+
+def main():
+    parser = argparse.ArgumentParser(description="Writes a CPU test harness for every program, from a template harness.")
+    parser.add_argument('programs', nargs='+', metavar='program', help=".s file or .text.hex image")
+    parser.add_argument('--template', default=DEFAULT_TEMPLATE, help="harness to copy (default: %(default)s)")
+    parser.add_argument('--outdir', default='.', help="where the harnesses go (default: %(default)s)")
+    parser.add_argument('--halt', type=int, help="time step to halt at (default: program length + 1)")
+    parser.add_argument('--check', action='store_true', help="run every harness on the model and check that it ends with $s0 equal to $s1")
+    args = parser.parse_args()
+
+    failed = 0
+
+    try:
+        template = Template(args.template)
+        if not os.path.isdir(args.outdir):
+            os.makedirs(args.outdir)
+        for path in args.programs:
+            name = os.path.basename(path)
+            for ext in ('.text.hex', '.s', '.asm'):
+                if name.endswith(ext):
+                    name = name[:-len(ext)]
+                    break
+            text, data = read_program(path)
+            circfile, image = generate(template, name, text, data, args.halt, args.outdir)
+            print(circfile + (' ' + image if image else ''))
+            if args.check:
+                regs = run_model(circfile, image)
+                if regs[16] != regs[17]:
+                    print("FAILED: {}: $s0 is 0x{:x}, $s1 0x{:x}".format(path, regs[16], regs[17]))
+                    failed += 1
+    except (HarnessException, assembler.AssemblerException, mipsmodel.ModelException, IOError, OSError) as e:
+        sys.exit(str(e))
+    if failed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
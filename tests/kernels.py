@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+"""
+    Runs the workload kernels of ../kernels on the CPU and reports how fast
+    the simulation runs them.
+
+        python kernels.py
+        python kernels.py --backend native sort matmul
+        python kernels.py --generate       # rewrite the expected end states
+
+    A kernel is a program in the supported subset that builds its input in
+    RAM, leaves its results in $s0..$s2 and ends in `end: j end`.
+    mipsmodel.py finds the time step it first fetches that jump; the kernel
+    goes into a harness made from CPU-perf_test.circ (harnessgen.py) halting
+    on that step, and is simulated with test.py's backend.  The last row is
+    its end state, which must equal reference_output/kernel-<name>.out: the
+    cpu-perf row the model gives for that step, written by --generate.
+
+    The Cycles and Retired counters of the last row are the cycles and
+    instructions the CPU ran; with the wall-clock time of the simulation they
+    give cycles/s and instructions/s.  Harnesses are written next to this
+    script (for the library paths) and removed afterwards.
+"""
+
+import argparse
+import glob
+import json
+import os
+import os.path
+import sys
+import time
+
+import assembler
+import circsim
+import decode_out as dec
+import harnessgen
+import mipsmodel
+import test
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+KERNEL_DIR = os.path.join(HERE, '..', 'kernels')
+REFERENCE_DIR = os.path.join(HERE, 'reference_output')
+TEMPLATE = os.path.join(HERE, 'CPU-perf_test.circ')
+FORMAT = 'cpu-perf'
+
+# a kernel that has not reached its end by then is taken to be stuck
+MAX_STEPS = 1 << 20
+
+class KernelException(Exception):
+    pass
+
+def jumps_to_itself(cycle):
+    word = cycle.instruction
+    return word >> 26 == 0x02 and (word & 0x3ffffff) << 2 == cycle.fetch_addr & 0x0fffffff
+
+class Kernel(object):
+    """
+        One program of the suite: its words and the time step it reaches its end.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.splitext(os.path.basename(path))[0]
+        with open(path) as f:
+            self.text = assembler.assemble(f.read(), path).text
+        self.halt = self._end_step()
+
+    def _end_step(self):
+        for cycle in mipsmodel.simulate(self.text):
+            if jumps_to_itself(cycle):
+                return cycle.step
+            if cycle.step >= MAX_STEPS:
+                break
+        raise KernelException("{} does not reach a jump to itself in {} time steps".format(self.name, MAX_STEPS))
+
+    @property
+    def reference(self):
+        return os.path.join(REFERENCE_DIR, 'kernel-{}.out'.format(self.name))
+
+    def end_state(self):
+        # the model's last row, on the step the harness halts on
+        return list(mipsmodel.trace(mipsmodel.simulate(self.text), FORMAT, self.halt))[-1]
+
+    def expected(self):
+        if not os.path.exists(self.reference):
+            raise KernelException("{} has no expected end state; run kernels.py --generate".format(self.name))
+        rows = list(test.ReferenceFileParser(dec.get_test_format(FORMAT), self.reference).outputs())
+        if len(rows) != 1:
+            raise KernelException("{} should hold one row, not {}".format(self.reference, len(rows)))
+        return rows[0]
+
+class Result(object):
+    def __init__(self, kernel, row, expected, seconds):
+        self.kernel = kernel
+        self.row = row
+        self.expected = expected
+        self.seconds = seconds
+        headers = dec.get_test_format(FORMAT).headers
+        self.cycles = row[headers.index('Cycles')] if row else 0
+        self.instructions = row[headers.index('Retired')] if row else 0
+
+    @property
+    def passed(self):
+        return self.row == self.expected
+
+    def rate(self, count):
+        return count / self.seconds if self.seconds else None
+
+    def differences(self):
+        # (column, got, expected) for every column of the end state that is off
+        if self.row is None:
+            return []
+        headers = dec.get_test_format(FORMAT).headers
+        return [(h, g, e) for h, g, e in zip(headers, self.row, self.expected) if g != e]
+
+    def as_dict(self):
+        return {'kernel': self.kernel.name, 'passed': self.passed, 'halt': self.kernel.halt,
+                'cycles': self.cycles, 'instructions': self.instructions, 'seconds': self.seconds,
+                'cycles_per_sec': self.rate(self.cycles), 'instructions_per_sec': self.rate(self.instructions)}
+
+def find_kernels(names=None):
+    paths = sorted(glob.glob(os.path.join(KERNEL_DIR, '*.s')))
+    if names:
+        by_name = dict((os.path.splitext(os.path.basename(p))[0], p) for p in paths)
+        missing = [n for n in names if n not in by_name]
+        if missing:
+            raise KernelException("no kernel called {} in {}".format(', '.join(missing), KERNEL_DIR))
+        paths = [by_name[n] for n in names]
+    return [Kernel(p) for p in paths]
+
+def generate(kernel):
+    oformat = dec.get_test_format(FORMAT)
+    with open(kernel.reference, 'w') as f:
+        f.write(oformat.format_row(kernel.end_state()) + '\n')
+    return kernel.reference
+
+def run(kernel, template):
+    """
+        Simulates the kernel in its own harness; returns its Result.
+    """
+    expected = kernel.expected()
+    circfile, _ = harnessgen.generate(template, 'kernel-' + kernel.name, kernel.text, None, kernel.halt, HERE)
+    try:
+        parser = test.OutputProvider(dec.get_test_format(FORMAT))
+        start = time.time()
+        student_out, stop = test.start_simulation(circfile)
+        try:
+            last = None
+            for line in iter(student_out.readline, ''):
+                if line.strip():
+                    last = line
+        finally:
+            stop()
+        seconds = time.time() - start
+        row = parser.parse_line(last.rstrip()) if last is not None else None
+    finally:
+        os.remove(circfile)
+    return Result(kernel, row, expected, seconds)
+
+def report(results, out=sys.stdout):
+    out.write("{:<10} {:>10} {:>10} {:>9} {:>12} {:>12}\n".format('kernel', 'cycles', 'instrs', 'seconds', 'cycles/s', 'instrs/s'))
+    for r in results:
+        out.write("{:<10} {:>10} {:>10} {:>9.3f} {:>12.1f} {:>12.1f}{}\n".format(
+            r.kernel.name, r.cycles, r.instructions, r.seconds, r.rate(r.cycles) or 0, r.rate(r.instructions) or 0,
+            '' if r.passed else '  (FAILED)'))
+    for r in results:
+        if r.row is None:
+            out.write("{}: the simulation gave no rows\n".format(r.kernel.name))
+        for column, got, want in r.differences():
+            out.write("{}: {} is 0x{:x}, expected 0x{:x}\n".format(r.kernel.name, column, got, want))
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs the workload kernels on the CPU and reports cycles and instructions per second.")
+    parser.add_argument('kernels', nargs='*', metavar='kernel', help="kernels to run, by name (default: all of ../kernels)")
+    parser.add_argument('--backend', choices=['auto', 'logisim', 'native'], default=os.environ.get('LOGISIM_BACKEND', 'auto'))
+    parser.add_argument('--generate', action='store_true', help="write the expected end states from the model instead")
+    parser.add_argument('--json', action='store_true', help="print the results as JSON")
+    args = parser.parse_args()
+    os.environ['LOGISIM_BACKEND'] = args.backend
+
+    try:
+        kernels = find_kernels(args.kernels)
+        if args.generate:
+            for kernel in kernels:
+                print("{}: halts on time step {}".format(generate(kernel), kernel.halt))
+            return
+        template = harnessgen.Template(TEMPLATE)
+        results = [run(kernel, template) for kernel in kernels]
+    except (KernelException, harnessgen.HarnessException, assembler.AssemblerException,
+            mipsmodel.ModelException, circsim.CircuitException, dec.OutputFormatException, IOError, OSError) as e:
+        sys.exit(str(e))
+    if args.json:
+        json.dump([r.as_dict() for r in results], sys.stdout, indent=1, sort_keys=True)
+        sys.stdout.write('\n')
+    else:
+        report(results)
+    if not all(r.passed for r in results):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
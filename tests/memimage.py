@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+"""
+    Sparse memory images: words at word addresses, kept as runs of literal
+    words and count*value fills instead of one entry per word.
+
+        python memimage.py prog.s.data.hex             # rewrite the image in sparse form
+        python memimage.py --stats prog.s.data.hex
+        python memimage.py --rom and-test.circ and-test.s.text.hex
+
+    Logisim reads count*value tokens both in "v2.0 raw" images and in the
+    contents attribute of a ROM, so the 2048 filler words mars-assem.sh puts
+    in front of the data segment are the one token 2048*0, and the zeros
+    MARS dumps after the data collapse the same way.  Parsing an image never
+    expands a fill: the model and circsim.py take the nonzero words from
+    used(), and indexing an Image finds its run by bisection.
+
+    --rom writes the image into the 32 bit ROM of a harness, as the
+    contents attribute Logisim itself would save.
+"""
+
+import argparse
+import array
+import bisect
+import re
+import sys
+
+# identical words from which a run is written as count*value, as Logisim does
+RUN = 4
+
+class ImageException(Exception):
+    pass
+
+class Image(object):
+    """
+        Words from address 0 to len(image) - 1, zero where no run covers them.  A run is
+        (start, count, value) for a fill or (start, count, array of words) for literal words.
+    """
+
+    def __init__(self):
+        self.starts = []
+        self.runs = []
+        self.end = 0
+
+    @classmethod
+    def from_words(cls, words, base=0):
+        """
+            The image of words at addresses base.., with runs of RUN or more identical words as fills.
+        """
+        image = cls()
+        words = list(words)
+        i = 0
+        while i < len(words):
+            j = i
+            while j < len(words) and words[j] == words[i]:
+                j += 1
+            if j - i >= RUN:
+                image.fill(base + i, j - i, words[i])
+            else:
+                image.extend(base + i, words[i:j])
+            i = j
+        return image
+
+    @classmethod
+    def parse(cls, text):
+        # hex words, with count*word for runs
+        image = cls()
+        literal = []
+        for tok in text.split():
+            try:
+                if '*' in tok:
+                    image.extend(image.end, literal)
+                    literal = []
+                    n, w = tok.split('*')
+                    image.fill(image.end, int(n), int(w, 16))
+                else:
+                    literal.append(int(tok, 16))
+            except ValueError:
+                raise ImageException("bad image word {}".format(tok))
+        image.extend(image.end, literal)
+        return image
+
+    def _append(self, start, count, value):
+        if start < self.end:
+            raise ImageException("run at {} overlaps the image, which ends at {}".format(start, self.end))
+        self.starts.append(start)
+        self.runs.append((start, count, value))
+        self.end = start + count
+
+    def fill(self, start, count, value):
+        if count > 0:
+            self._append(start, count, value & 0xffffffff)
+        else:
+            # a 0*value token still takes no room
+            self.end = max(self.end, start)
+
+    def extend(self, start, words):
+        """
+            Adds literal words at start, which must not be before the end of the image.
+        """
+        if not words:
+            return
+        if self.runs and start == self.end and isinstance(self.runs[-1][2], array.array):
+            last_start, count, literal = self.runs.pop()
+            literal.extend(words)
+            self.runs.append((last_start, count + len(words), literal))
+            self.end += len(words)
+        else:
+            self._append(start, len(words), array.array('I', words))
+
+    def __len__(self):
+        return self.end
+
+    def __getitem__(self, addr):
+        i = bisect.bisect_right(self.starts, addr) - 1
+        if i < 0 or addr < 0:
+            return 0
+        start, count, value = self.runs[i]
+        if addr >= start + count:
+            return 0
+        return value[addr - start] if isinstance(value, array.array) else value
+
+    def __iter__(self):
+        # every word, zeros between the runs included
+        addr = 0
+        for start, count, value in self.runs:
+            for _ in range(start - addr):
+                yield 0
+            if isinstance(value, array.array):
+                for w in value:
+                    yield w
+            else:
+                for _ in range(count):
+                    yield value
+            addr = start + count
+
+    def used(self):
+        # (address, value) for every nonzero word, in address order
+        for start, count, value in self.runs:
+            if isinstance(value, array.array):
+                for i, w in enumerate(value):
+                    if w:
+                        yield (start + i, w)
+            elif value:
+                for addr in range(start, start + count):
+                    yield (addr, value)
+
+    def _spans(self):
+        # (count, value) covering the image in order, equal neighbours merged
+        spans = []
+        def add(count, value):
+            if spans and spans[-1][1] == value:
+                spans[-1][0] += count
+            elif count:
+                spans.append([count, value])
+        addr = 0
+        for start, count, value in self.runs:
+            add(start - addr, 0)
+            if isinstance(value, array.array):
+                for w in value:
+                    add(1, w)
+            else:
+                add(count, value)
+            addr = start + count
+        return spans
+
+    def tokens(self):
+        """
+            The image as count*value and hex word tokens, trailing zeros left out.
+        """
+        spans = self._spans()
+        if spans and not spans[-1][1]:
+            spans.pop()
+        tokens = []
+        for count, value in spans:
+            if count >= RUN:
+                tokens.append('{}*{:x}'.format(count, value))
+            else:
+                tokens.extend(['{:x}'.format(value)] * count)
+        return tokens
+
+    def raw(self):
+        # a "v2.0 raw" image, one token to a line
+        return 'v2.0 raw\n' + ''.join(tok + '\n' for tok in self.tokens())
+
+    def contents(self, addr_bits=24, data_bits=32):
+        """
+            A memory contents attribute as Logisim writes it: eight tokens to a line.
+        """
+        if self.end > 1 << addr_bits and any(addr >> addr_bits for addr, _ in self.used()):
+            raise ImageException("image does not fit {} address bits".format(addr_bits))
+        tokens = self.tokens()
+        lines = [' '.join(tokens[k:k + 8]) for k in range(0, len(tokens), 8)]
+        return 'addr/data: {} {}\n'.format(addr_bits, data_bits) + ''.join(line + '\n' for line in lines)
+
+def image_of(words):
+    return words if isinstance(words, Image) else Image.from_words(words)
+
+def used(words):
+    """
+        (address, value) for every nonzero word of an Image or a list of words.
+    """
+    if isinstance(words, Image):
+        return words.used()
+    return ((addr, w) for addr, w in enumerate(words) if w)
+
+def blank(words):
+    # no nonzero word at all
+    return next(iter(used(words)), None) is None
+
+def contents(words, addr_bits=24, data_bits=32):
+    return image_of(words).contents(addr_bits, data_bits)
+
+def raw(words):
+    return image_of(words).raw()
+
+def read(path):
+    """
+        The Image of a "v2.0 raw" file, as given to logisim -load.
+    """
+    with open(path) as f:
+        if not f.readline().startswith('v2.0 raw'):
+            raise ImageException("{} is not a v2.0 raw image".format(path))
+        return Image.parse(f.read())
+
+_rom_re = re.compile(r'(<comp lib="\d+" loc="[^"]*" name="ROM">.*?<a name="contents">)addr/data: (\d+) (\d+)\s*.*?(</a>)', re.S)
+
+def write_rom(circfile, image):
+    """
+        Replaces the contents of the 32 bit ROM of a harness with image.
+    """
+    with open(circfile) as f:
+        xml = f.read()
+    for m in _rom_re.finditer(xml):
+        if m.group(3) == '32':
+            text = image.contents(int(m.group(2)), 32)
+            xml = xml[:m.start()] + m.group(1) + text + m.group(4) + xml[m.end():]
+            with open(circfile, 'w') as f:
+                f.write(xml)
+            return
+    raise ImageException("{} has no 32 bit ROM".format(circfile))
+
+def main():
+    parser = argparse.ArgumentParser(description="Rewrites v2.0 raw memory images in sparse form.")
+    parser.add_argument('images', nargs='+', metavar='image')
+    parser.add_argument('--stats', action='store_true', help="only print the words, nonzero words and runs of every image")
+    parser.add_argument('--rom', metavar='CIRC', help="write the (one) image into the 32 bit ROM of this harness instead")
+    args = parser.parse_args()
+
+    try:
+        if args.rom:
+            if len(args.images) != 1:
+                sys.exit("--rom takes one image")
+            write_rom(args.rom, read(args.images[0]))
+            return
+        for path in args.images:
+            image = read(path)
+            if args.stats:
+                print("{}: {} words, {} nonzero, {} runs".format(
+                    path, len(image), sum(1 for _ in image.used()), len(image.runs)))
+                continue
+            with open(path, 'w') as f:
+                f.write(image.raw())
+    except (ImageException, IOError) as e:
+        sys.exit(str(e))
+
+if __name__ == '__main__':
+    main()
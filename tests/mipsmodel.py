@@ -0,0 +1,493 @@
+#!/usr/bin/env python
+"""
+    Instruction set model of the MIPS subset cpu.circ implements, used to generate
+    expected traces instead of typing them into test.py by hand.
+
+    A program can be given as a test harness (.circ, the ROM contents are used) or
+    as a `v2.0 raw` image written by mars-assem.sh (.text.hex).  Rows come out in
+    the formats of decode_out.get_test_format, either as Python lists (for TestCase)
+    or as logisim -tty table text (for reference_output/).
+"""
+
+import argparse
+import array
+import re
+import sys
+
+import decode_out as dec
+import memimage
+
+MASK = 0xffffffff
+
+# word addresses are 24 bits wide in both the harness ROM and mem.circ's RAM
+ADDR_MASK = 0xffffff
+
+PAGE_BITS = 10
+PAGE_WORDS = 1 << PAGE_BITS
+
+REG_NAMES = ['zero', 'at', 'v0', 'v1', 'a0', 'a1', 'a2', 'a3',
+             't0', 't1', 't2', 't3', 't4', 't5', 't6', 't7',
+             's0', 's1', 's2', 's3', 's4', 's5', 's6', 's7',
+             't8', 't9', 'k0', 'k1', 'gp', 'sp', 'fp', 'ra']
+
+S0, S1, S2, SP, RA = 16, 17, 18, 29, 31
+
+R_FUNCTS = {0x00: 'sll', 0x02: 'srl', 0x03: 'sra', 0x08: 'jr',
+            0x20: 'add', 0x21: 'addu', 0x24: 'and', 0x25: 'or',
+            0x2a: 'slt', 0x2b: 'sltu'}
+
+OPCODES = {0x02: 'j', 0x03: 'jal', 0x04: 'beq', 0x05: 'bne',
+           0x08: 'addi', 0x09: 'addiu', 0x0a: 'slti', 0x0b: 'sltiu',
+           0x0c: 'andi', 0x0d: 'ori', 0x0f: 'lui',
+           0x23: 'lw', 0x2b: 'sw'}
+
+SPECIAL2 = 0x1c
+CLZ_FUNCT = 0x20
+
+class ModelException(Exception):
+    pass
+
+class Instruction(object):
+    __slots__ = ('word', 'op', 'rs', 'rt', 'rd', 'shamt', 'imm', 'target')
+
+    def __init__(self, word):
+        self.word = word
+        opcode = word >> 26
+        self.rs = (word >> 21) & 0x1f
+        self.rt = (word >> 16) & 0x1f
+        self.rd = (word >> 11) & 0x1f
+        self.shamt = (word >> 6) & 0x1f
+        self.imm = word & 0xffff
+        self.target = word & 0x3ffffff
+        if opcode == 0:
+            self.op = R_FUNCTS.get(word & 0x3f)
+        elif opcode == SPECIAL2 and word & 0x3f == CLZ_FUNCT:
+            self.op = 'clz'
+        else:
+            self.op = OPCODES.get(opcode)
+        if self.op is None:
+            raise ModelException("unsupported instruction {:08x}".format(word))
+
+    def __str__(self):
+        r = lambda n: '$' + REG_NAMES[n]
+        simm = sign_extend(self.imm)
+        if self.op in ('sll', 'srl', 'sra'):
+            return "{} {}, {}, {}".format(self.op, r(self.rd), r(self.rt), self.shamt)
+        if self.op == 'jr':
+            return "jr {}".format(r(self.rs))
+        if self.op == 'clz':
+            return "clz {}, {}".format(r(self.rd), r(self.rs))
+        if self.op in R_FUNCTS.values():
+            return "{} {}, {}, {}".format(self.op, r(self.rd), r(self.rs), r(self.rt))
+        if self.op in ('j', 'jal'):
+            return "{} 0x{:x}".format(self.op, self.target << 2)
+        if self.op in ('beq', 'bne'):
+            return "{} {}, {}, {}".format(self.op, r(self.rs), r(self.rt), simm)
+        if self.op == 'lui':
+            return "lui {}, 0x{:x}".format(r(self.rt), self.imm)
+        if self.op in ('lw', 'sw'):
+            return "{} {}, {}({})".format(self.op, r(self.rt), simm, r(self.rs))
+        if self.op in ('andi', 'ori'):
+            return "{} {}, {}, 0x{:x}".format(self.op, r(self.rt), r(self.rs), self.imm)
+        return "{} {}, {}, {}".format(self.op, r(self.rt), r(self.rs), simm)
+
+def sign_extend(imm):
+    return imm - 0x10000 if imm & 0x8000 else imm
+
+def signed(v):
+    return v - 0x100000000 if v & 0x80000000 else v
+
+def clz(v):
+    return 32 - len("{:b}".format(v)) if v else 32
+
+class Memory(object):
+    """
+        Word-addressed memory, allocated in small array-backed pages as it is touched.
+    """
+
+    def __init__(self, words=None):
+        self.pages = {}
+        if words is not None:
+            self.load(words)
+
+    def load(self, words, base=0):
+        # words is a list or a memimage.Image, whose fills are never expanded
+        for i, w in memimage.used(words):
+            self[base + i] = w
+
+    def __getitem__(self, addr):
+        addr &= ADDR_MASK
+        page = self.pages.get(addr >> PAGE_BITS)
+        return page[addr & (PAGE_WORDS - 1)] if page is not None else 0
+
+    def __setitem__(self, addr, value):
+        addr &= ADDR_MASK
+        page = self.pages.get(addr >> PAGE_BITS)
+        if page is None:
+            page = self.pages[addr >> PAGE_BITS] = array.array('I', [0]) * PAGE_WORDS
+        page[addr & (PAGE_WORDS - 1)] = value
+
+    def used(self):
+        # (word address, value) for every nonzero word, in address order
+        for p in sorted(self.pages):
+            for i, w in enumerate(self.pages[p]):
+                if w:
+                    yield ((p << PAGE_BITS) | i, w)
+
+class Retired(object):
+    """
+        What one executed instruction did: where it was, where control went and
+        which data word (if any) it read or wrote.
+    """
+    __slots__ = ('pc', 'inst', 'next_pc', 'taken', 'mem_addr', 'mem_write')
+
+    def __init__(self, pc, inst, next_pc, taken, mem_addr=None, mem_write=False):
+        self.pc = pc
+        self.inst = inst
+        self.next_pc = next_pc
+        self.taken = taken
+        self.mem_addr = mem_addr
+        self.mem_write = mem_write
+
+class Machine(object):
+    """
+        Architectural state (PC, register file, instruction ROM and data RAM) plus
+        the semantics of every supported instruction.  link is what jal adds to
+        its own address for $ra: 4 without a branch delay slot, 8 with one.
+    """
+
+    def __init__(self, text, data=None, link=4):
+        self.rom = Memory(text)
+        self.ram = Memory(data)
+        self.regs = array.array('I', [0]) * 32
+        self.pc = 0
+        self.link = link
+        self._decoded = {}
+
+    def fetch(self, pc):
+        return self.rom[pc >> 2]
+
+    def decode(self, pc):
+        word = self.fetch(pc)
+        inst = self._decoded.get(word)
+        if inst is None:
+            inst = self._decoded[word] = Instruction(word)
+        return inst
+
+    def execute(self, pc):
+        """
+            Executes the instruction at pc and returns a Retired record; the PC
+            register itself is left to the timing model.
+        """
+        inst = self.decode(pc)
+        regs = self.regs
+        op = inst.op
+        rs = regs[inst.rs]
+        rt = regs[inst.rt]
+        seq = (pc + 4) & MASK
+        dest = None
+        value = 0
+
+        if op == 'sll':
+            dest, value = inst.rd, (rt << inst.shamt) & MASK
+        elif op == 'srl':
+            dest, value = inst.rd, rt >> inst.shamt
+        elif op == 'sra':
+            dest, value = inst.rd, (signed(rt) >> inst.shamt) & MASK
+        elif op in ('add', 'addu'):
+            dest, value = inst.rd, (rs + rt) & MASK
+        elif op == 'and':
+            dest, value = inst.rd, rs & rt
+        elif op == 'or':
+            dest, value = inst.rd, rs | rt
+        elif op == 'slt':
+            dest, value = inst.rd, int(signed(rs) < signed(rt))
+        elif op == 'sltu':
+            dest, value = inst.rd, int(rs < rt)
+        elif op == 'clz':
+            dest, value = inst.rd, clz(rs)
+        elif op in ('addi', 'addiu'):
+            dest, value = inst.rt, (rs + sign_extend(inst.imm)) & MASK
+        elif op == 'slti':
+            dest, value = inst.rt, int(signed(rs) < sign_extend(inst.imm))
+        elif op == 'sltiu':
+            dest, value = inst.rt, int(rs < (sign_extend(inst.imm) & MASK))
+        elif op == 'andi':
+            dest, value = inst.rt, rs & inst.imm
+        elif op == 'ori':
+            dest, value = inst.rt, rs | inst.imm
+        elif op == 'lui':
+            dest, value = inst.rt, inst.imm << 16
+        elif op == 'lw':
+            addr = (rs + sign_extend(inst.imm)) & MASK
+            self._write(inst.rt, self.ram[addr >> 2])
+            return Retired(pc, inst, seq, False, addr)
+        elif op == 'sw':
+            addr = (rs + sign_extend(inst.imm)) & MASK
+            self.ram[addr >> 2] = rt
+            return Retired(pc, inst, seq, False, addr, True)
+        elif op in ('beq', 'bne'):
+            if (rs == rt) == (op == 'beq'):
+                return Retired(pc, inst, (seq + (sign_extend(inst.imm) << 2)) & MASK, True)
+            return Retired(pc, inst, seq, False)
+        elif op in ('j', 'jal'):
+            if op == 'jal':
+                self._write(RA, (pc + self.link) & MASK)
+            return Retired(pc, inst, (seq & 0xf0000000) | (inst.target << 2), True)
+        elif op == 'jr':
+            return Retired(pc, inst, rs, True)
+
+        self._write(dest, value)
+        return Retired(pc, inst, seq, False)
+
+    def resolve(self, pc):
+        """
+            Where the instruction at pc sends control on the registers as they are now, without
+            executing it: for resolving transfers in the fetch stage.
+        """
+        inst = self.decode(pc)
+        op = inst.op
+        regs = self.regs
+        seq = (pc + 4) & MASK
+        if op in ('beq', 'bne'):
+            if (regs[inst.rs] == regs[inst.rt]) == (op == 'beq'):
+                return (seq + (sign_extend(inst.imm) << 2)) & MASK
+        elif op in ('j', 'jal'):
+            return (seq & 0xf0000000) | (inst.target << 2)
+        elif op == 'jr':
+            return regs[inst.rs]
+        return seq
+
+    def _write(self, reg, value):
+        if reg:
+            self.regs[reg] = value
+
+class Cycle(object):
+    """
+        One clock cycle as the harness sees it: the register values on the debug
+        outputs, the fetch address and fetched word, and the instruction (if any)
+        that completed at the end of the cycle.
+    """
+    __slots__ = ('step', 'regs', 'fetch_addr', 'instruction', 'retired')
+
+    def __init__(self, step, regs, fetch_addr, instruction, retired):
+        self.step = step
+        self.regs = regs
+        self.fetch_addr = fetch_addr
+        self.instruction = instruction
+        self.retired = retired
+
+class SingleCycle(object):
+    """
+        Timing of the single-cycle datapath: the instruction fetched in a cycle
+        completes at the end of that cycle.
+    """
+    link = 4
+
+    def __init__(self, machine):
+        self.m = machine
+
+    def cycles(self):
+        m = self.m
+        step = 0
+        while True:
+            regs = m.regs[:]
+            pc = m.pc
+            r = m.execute(pc)
+            m.pc = r.next_pc
+            yield Cycle(step, regs, pc, r.inst.word, r)
+            step += 1
+
+class TwoStage(object):
+    """
+        Timing of the 2-stage (fetch | execute) pipeline: an instruction executes
+        in the cycle after its fetch, so its result shows up one row later than on
+        the single-cycle datapath, and control transfers resolve in the execute
+        stage.  With delay_slot (the MIPS convention) the instruction fetched
+        behind a taken branch or jump still executes; without it, it is squashed.
+
+        With early, branches and jumps resolve in the fetch stage instead: the
+        comparison of beq/bne and the target of jr read the registers with the
+        result of the instruction in the execute stage forwarded, so the next
+        fetch is already the right one and nothing is squashed.  There is no
+        delay slot then.
+    """
+
+    def __init__(self, machine, delay_slot=True, early=False):
+        self.m = machine
+        self.early = early
+        self.delay_slot = delay_slot and not early
+
+    @property
+    def link(self):
+        return 8 if self.delay_slot else 4
+
+    def cycles(self):
+        m = self.m
+        step = 0
+        pending = None
+        while True:
+            regs = m.regs[:]
+            pc = m.pc
+            word = m.fetch(pc)
+            r = m.execute(pending) if pending is not None else None
+            if self.early:
+                # after execute, so the registers hold the forwarded result
+                m.pc = m.resolve(pc)
+                pending = pc
+            elif r is not None and r.taken:
+                m.pc = r.next_pc
+                pending = pc if self.delay_slot else None
+            else:
+                m.pc = (pc + 4) & MASK
+                pending = pc
+            yield Cycle(step, regs, pc, word, r)
+            step += 1
+
+TIMINGS = {'single': SingleCycle, 'pipeline': TwoStage}
+
+def simulate(text, data=None, timing='single', **kwargs):
+    """
+        Returns an endless iterator of Cycles for the program (lists of words).
+    """
+    model = TIMINGS[timing]
+    machine = Machine(text, data)
+    sim = model(machine, **kwargs)
+    machine.link = sim.link
+    return sim.cycles()
+
+class Counters(object):
+    """
+        The performance counters of cpu.circ (cycles, retired, taken, mem ops): values
+        are their outputs during a cycle, count() advances them past it.
+    """
+
+    def __init__(self):
+        self.values = [0, 0, 0, 0]
+
+    def count(self, cycle):
+        v = self.values
+        r = cycle.retired
+        v[0] += 1
+        # the hardware counts every cycle that fetches a nonzero word
+        v[1] += cycle.instruction != 0
+        if r is not None:
+            v[2] += r.next_pc != (r.pc + 4) & MASK
+            v[3] += r.mem_addr is not None
+        for i in range(len(v)):
+            v[i] &= MASK
+
+def row(cycle, typ, counters=None):
+    regs = cycle.regs
+    if typ == 'cpu-perf':
+        return row(cycle, 'cpu') + counters.values
+    if typ == 'cpu':
+        return [regs[S0], regs[S1], regs[S2], regs[RA], regs[SP], cycle.step, cycle.fetch_addr, cycle.instruction]
+    if typ == 'cpu-lite':
+        return [regs[S0], regs[S1], regs[S2], regs[RA], regs[SP], cycle.step]
+    if typ == 'cpu-end':
+        return [regs[S0], regs[S1], regs[S2], regs[SP]]
+    raise ModelException("no CPU trace format called [{}]".format(typ))
+
+def trace(cycles, typ, steps):
+    """
+        Rows of the given output format for time steps 0..steps (the step the
+        harness halts on).  Like logisim -tty table, a row is only emitted when
+        it differs from the previous one.
+    """
+    prev = None
+    counters = Counters() if typ == 'cpu-perf' else None
+    for cycle in cycles:
+        if cycle.step > steps:
+            return
+        values = row(cycle, typ, counters)
+        if values != prev:
+            yield values
+        prev = values
+        if counters is not None:
+            counters.count(cycle)
+
+def expected_trace(program, typ='cpu', steps=None, data=None, timing='single', **kwargs):
+    """
+        Expected rows for a TestCase: program is a harness .circ or a .hex image.
+        steps defaults to the halt constant of the harness (or the program length).
+    """
+    text = load_program(program)
+    if steps is None:
+        steps = halt_step(program) if program.endswith('.circ') else None
+    if steps is None:
+        steps = len(text) + 1
+    if data is not None and not isinstance(data, (list, memimage.Image)):
+        data = read_image(data)
+    return list(trace(simulate(text, data, timing, **kwargs), typ, steps))
+
+_contents_re = re.compile(r'<comp lib="\d+" loc="[^"]*" name="ROM">.*?<a name="contents">addr/data: (\d+) (\d+)\s*(.*?)</a>', re.S)
+_halt_re = re.compile(r'<comp lib="\d+" loc="[^"]*" name="Constant">\s*<a name="width" val="32"/>\s*<a name="value" val="(0x[0-9a-fA-F]+)"/>')
+
+def parse_words(text):
+    # logisim memory contents / v2.0 raw images: hex words, with N*word for runs
+    try:
+        return list(memimage.Image.parse(text))
+    except memimage.ImageException as e:
+        raise ModelException(str(e))
+
+def read_image(path):
+    """
+        The memimage.Image of a v2.0 raw image; list() it for the words.
+    """
+    try:
+        return memimage.read(path)
+    except memimage.ImageException as e:
+        raise ModelException(str(e))
+
+def read_rom(circfile):
+    # program ROM of a CPU harness: the ROM with 32 bit data
+    with open(circfile) as f:
+        xml = f.read()
+    for addr_bits, data_bits, contents in _contents_re.findall(xml):
+        if data_bits == '32':
+            return parse_words(contents)
+    raise ModelException("{} has no 32 bit ROM".format(circfile))
+
+def halt_step(circfile):
+    with open(circfile) as f:
+        m = _halt_re.search(f.read())
+    return int(m.group(1), 16) if m else None
+
+def load_program(program):
+    if isinstance(program, list):
+        return program
+    if program.endswith('.circ'):
+        return read_rom(program)
+    return list(read_image(program))
+
+def main():
+    parser = argparse.ArgumentParser(description="Generates expected CPU traces with the instruction set model.")
+    parser.add_argument('program', help="harness .circ (its ROM is used) or v2.0 raw .text.hex image")
+    parser.add_argument('--data', help="v2.0 raw data image (.data.hex)")
+    parser.add_argument('--format', default='cpu', choices=['cpu', 'cpu-lite', 'cpu-end', 'cpu-perf'])
+    parser.add_argument('--timing', default='single', choices=sorted(TIMINGS))
+    parser.add_argument('--no-delay-slot', action='store_true', help="squash the instruction behind a taken branch (pipeline timing)")
+    parser.add_argument('--early', action='store_true', help="resolve branches and jumps in the fetch stage, with forwarding (pipeline timing)")
+    parser.add_argument('--steps', type=int, help="last time step to emit (default: the harness halt step)")
+    parser.add_argument('--python', action='store_true', help="print rows as a Python list for test.py instead of logisim output")
+    args = parser.parse_args()
+
+    kwargs = {}
+    if args.timing == 'pipeline':
+        kwargs['delay_slot'] = not args.no_delay_slot
+        kwargs['early'] = args.early
+    try:
+        rows = expected_trace(args.program, args.format, args.steps, args.data, args.timing, **kwargs)
+    except (ModelException, IOError) as e:
+        sys.exit(str(e))
+
+    oformat = dec.get_test_format(args.format)
+    if args.python:
+        print('[' + ',\n '.join('[' + ', '.join('0x{:x}'.format(v) for v in r) + ']' for r in rows) + ']')
+    else:
+        for r in rows:
+            print(oformat.format_row(r))
+
+if __name__ == '__main__':
+    main()
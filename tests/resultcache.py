@@ -0,0 +1,219 @@
+"""
+    On-disk cache of test results for test.py.
+
+    A result is stored under a key built from everything that can change it:
+    the test type and expected output, the simulator (logisim.jar, or
+    circsim.py for the native backend), and the test circuit, which is hashed
+    one subcircuit at a time.  Only the circuits reachable from the main
+    circuit count, each as normalized XML (attribute order, component order
+    and whitespace don't matter), together with the circuits and jars it uses
+    from its libraries.  Editing a subcircuit of cpu.circ therefore only
+    reruns the tests whose circuits use it.
+
+    The cache lives in $LOGISIM_TEST_CACHE (default: a directory in /tmp)
+    and the least recently used results are evicted past DEFAULT_LIMIT bytes.
+"""
+
+import hashlib
+import json
+import os
+import os.path
+import tempfile
+import xml.etree.ElementTree as ET
+
+DEFAULT_LIMIT = 4 << 20
+
+def default_dir():
+    return os.environ.get('LOGISIM_TEST_CACHE',
+                          os.path.join(tempfile.gettempdir(), 'logisim-test-cache-{}'.format(os.getuid())))
+
+def file_digest(path):
+    h = hashlib.sha1()
+    try:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 16), b''):
+                h.update(chunk)
+    except IOError:
+        return 'missing:' + path
+    return h.hexdigest()
+
+def _normalized(elt):
+    # canonical text of an element: sorted attributes, stripped text, children in sorted order
+    children = sorted(_normalized(child) for child in elt)
+    attrs = ' '.join('{}={!r}'.format(k, v) for k, v in sorted(elt.attrib.items()))
+    return '<{} {}>{}{}</{}>'.format(elt.tag, attrs, (elt.text or '').strip(), ''.join(children), elt.tag)
+
+class _CircFile(object):
+    def __init__(self, path):
+        self.path = path
+        self.root = ET.parse(path).getroot()
+        self.circuits = dict((c.get('name'), c) for c in self.root.findall('circuit'))
+        self.libs = dict((lib.get('name'), lib.get('desc', '')) for lib in self.root.findall('lib'))
+        main = self.root.find('main')
+        self.main = main.get('name') if main is not None else None
+        options = self.root.find('options')
+        self.options = _normalized(options) if options is not None else ''
+
+    def library(self, lib):
+        # (kind, path) for a lib number: kind is 'file', 'jar' or '' for Logisim's own libraries
+        desc = self.libs.get(lib, '')
+        kind, _, name = desc.partition('#')
+        if kind not in ('file', 'jar'):
+            return '', None
+        path = os.path.join(os.path.dirname(self.path), name)
+        if not os.path.exists(path):
+            # Logisim also looks for a missing library next to the file
+            path = os.path.join(os.path.dirname(self.path), os.path.basename(name))
+        return kind, os.path.abspath(path)
+
+class CircuitHasher(object):
+    """
+        Digests of circuits, memoized per (file, circuit).
+    """
+
+    def __init__(self):
+        self.files = {}
+        self.digests = {}
+
+    def _file(self, path):
+        if path not in self.files:
+            self.files[path] = _CircFile(path)
+        return self.files[path]
+
+    def circuit(self, path, name=None):
+        """
+            Digest of a circuit (the main one by default) and everything it uses.
+        """
+        path = os.path.abspath(path)
+        try:
+            circ = self._file(path)
+        except (IOError, ET.ParseError):
+            return file_digest(path)
+        name = name if name is not None else circ.main
+        key = (path, name)
+        if key in self.digests:
+            return self.digests[key]
+        # guards against a circuit that (wrongly) contains itself
+        self.digests[key] = 'recursive:{}:{}'.format(path, name)
+        elt = circ.circuits.get(name)
+        h = hashlib.sha1()
+        if elt is None:
+            h.update('missing circuit {}'.format(name).encode('utf-8'))
+        else:
+            h.update(_normalized(elt).encode('utf-8'))
+            for dep in sorted(set(self._uses(circ, elt))):
+                h.update(dep.encode('utf-8'))
+        digest = h.hexdigest()
+        self.digests[key] = digest
+        return digest
+
+    def _uses(self, circ, elt):
+        for comp in elt.findall('comp'):
+            lib, name = comp.get('lib'), comp.get('name')
+            if lib is None:
+                if name in circ.circuits:
+                    yield self.circuit(circ.path, name)
+                continue
+            kind, path = circ.library(lib)
+            if kind == 'file':
+                yield self.circuit(path, name)
+            elif kind == 'jar':
+                yield file_digest(path)
+
+    def project(self, path):
+        """
+            Digest of a circuit file as a simulation: its main circuit plus its simulation options.
+        """
+        h = hashlib.sha1(self.circuit(path).encode('utf-8'))
+        try:
+            h.update(self._file(os.path.abspath(path)).options.encode('utf-8'))
+        except (IOError, ET.ParseError):
+            pass
+        return h.hexdigest()
+
+class DiskCache(object):
+    """
+        JSON entries stored one file per key in directory; the least recently used ones are
+        evicted once the directory holds more than limit bytes.
+    """
+
+    def __init__(self, directory, limit=DEFAULT_LIMIT):
+        self.directory = directory
+        self.limit = limit
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.json')
+
+    def load(self, key):
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+            os.utime(path, None)
+        except (IOError, OSError, ValueError):
+            return None
+        return entry
+
+    def store(self, key, entry):
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(entry, f)
+            os.rename(tmp, self._path(key))
+            self.evict()
+        except (IOError, OSError):
+            # a cache that cannot be written only costs time
+            pass
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.json'):
+                st = os.stat(os.path.join(self.directory, name))
+                entries.append((st.st_mtime, st.st_size, name))
+        total = sum(size for mtime, size, name in entries)
+        for mtime, size, name in sorted(entries):
+            if total <= self.limit:
+                break
+            os.remove(os.path.join(self.directory, name))
+            total -= size
+
+class ResultCache(DiskCache):
+    """
+        Test results: get() returns (passed, reason, output) or None.
+    """
+
+    def __init__(self, directory=None, limit=DEFAULT_LIMIT):
+        DiskCache.__init__(self, directory or default_dir(), limit)
+        self.hasher = CircuitHasher()
+
+    def key(self, circfile, expected, typ, simulator, load=None, extra=None):
+        """
+            expected is the list of rows or the reference file; simulator the files the simulation runs on;
+            load the RAM image, if any; extra any other setting of the test that decides its result.
+        """
+        h = hashlib.sha1()
+        h.update(typ.encode('utf-8'))
+        h.update(self.hasher.project(circfile).encode('utf-8'))
+        if isinstance(expected, list):
+            h.update(repr([[int(v) for v in row] for row in expected]).encode('utf-8'))
+        else:
+            h.update(file_digest(expected).encode('utf-8'))
+        for path in simulator:
+            h.update(file_digest(path).encode('utf-8'))
+        if load is not None:
+            h.update(b'load' + file_digest(load).encode('utf-8'))
+        if extra is not None:
+            h.update(b'extra' + extra.encode('utf-8'))
+        return h.hexdigest()
+
+    def get(self, key):
+        entry = self.load(key)
+        if entry is None:
+            return None
+        return (entry['passed'], entry['reason'], entry['output'])
+
+    def put(self, key, passed, reason, output):
+        self.store(key, {'passed': passed, 'reason': reason, 'output': output})
@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+"""
+    Long-lived Logisim simulation server.
+
+    test.py normally starts a fresh JVM (and reloads every .circ library) for every
+    TestCase.  Run this once in the background:
+
+        python simserver.py &
+
+    and test.py will send its jobs over a Unix socket instead.  The server keeps a
+    spare, already started Logisim process for every circuit it has seen, so the
+    JVM startup and the library loading happen off the critical path; a spare is
+    only handed out if none of the files it loaded changed since it was started.
+"""
+
+import argparse
+import json
+import os
+import os.path
+import re
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+DEFAULT_SPARES = 32
+
+def default_socket():
+    return os.environ.get('LOGISIM_SERVER_SOCKET',
+                          '/tmp/logisim-simserver-{}.sock'.format(os.getuid()))
+
+_lib_re = re.compile(r'<lib desc="(file|jar)#([^"#]+)')
+
+def dependencies(circfile):
+    """
+        Returns the circuit file plus every .circ and .jar library it (transitively) loads.
+    """
+    seen = []
+    todo = [os.path.abspath(circfile)]
+    while todo:
+        path = todo.pop()
+        if path in seen:
+            continue
+        seen.append(path)
+        if not path.endswith('.circ') or not os.path.exists(path):
+            continue
+        with open(path) as f:
+            for kind, lib in _lib_re.findall(f.read()):
+                todo.append(os.path.abspath(os.path.join(os.path.dirname(path), lib)))
+    return seen
+
+def signature(files):
+    sig = []
+    for path in files:
+        try:
+            st = os.stat(path)
+            sig.append((path, st.st_mtime, st.st_size))
+        except OSError:
+            sig.append((path, None, None))
+    return tuple(sig)
+
+def start_logisim(jar, circfile):
+    return subprocess.Popen(["java", "-jar", jar, "-tty", "table", circfile],
+                            cwd=os.path.dirname(circfile),
+                            stdin=open(os.devnull),
+                            stdout=subprocess.PIPE,
+                            universal_newlines=True)
+
+def stop_logisim(proc):
+    if proc.poll() is None:
+        try:
+            os.kill(proc.pid, signal.SIGTERM)
+        except OSError:
+            pass
+    proc.stdout.close()
+    proc.wait()
+
+class Spare(object):
+    def __init__(self, jar, circfile):
+        self.files = dependencies(circfile) + [jar]
+        self.sig = signature(self.files)
+        self.started = time.time()
+        self.proc = start_logisim(jar, circfile)
+
+    def fresh(self):
+        return signature(self.files) == self.sig
+
+class SparePool(object):
+    """
+        Keeps at most one started-but-unread Logisim process per (jar, circuit).
+    """
+
+    def __init__(self, limit=DEFAULT_SPARES):
+        self.limit = limit
+        self.spares = {}
+        self.lock = threading.Lock()
+
+    def take(self, jar, circfile):
+        with self.lock:
+            spare = self.spares.pop((jar, circfile), None)
+        if spare is not None and not spare.fresh():
+            stop_logisim(spare.proc)
+            spare = None
+        if spare is None:
+            spare = Spare(jar, circfile)
+        return spare.proc
+
+    def replenish(self, jar, circfile):
+        key = (jar, circfile)
+        with self.lock:
+            if key in self.spares:
+                return
+        try:
+            spare = Spare(jar, circfile)
+        except OSError:
+            return
+        evicted = []
+        with self.lock:
+            if key in self.spares:
+                evicted.append(spare)
+            else:
+                self.spares[key] = spare
+            while len(self.spares) > self.limit:
+                oldest = min(self.spares, key=lambda k: self.spares[k].started)
+                evicted.append(self.spares.pop(oldest))
+        for s in evicted:
+            stop_logisim(s.proc)
+
+    def close(self):
+        with self.lock:
+            spares, self.spares = list(self.spares.values()), {}
+        for s in spares:
+            stop_logisim(s.proc)
+
+class JobHandler(socketserver.StreamRequestHandler):
+    """
+        One request per connection: a JSON line of the form
+            {"circ": <abs path>, "jar": <abs path>, "rows": <int or null>}
+        or  {"warm": [<abs path>, ...], "jar": <abs path>}
+        answered by "ok" (or "error: ...") and then the raw -tty table rows.
+    """
+
+    def handle(self):
+        try:
+            job = json.loads(self.rfile.readline().decode('utf-8'))
+            jar = job['jar']
+            if 'warm' in job:
+                self.reply("ok")
+                for circfile in job['warm']:
+                    self.server.pool.replenish(jar, circfile)
+                return
+            circfile, rows = job['circ'], job.get('rows')
+        except (ValueError, KeyError, TypeError) as e:
+            self.reply("error: bad request ({})".format(e))
+            return
+
+        try:
+            proc = self.server.pool.take(jar, circfile)
+        except OSError as e:
+            self.reply("error: cannot start logisim ({})".format(e))
+            return
+        try:
+            self.reply("ok")
+            count = 0
+            while rows is None or count < rows:
+                line = proc.stdout.readline()
+                if not line:
+                    break
+                self.wfile.write(line.encode('utf-8'))
+                count += 1
+            self.wfile.flush()
+        except socket.error:
+            pass
+        finally:
+            stop_logisim(proc)
+            self.server.pool.replenish(jar, circfile)
+
+    def reply(self, msg):
+        try:
+            self.wfile.write((msg + '\n').encode('utf-8'))
+            self.wfile.flush()
+        except socket.error:
+            pass
+
+class SimulationServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, spares=DEFAULT_SPARES):
+        socketserver.UnixStreamServer.__init__(self, path, JobHandler)
+        self.pool = SparePool(spares)
+
+def _connect(path):
+    if not os.path.exists(path):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except socket.error:
+        sock.close()
+        return None
+    return sock
+
+def _request(job, path=None):
+    sock = _connect(path or default_socket())
+    if sock is None:
+        return None
+    try:
+        sock.sendall((json.dumps(job) + '\n').encode('utf-8'))
+        stream = sock.makefile('r')
+        status = stream.readline().rstrip('\n')
+    except socket.error:
+        sock.close()
+        return None
+    sock.close()
+    if status != 'ok':
+        stream.close()
+        return None
+    return stream
+
+def open_run(circfile, jar, rows=None, path=None):
+    """
+        Asks a running server to simulate circfile, returning a file object with the
+        table rows, or None if no server is available (the caller should run Logisim itself).
+    """
+    return _request({'circ': os.path.abspath(circfile), 'jar': os.path.abspath(jar), 'rows': rows}, path)
+
+def warm(circfiles, jar, path=None):
+    """
+        Asks a running server to start spare Logisim processes for circfiles ahead of time.
+    """
+    stream = _request({'warm': [os.path.abspath(c) for c in circfiles], 'jar': os.path.abspath(jar)}, path)
+    if stream is None:
+        return False
+    stream.close()
+    return True
+
+def main():
+    parser = argparse.ArgumentParser(description="Serves Logisim -tty table runs over a Unix socket.")
+    parser.add_argument('--socket', default=default_socket(), help="socket path (default: %(default)s)")
+    parser.add_argument('--spares', type=int, default=DEFAULT_SPARES,
+                        help="maximum number of pre-started Logisim processes (default: %(default)s)")
+    args = parser.parse_args()
+
+    if os.path.exists(args.socket):
+        probe = _connect(args.socket)
+        if probe is not None:
+            probe.close()
+            sys.exit("a server is already listening on {}".format(args.socket))
+        os.unlink(args.socket)
+
+    server = SimulationServer(args.socket, args.spares)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print("Listening on {}".format(args.socket))
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        server.pool.close()
+        server.server_close()
+        os.unlink(args.socket)
+
+if __name__ == '__main__':
+    main()
@@ -9,9 +9,26 @@ import signal
 import re
 import sys
 import shutil
+import types
+import hashlib
 import decode_out as dec
+import simserver
+import circsim
+import tracefile
+import resultcache
 import csv
+import json
 import abc
+import argparse
+import multiprocessing
+import multiprocessing.util
+import collections
+import itertools
+import mipsmodel
+import batch
+import vcd
+from StringIO import StringIO
+from distutils.spawn import find_executable
 
 #file_locations = os.path.expanduser(os.getcwd())
 file_locations = '.'
@@ -22,44 +39,77 @@ logisim_location = "logisim.jar"
 class TestCase():
   """
       Runs specified circuit file and compares output against the provided reference trace file.
+      load optionally names a v2.0 raw image for the RAM (logisim's -load), e.g. one written by harnessgen.py.
+      The first skip rows of the run are not compared, e.g. the preload stub of a checkpoint.py harness.
+      A profile passed to the call (a TestProfile, or anything with the same add() and row() methods)
+      is told how long each phase of the run took.
   """
 
-  def __init__(self, circfile, expected):
+  def __init__(self, circfile, expected, load=None, skip=0):
     self.circfile  = circfile
     self.expected = expected
+    self.load = load
+    self.skip = skip
 
-  def __call__(self, typ):
+  def cache_key(self, cache, typ, simulator):
+    return cache.key(self.circfile, self.expected, typ, simulator, self.load,
+                     "skip={}".format(self.skip) if self.skip else None)
+
+  def load_expected(self, oformat):
+    if not isinstance(self.expected, list):
+        # it is a file so parse it
+        self.expected = [x for x in ReferenceFileParser(oformat, self.expected).outputs()]
+    else:
+        [oformat.validate(x) for x in self.expected]
+    return self.expected
+
+  def __call__(self, typ, profile=None):
+    clock = time.time
+    started = clock()
     oformat = dec.get_test_format(typ)
     if not oformat:
         print "CANNOT format test type called [{}]".format(typ)
         return (False, "Error in the test")
 
     try:
-        if not isinstance(self.expected, list):
-            # it is a file so parse it
-            self.expected = [x for x in ReferenceFileParser(oformat, self.expected).outputs()]
-        else:
-            [oformat.validate(x) for x in self.expected]
+        self.load_expected(oformat)
     except dec.OutputFormatException as e:
         print "Error in formatting of expected output (check test.py if this is a test you wrote):"
         print "\t", e
         return (False, "Error in the test")
+    if profile is not None:
+      profile.add('expected', clock() - started)
 
     output = tempfile.TemporaryFile(mode='r+')
-    command = ["java","-jar",logisim_location,"-tty","table", self.circfile]
-    proc = subprocess.Popen(command,
-                            stdin=open(os.devnull),
-                            stdout=subprocess.PIPE)
     try:
+      spawned = clock()
+      student_out, stop = start_simulation(self.circfile, self.skip + len(self.expected), self.load)
+      if profile is not None:
+        profile.add('spawn', clock() - spawned)
+    except circsim.CircuitException as e:
+        print "The native simulator cannot run {}:".format(self.circfile)
+        print "\t", e
+        return (False, "Error in the test")
+    try:
+      skip_rows(student_out, self.skip)
       debug_buffer = [] 
-      passed = compare_unbounded(proc.stdout,self.expected, oformat, debug_buffer)
+      passed = compare_unbounded(student_out,self.expected, oformat, debug_buffer, profile)
     except dec.OutputFormatException as e:
         print "Error in formatting of Logisim output (check {}):".format(self.circfile)
         print "\t", e
         return (False, "Error in the test")
+    except circsim.ConflictException as e:
+        print "Wires driven by more than one component in {}:".format(self.circfile)
+        print "\t", e
+        return (False, "Did not match expected output (check {})".format(self.circfile))
+    except circsim.CycleLimitException as e:
+        return (False, "Did not match expected output: {} (check {})".format(e, self.circfile))
     finally:
-      if os.name != 'nt':
-        os.kill(proc.pid,signal.SIGTERM)
+      stopping = clock()
+      stop()
+      if profile is not None:
+        profile.add('stop', clock() - stopping)
+        profile.total = clock() - started
     if passed:
       return (True, "Matched expected output")
     else:
@@ -69,38 +119,521 @@ class TestCase():
       for row in debug_buffer:
         wtr.writerow(['{0:x}'.format(b) for b in row[0]])
         wtr.writerow(['{0:x}'.format(b) for b in row[1]])
+      path = write_vcd(self.circfile, oformat, debug_buffer)
+      if path:
+        print "Waveforms of the student and expected rows in {}".format(path)
 
       return (False, "Did not match expected output (check {}, also check test.py if this is a test you wrote)".format(self.circfile))
 
-def compare_unbounded(student_out, expected, oformat, debug):
+class TestTimeout(Exception):
+  pass
+
+class HaltCondition(object):
+  """
+      When a streaming run is over: once the fetch address has stayed the same for stable_rows rows
+      (a jump to itself), after the row fetching the sentinel instruction word, or after max_rows rows,
+      whichever comes first.  The first two need a format with a Fetch Addr column.
+  """
+
+  def __init__(self, stable_rows=None, sentinel=None, max_rows=100000):
+    self.stable_rows = stable_rows
+    self.sentinel = sentinel
+    self.max_rows = max_rows
+
+  def __repr__(self):
+    return "HaltCondition(stable_rows={}, sentinel={}, max_rows={})".format(self.stable_rows, self.sentinel, self.max_rows)
+
+  def checker(self, oformat):
+    """
+        A function of (row number, row) returning why the run is over after that row, or None.
+    """
+    if self.stable_rows is not None or self.sentinel is not None:
+      if 'Fetch Addr' not in oformat.headers:
+        raise dec.OutputFormatException("{} rows have no Fetch Addr to halt on".format(oformat.typ))
+      fetch = oformat.headers.index('Fetch Addr')
+      instruction = oformat.headers.index('Instruction')
+    state = {'addr': None, 'same': 0}
+
+    def check(i, row):
+      if self.stable_rows is not None:
+        state['same'] = state['same'] + 1 if row[fetch] == state['addr'] else 1
+        state['addr'] = row[fetch]
+        if state['same'] >= self.stable_rows:
+          return "the fetch address stayed at 0x{:x}".format(row[fetch])
+      if self.sentinel is not None and row[instruction] == self.sentinel:
+        return "the sentinel 0x{:08x} was fetched".format(self.sentinel)
+      if self.max_rows is not None and i + 1 >= self.max_rows:
+        return "the budget of {} rows ran out".format(self.max_rows)
+      return None
+    return check
+
+class StreamingTestCase(TestCase):
+  """
+      Runs a circuit until it halts, comparing the rows as they arrive, for programs whose runs are too long
+      to spell out.  expected is a reference file or a list as for TestCase, or None for the rows mipsmodel.py
+      produces from the harness ROM (with load, if given, as its data, and without the first skip rows), which
+      are made one at a time as the comparison needs them.  halt, a HaltCondition, says when the run is over; a run still going after timeout
+      seconds, or (natively) after max_cycles of its row budget, fails.  Only the last history rows are kept, to show when a row does not match.
+  """
+
+  def __init__(self, circfile, expected=None, halt=None, timeout=60, history=20, load=None, skip=0):
+    TestCase.__init__(self, circfile, expected, load, skip)
+    self.halt = halt or HaltCondition()
+    self.timeout = timeout
+    self.history = history
+
+  def cache_key(self, cache, typ, simulator):
+    # the model's rows follow from mipsmodel.py and the ROM, which is part of the circuit
+    expected = self.expected if self.expected is not None else os.path.splitext(mipsmodel.__file__)[0] + '.py'
+    return cache.key(self.circfile, expected, typ, simulator, self.load,
+                     "{!r} timeout={} skip={}".format(self.halt, self.timeout, self.skip))
+
+  def expected_rows(self, oformat):
+    if self.expected is None:
+      data = mipsmodel.read_image(self.load) if self.load else None
+      cycles = mipsmodel.simulate(mipsmodel.read_rom(self.circfile), data)
+      return itertools.islice(mipsmodel.trace(cycles, oformat.typ, sys.maxint), self.skip, None)
+    if isinstance(self.expected, list):
+      return iter(self.expected)
+    return ReferenceFileParser(oformat, self.expected).outputs()
+
+  def __call__(self, typ, profile=None):
+    clock = time.time
+    started = clock()
+    oformat = dec.get_test_format(typ)
+    if not oformat:
+        print "CANNOT format test type called [{}]".format(typ)
+        return (False, "Error in the test")
+    try:
+      expected = self.expected_rows(oformat)
+      halted = self.halt.checker(oformat)
+    except (dec.OutputFormatException, mipsmodel.ModelException, IOError) as e:
+      print "Cannot produce the expected output (check test.py if this is a test you wrote):"
+      print "\t", e
+      return (False, "Error in the test")
+    if profile is not None:
+      profile.add('expected', clock() - started)
+
+    try:
+      spawned = clock()
+      budget = self.halt.max_rows
+      student_out, stop = start_simulation(self.circfile, budget + self.skip if budget is not None else None, self.load)
+      if profile is not None:
+        profile.add('spawn', clock() - spawned)
+    except circsim.CircuitException as e:
+        print "The native simulator cannot run {}:".format(self.circfile)
+        print "\t", e
+        return (False, "Error in the test")
+    debug_buffer = collections.deque(maxlen=self.history)
+    alarm = self.timeout and hasattr(signal, 'setitimer')
+    if alarm:
+      # a simulation that stops printing rows would otherwise block readline for good
+      def expire(signum, frame):
+        raise TestTimeout()
+      previous = signal.signal(signal.SIGALRM, expire)
+      signal.setitimer(signal.ITIMER_REAL, self.timeout)
+    try:
+      deadline = started + self.timeout if self.timeout else None
+      skip_rows(student_out, self.skip)
+      passed, rows, note = compare_streaming(student_out, expected, oformat, halted, debug_buffer, deadline, profile)
+    except TestTimeout:
+      passed, rows, note = False, None, "timed out after {}s".format(self.timeout)
+    except circsim.CycleLimitException as e:
+      passed, rows, note = False, None, str(e)
+    except (dec.OutputFormatException, mipsmodel.ModelException) as e:
+        print "Error in formatting of Logisim output (check {}):".format(self.circfile)
+        print "\t", e
+        return (False, "Error in the test")
+    except circsim.ConflictException as e:
+        print "Wires driven by more than one component in {}:".format(self.circfile)
+        print "\t", e
+        return (False, "Did not match expected output (check {})".format(self.circfile))
+    finally:
+      if alarm:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+      stopping = clock()
+      stop()
+      if profile is not None:
+        profile.add('stop', clock() - stopping)
+        profile.total = clock() - started
+    if passed:
+      return (True, "Matched expected output for {} rows, until {}".format(rows, note))
+    if debug_buffer:
+      print "Format is student then expected (the last {} rows)".format(len(debug_buffer))
+      wtr = csv.writer(sys.stdout, delimiter='\t')
+      oformat.header(wtr)
+      for row in debug_buffer:
+        wtr.writerow(['{0:x}'.format(b) for b in row[0]])
+        wtr.writerow(['{0:x}'.format(b) for b in row[1]])
+      path = write_vcd(self.circfile, oformat, debug_buffer)
+      if path:
+        print "Waveforms of the student and expected rows in {}".format(path)
+    return (False, "Did not match expected output: {} (check {}, also check test.py if this is a test you wrote)".format(note, self.circfile))
+
+def vcd_dir():
+  # LOGISIM_VCD is set by --vcd, like LOGISIM_PROFILE
+  return os.environ.get('LOGISIM_VCD')
+
+def write_vcd(circfile, oformat, pairs):
+  """
+      Writes the (student, expected) rows of a failed test to <circuit>.vcd in the --vcd directory, one time
+      unit per row, for GTKWave; returns its path, or None without --vcd.
+  """
+  directory = vcd_dir()
+  if not directory or not pairs:
+    return None
+  path = os.path.join(directory, os.path.splitext(os.path.basename(circfile))[0] + '.vcd')
+  with open(path, 'w') as out:
+    writer = vcd.Writer(out, oformat, scopes=('student', 'expected'), comment="rows of {}, one time unit per row".format(circfile))
+    for i, (got, want) in enumerate(pairs):
+      writer.change(i, got, 0)
+      writer.change(i, want, 1)
+  return path
+
+def simulation_backend():
+  # LOGISIM_BACKEND is set by --backend (the environment also reaches the worker processes)
+  backend = os.environ.get('LOGISIM_BACKEND', 'auto')
+  if backend == 'auto':
+    backend = 'logisim' if find_executable('java') else 'native'
+  return backend
+
+def start_simulation(circfile, rows=None, load=None):
+  """
+      Starts a -tty table run of circfile and returns (output stream, function that stops the run).
+      The run goes through the simulation server (simserver.py) when one is listening, otherwise Logisim is started here.
+      With the native backend (the default when java is not installed) circsim.py simulates the circuit in Python instead;
+      a run of it that is not done after max_cycles(rows) clock cycles raises circsim.CycleLimitException on a read,
+      since its outputs may have stopped changing.  A Logisim run has no such bound.
+  """
+  if simulation_backend() == 'native':
+    stream = circsim.open_run(circfile, rows, load, max_cycles(rows))
+    return (stream, stream.close)
+
+  # the server's spare processes are started without a RAM image
+  stream = simserver.open_run(circfile, logisim_location, rows) if load is None else None
+  if stream is not None:
+    return (stream, stream.close)
+
+  command = ["java","-jar",logisim_location,"-tty","table", circfile]
+  if load is not None:
+    command[-1:-1] = ["-load", load]
+  proc = subprocess.Popen(command,
+                          stdin=open(os.devnull),
+                          stdout=subprocess.PIPE)
+  def stop():
+    if os.name != 'nt':
+      os.kill(proc.pid,signal.SIGTERM)
+  return (proc.stdout, stop)
+
+def max_cycles(rows):
+  # a cycle for every row wanted, and circsim.MAX_CYCLES to spare for the cycles that print none; no rows, no bound
+  return rows + circsim.MAX_CYCLES if rows is not None else None
+
+def skip_rows(student_out, rows):
+  for _ in range(rows):
+    student_out.readline()
+
+def compare_unbounded(student_out, expected, oformat, debug, profile=None):
   parser = OutputProvider(oformat)
+  clock = time.time
   for i in range(0, len(expected)):
+    t0 = clock()
     line1 = student_out.readline()
+    t1 = clock()
     values_student_parsed = parser.parse_line(line1.rstrip())
+    t2 = clock()
 
     debug.append((values_student_parsed, expected[i]))
+    matched = values_student_parsed == expected[i]
+    if profile is not None:
+      profile.row(t1 - t0, values_student_parsed)
+      profile.add('parse', t2 - t1)
+      profile.add('compare', clock() - t2)
 
-    if values_student_parsed != expected[i]:
+    if not matched:
       return False
 
   return True
 
-def run_tests(tests):
+def compare_streaming(student_out, expected, oformat, halted, debug, deadline=None, profile=None):
+  """
+      Compares rows until halted (a HaltCondition checker) says the run is over, either side runs out of rows,
+      or the deadline passes.  Returns (passed, rows compared, what ended the comparison); a simulation that
+      stops before halted fires, or a comparison of no rows at all, fails.  debug keeps the (student, expected)
+      pairs and should be bounded, e.g. a deque with a maxlen.
+  """
+  parser = OutputProvider(oformat)
+  clock = time.time
+  i = 0
+  for want in expected:
+    if deadline is not None and clock() > deadline:
+      raise TestTimeout()
+    t0 = clock()
+    line = student_out.readline()
+    t1 = clock()
+    if not line:
+      return (False, i, "the simulation stopped after {} rows, before the run was over".format(i))
+    got = parser.parse_line(line.rstrip())
+    t2 = clock()
+    oformat.validate(want)
+    debug.append((got, want))
+    matched = got == want
+    if profile is not None:
+      profile.row(t1 - t0, got)
+      profile.add('parse', t2 - t1)
+      profile.add('compare', clock() - t2)
+    if not matched:
+      return (False, i, "row {} differs".format(i))
+    i += 1
+    note = halted(i - 1, got)
+    if note is not None:
+      return (True, i, note)
+  if i == 0:
+    return (False, i, "there were no rows to compare")
+  return (True, i, "the expected output ended")
+
+class TestProfile(object):
+    """
+        Seconds spent in each phase of one TestCase run: building the expected rows, starting the
+        simulation (spawn), waiting for its first row, reading the other rows, parsing them
+        (OutputProvider.parse_line), comparing them and stopping the simulation.
+    """
+    PHASES = ('expected', 'spawn', 'first_row', 'read', 'parse', 'compare', 'stop')
+
+    def __init__(self):
+        self.phases = dict((phase, 0.0) for phase in self.PHASES)
+        # running totals only, so a long streaming run profiles in constant memory
+        self.rows = 0
+        self.read_max = 0.0
+        self.last_row = None
+        self.total = 0.0
+
+    def add(self, phase, seconds):
+        self.phases[phase] += seconds
+
+    def row(self, seconds, values=None):
+        # seconds the simulation took to hand over a row, and the row
+        self.add('read' if self.rows else 'first_row', seconds)
+        self.rows += 1
+        self.read_max = max(self.read_max, seconds)
+        self.last_row = values
+
+    def as_dict(self):
+        return {'phases': self.phases, 'rows': self.rows, 'read_max': self.read_max, 'total': self.total}
+
+def profile_summary(profile):
+  # one line of milliseconds per phase, from a TestProfile.as_dict()
+  parts = ["{} {:.2f}".format(phase, profile['phases'][phase] * 1000) for phase in TestProfile.PHASES]
+  if profile['rows']:
+    mean = (profile['phases']['first_row'] + profile['phases']['read']) / profile['rows']
+    parts.append("per row {:.3f} mean/{:.3f} max".format(mean * 1000, profile['read_max'] * 1000))
+  return "profile (ms): {}; total {:.2f}".format(', '.join(parts), profile['total'] * 1000)
+
+def local_sources(modules):
+  """
+      The .py files of modules and of every module of this directory they import, directly or not.
+  """
+  here = os.path.dirname(os.path.abspath(__file__))
+  sources = set()
+  todo = list(modules)
+  while todo:
+    module = todo.pop()
+    path = os.path.splitext(os.path.abspath(module.__file__))[0] + '.py'
+    if path in sources or os.path.dirname(path) != here:
+      continue
+    sources.add(path)
+    todo.extend(v for v in vars(module).values() if isinstance(v, types.ModuleType) and hasattr(v, '__file__'))
+  return sorted(sources)
+
+def simulator_files():
+  # the files a result depends on besides the test itself: the simulator, the model that computes
+  # streamed expectations, the batch layout, the output formats and packed traces, and what they import
+  modules = [mipsmodel, batch, dec, tracefile]
+  if simulation_backend() == 'native':
+    return local_sources([circsim] + modules)
+  return [logisim_location] + local_sources(modules)
+
+def profiling():
+  # LOGISIM_PROFILE is set by --profile, like LOGISIM_BACKEND
+  return bool(os.environ.get('LOGISIM_PROFILE'))
+
+def run_tests(tests, jobs=1, force=False, profile_json=None, batched=False):
   # actual submission testing code
   print "Testing files..."
+  # cached results carry no timings
+  force = force or profiling() or vcd_dir() is not None
+  # tests whose circuits (down to the subcircuits they use), expected output and simulator are unchanged
+  # report the result of their last run; --force runs everything again
+  cache = resultcache.ResultCache()
+  simulator = simulator_files()
+  keys = [test.cache_key(cache, typ, simulator) for description, test, typ in tests]
+  hits = [None if force else cache.get(key) for key in keys]
+  todo = [test for test, hit in zip(tests, hits) if hit is None]
+
+  # lets a running simulation server start every JVM we are about to need up front
+  served = simulation_backend() == 'native' or not todo or simserver.warm([test.circfile for description, test, typ in todo], logisim_location)
   tests_passed = 0
   tests_failed = 0
+  profiles = []
 
-  for description,test,typ in tests:
-    test_passed, reason = test(typ)
+  # served (and native) runs never start Logisim here, so workers only need private copies when they do
+  results = (_run_batched if batched else _run_all)(todo, jobs, not served)
+  for (description, test, typ), key, hit in zip(tests, keys, hits):
+    if hit is not None:
+      test_passed, reason, output = hit
+      profile = None
+      cached = " (cached)"
+    else:
+      description, test_passed, reason, output, profile = next(results)
+      cached = ""
+      if reason != "Error in the test":
+        cache.put(key, test_passed, reason, output)
+    sys.stdout.write(output)
     if test_passed:
-      print "\tPASSED test: %s" % description
+      print "\tPASSED test: %s%s" % (description, cached)
       tests_passed += 1
     else:
-      print "\tFAILED test: %s (%s)" % (description, reason)
+      print "\tFAILED test: %s (%s)%s" % (description, reason, cached)
       tests_failed += 1
+    if profile is not None:
+      print "\t  " + profile_summary(profile)
+      profiles.append(dict(profile, test=description, passed=test_passed))
   
   print "Passed %d/%d tests" % (tests_passed, (tests_passed + tests_failed))
+  if profile_json is not None:
+    with open(profile_json, 'w') as f:
+      json.dump(profiles, f, indent=1, sort_keys=True)
+
+def batchable(test, typ):
+  # plain CPU tests whose rows can be cut out of a batch run by Time Step
+  return isinstance(test, TestCase) and not isinstance(test, StreamingTestCase) and typ in batch.FORMATS and test.load is None and not test.skip
+
+def _run_batched(tests, jobs, private_dirs=True):
+  """
+      Like _run_all, but the tests batch.py can put in one harness are run in one simulation.
+  """
+  together = [i for i, (description, test, typ) in enumerate(tests) if batchable(test, typ)]
+  results = dict(zip(together, _run_batch([tests[i] for i in together])))
+  alone = [i for i in range(len(tests)) if i not in results]
+  results.update(zip(alone, _run_all([tests[i] for i in alone], jobs, private_dirs)))
+  for i in range(len(tests)):
+    yield results[i]
+
+def batch_circuit(runs):
+  """
+      The harness of a batch, named by its contents: the same batch is written once and runs from the same
+      file every time, so simserver.py's spare for it is still fresh.
+  """
+  text = runs.render(file_locations)
+  circfile = os.path.join(file_locations, 'batch-{}.circ'.format(hashlib.sha1(text.encode('utf-8')).hexdigest()[:12]))
+  if not os.path.exists(circfile):
+    fd, tmp = tempfile.mkstemp(prefix='batch-', suffix='.tmp', dir=file_locations)
+    with os.fdopen(fd, 'w') as f:
+      f.write(text)
+    os.rename(tmp, circfile)
+  return circfile
+
+def _run_batch(tests):
+  """
+      Returns (description, passed, reason, output, None) for every test, in order, from one run of a batch
+      harness (see batch.py).  A test the batch cannot take is run on its own.
+  """
+  results = {}
+  members = []
+  runs = batch.Batch()
+  for i, (description, test, typ) in enumerate(tests):
+    oformat = dec.get_test_format(typ)
+    try:
+      expected = test.load_expected(oformat)
+      halt = expected[-1][oformat.headers.index('Time Step')] if expected else None
+      runs.add(test.circfile, mipsmodel.read_rom(test.circfile), halt)
+      members.append((i, oformat))
+    except (batch.BatchException, dec.OutputFormatException, mipsmodel.ModelException, TypeError):
+      results[i] = _run_captured(tests[i])
+  if members:
+    try:
+      circfile = batch_circuit(runs)
+      student_out, stop = start_simulation(circfile, runs.rows)
+      try:
+        parser = OutputProvider(members[0][1])
+        rows = [parser.parse_line(line.rstrip()) for line in iter(student_out.readline, '')]
+      finally:
+        stop()
+      # the segments are cut apart by Time Step, which every batchable format has in the same column
+      split = runs.split(rows, members[0][1])
+    except (batch.BatchException, circsim.CircuitException, dec.OutputFormatException, IOError, OSError) as e:
+      split = None
+      error = str(e)
+    for (i, oformat), rows in zip(members, split or [None] * len(members)):
+      description, test, typ = tests[i]
+      if rows is None:
+        results[i] = (description, False, "Error in the test", "The batch could not be run:\n\t{}\n".format(error), None)
+        continue
+      out = StringIO()
+      passed = rows[:len(test.expected)] == test.expected
+      if passed:
+        reason = "Matched expected output (batch of {})".format(len(members))
+      else:
+        out.write("Format is student then expected\n")
+        wtr = csv.writer(out, delimiter='\t')
+        oformat.header(wtr)
+        shown = []
+        for got, want in zip(rows, test.expected):
+          wtr.writerow(['{0:x}'.format(b) for b in got])
+          wtr.writerow(['{0:x}'.format(b) for b in want])
+          shown.append((got, want))
+          if got != want:
+            break
+        path = write_vcd(test.circfile, oformat, shown)
+        if path:
+          out.write("Waveforms of the student and expected rows in {}\n".format(path))
+        reason = "Did not match expected output (check {}, also check test.py if this is a test you wrote)".format(test.circfile)
+      results[i] = (description, passed, reason, out.getvalue(), None)
+  return [results[i] for i in range(len(tests))]
+
+def _run_all(tests, jobs, private_dirs=True):
+  """
+      Yields (description, passed, reason, output, profile) for every test, in the order given, running up to jobs tests at once.
+  """
+  if jobs <= 1 or len(tests) <= 1:
+    for test in tests:
+      yield _run_captured(test)
+    return
+
+  init = _init_worker if private_dirs else None
+  pool = multiprocessing.Pool(min(jobs, len(tests)), init, (os.getcwd(),))
+  try:
+    # imap hands results back in submission order, so the report reads the same as a serial run
+    for result in pool.imap(_run_captured, tests):
+      yield result
+    pool.close()
+  except:
+    pool.terminate()
+    raise
+  finally:
+    pool.join()
+
+def _init_worker(srcdir):
+  # every worker gets a private copy of the test directory so the .circ files copied in by the
+  # Makefile (and anything Logisim writes next to them) never collide between concurrent runs
+  workdir = tempfile.mkdtemp(prefix='logisim-worker-')
+  testdir = os.path.join(workdir, 'tests')
+  shutil.copytree(srcdir, testdir, ignore=shutil.ignore_patterns('*.pyc', '__pycache__'))
+  multiprocessing.util.Finalize(None, shutil.rmtree, args=(workdir, True), exitpriority=10)
+  os.chdir(testdir)
+
+def _run_captured(test, profile=None):
+  description, test, typ = test
+  if profile is None and profiling():
+    profile = TestProfile()
+  stdout = sys.stdout
+  sys.stdout = StringIO()
+  try:
+    test_passed, reason = test(typ, profile)
+    return (description, test_passed, reason, sys.stdout.getvalue(), profile.as_dict() if profile else None)
+  finally:
+    sys.stdout = stdout
 
 class OutputProvider(object):
     def __init__(self, format):
@@ -130,10 +663,17 @@ class ReferenceFileParser(OutputProvider):
 
     def outputs(self):
         assert self.f is not None, "cannot use outputs if no filename given"
+        if tracefile.is_trace(self.f):
+            with tracefile.Trace(self.f) as trace:
+                if trace.format.bitwidths != self.format.bitwidths:
+                    raise dec.OutputFormatException("{} holds {} rows, not {} rows".format(self.f, trace.format.typ, self.format.typ))
+                for values in trace.rows():
+                    yield values
+            return
         with open(self.f, 'r') as inp:
-            for line in inp.readlines():
-                values = self.parse_line(line)
-                yield values 
+            for block in dec.decode_stream(inp, self.format):
+                for values in block.rows():
+                    yield values
 
 p1_tests = [
   ("ALU add (with overflow) test, with output in python",
@@ -209,6 +749,19 @@ p2_tests = [
                  os.path.join(file_locations,'reference_output/CPU-starter_kit_test.out')), "cpu"),
 ]
 
+# 2 stage pipeline with forwarding and branches and jumps resolved in the fetch stage (no delay slot)
+p2early_tests = [
+  ("beq test, early branch resolution",
+        TestCase(os.path.join(file_locations,'beq-test.circ'),
+                 os.path.join(file_locations,'reference_output/beq-test.early.out')), "cpu"),
+  ("j-sw test, early jump resolution",
+        TestCase(os.path.join(file_locations,'j-sw-test.circ'),
+                 os.path.join(file_locations,'reference_output/j-sw-test.early.out')), "cpu"),
+  ("func test, early jal/jr resolution",
+        TestCase(os.path.join(file_locations,'func_test-cpu.circ'),
+                 os.path.join(file_locations,'reference_output/func_test.early.out')), "cpu"),
+]
+
 # Single-cycle (sc) tests
 p2sc_tests = [
   ("CPU starter test",
@@ -250,6 +803,26 @@ p2sc_tests = [
                          [10000,0,10000,0x0,0,2,0x8,0x00128842],
                          [10000,5000,10000,0x0,0,3,0xC,0x00000000]
                          ]), "cpu"),
+  ("performance counters test",
+        TestCase(os.path.join(file_locations,'CPU-perf_test.circ'),
+                [[0, 0, 0, 0x0, 0, 0, 0x0, 0x20100001, 0, 0, 0, 0],
+                 [1, 0, 0, 0x0, 0, 1, 0x4, 0xac080040, 1, 1, 0, 0],
+                 [1, 0, 0, 0x0, 0, 2, 0x8, 0x12000001, 2, 2, 0, 1],
+                 [1, 0, 0, 0x0, 0, 3, 0xc, 0x20110002, 3, 3, 0, 1],
+                 [1, 2, 0, 0x0, 0, 4, 0x10, 0x16000001, 4, 4, 0, 1],
+                 [1, 2, 0, 0x0, 0, 5, 0x18, 0x8000008, 5, 5, 1, 1],
+                 [1, 2, 0, 0x0, 0, 6, 0x20, 0xc00000a, 6, 6, 2, 1],
+                 [1, 2, 0, 0x24, 0, 7, 0x28, 0x8c090040, 7, 7, 3, 1],
+                 [1, 2, 0, 0x24, 0, 8, 0x2c, 0x2119020, 8, 8, 3, 2],
+                 [1, 2, 3, 0x24, 0, 9, 0x30, 0x0, 9, 9, 3, 2],
+                 [1, 2, 3, 0x24, 0, 10, 0x34, 0x0, 10, 9, 3, 2],
+                 [1, 2, 3, 0x24, 0, 11, 0x38, 0x0, 11, 9, 3, 2],
+                 [1, 2, 3, 0x24, 0, 12, 0x3c, 0x0, 12, 9, 3, 2],
+                 [1, 2, 3, 0x24, 0, 13, 0x40, 0x0, 13, 9, 3, 2]]), "cpu-perf"),
+  ("loop test, run until it jumps to itself",
+        StreamingTestCase(os.path.join(file_locations,'loop-test.circ'), halt=HaltCondition(stable_rows=3)), "cpu"),
+  ("loop test, from a checkpoint at cycle 100000",
+        StreamingTestCase(os.path.join(file_locations,'loop-long-checkpoint.circ'), halt=HaltCondition(stable_rows=3), skip=5), "cpu"),
   ("func test",
         TestCase(os.path.join(file_locations,'func_test.circ'),
         [
@@ -259,16 +832,38 @@ p2sc_tests = [
                          ]), "cpu-end")
 ]
 
+test_suites = {
+  'p1': p1_tests,
+  'p2': p2_tests,
+  'p2early': p2early_tests,
+  'p2sc': p2sc_tests,
+}
+
 if __name__ == '__main__':
-  if len(sys.argv) < 2:
-    print("Usage: " + sys.argv[0] + " (p1|p2|p2sc)")
-    sys.exit(-1)
-  if sys.argv[1] == 'p1':
-    run_tests(p1_tests)
-  elif sys.argv[1] == 'p2':
-    run_tests(p2_tests)
-  elif sys.argv[1] == 'p2sc':
-    run_tests(p2sc_tests)
-  else:
-    print("Usage: " + sys.argv[0] + " (p1|p2)")
-    sys.exit(-1)
+  parser = argparse.ArgumentParser(description="Runs the Logisim test suites.")
+  parser.add_argument('suite', choices=sorted(test_suites))
+  parser.add_argument('-j', '--jobs', type=int, default=multiprocessing.cpu_count(),
+                      help="number of tests to run at once (default: number of cores)")
+  parser.add_argument('--backend', choices=['auto', 'logisim', 'native'], default=os.environ.get('LOGISIM_BACKEND', 'auto'),
+                      help="simulate with Logisim or with the Python simulator in circsim.py (default: %(default)s, "
+                           "which uses Logisim if java is installed)")
+  parser.add_argument('--force', action='store_true',
+                      help="run every test, even those whose circuits and expected output have not changed since a cached run")
+  parser.add_argument('--profile', action='store_true',
+                      help="time the phases of every test (start, first row, reading, parsing, comparing) and print them; "
+                           "implies --force")
+  parser.add_argument('--profile-json', metavar='FILE',
+                      help="also write the timings of --profile to FILE as JSON")
+  parser.add_argument('--batch', action='store_true',
+                      help="run the CPU tests that fit a batch harness (see batch.py) in one simulation")
+  parser.add_argument('--vcd', metavar='DIR',
+                      help="write the rows of every failing test to DIR/<circuit>.vcd (see vcd.py); implies --force")
+  args = parser.parse_args()
+  os.environ['LOGISIM_BACKEND'] = args.backend
+  if args.vcd:
+    if not os.path.isdir(args.vcd):
+      os.makedirs(args.vcd)
+    os.environ['LOGISIM_VCD'] = os.path.abspath(args.vcd)
+  if args.profile or args.profile_json:
+    os.environ['LOGISIM_PROFILE'] = '1'
+  run_tests(test_suites[args.suite], args.jobs, args.force, args.profile_json, args.batch)
@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+"""
+    Static timing analysis of a Logisim circuit.
+
+        python timing.py ../cpu.circ
+        python timing.py --paths 5 --delays mydelays.json --json ../cpu.circ
+
+    The circuit is flattened by circsim.py (subcircuits, tunnels and splitters
+    down to single bits) and each primitive is given a delay from a table:
+    gates by their number of inputs, adders, shifters, comparators,
+    multiplexers, memories, the ALU and register file from the jar.  Paths
+    start at the outputs of the clocked parts (after their clock-to-output
+    delay) and at input pins, and end at the inputs the clocked parts sample
+    on the clock edge (plus their setup time).  The longest of those paths
+    sets the clock period; the report gives the implied maximum clock rate and
+    the --paths slowest endpoints with the path leading to each.
+
+    Delays are in nanoseconds, and the defaults are only a rough scale; a JSON
+    object given with --delays replaces any of them.
+"""
+
+import argparse
+import json
+import sys
+
+import circsim
+
+DEFAULT_DELAYS = {
+    # a gate with n inputs takes gate + (n - 2) * gate_input
+    'gate': 1.0,
+    'gate_input': 0.25,
+    'NOT Gate': 0.5,
+    'Buffer': 0.5,
+    'Multiplexer': 1.5,
+    'Adder': 8.0,
+    'Subtractor': 8.0,
+    'Comparator': 6.0,
+    'Shifter': 4.0,
+    'BitFinder': 5.0,
+    'Bit Extender': 0.0,
+    'Constant': 0.0,
+    'Clock': 0.0,
+    'ROM': 10.0,
+    'RAM': 10.0,
+    'Register': 0.0,
+    'Counter': 1.0,
+    'jar:ALU': 12.0,
+    'jar:RegisterFile': 4.0,
+    # clocked parts: outputs change clk_to_q after the edge; inputs must be ready setup before it
+    'clk_to_q': 1.0,
+    'setup': 0.5,
+}
+
+CLOCKED = ('Register', 'Counter', 'RAM', 'jar:RegisterFile')
+
+class TimingCompiler(circsim.Compiler):
+    """
+        circsim's compiler, used for the inputs each primitive reads rather than for code:
+        deps_of[prim] are the primitives its outputs depend on, sampled_of[prim] those its
+        next state depends on.
+    """
+
+    def __init__(self, netlist):
+        circsim.Compiler.__init__(self, netlist)
+        self.deps_of = {}
+        self.sampled_of = {}
+        self.inputs_of = {}
+        self._sampled = set()
+
+    def sampled(self, build):
+        deps = self.deps
+        self.deps = set()
+        try:
+            return build()
+        finally:
+            self._sampled |= self.deps
+            self.deps = deps
+
+    def clocked(self, prim, nxt, apply):
+        # the clock input is not a data path
+        pass
+
+    def analyze(self):
+        producer = dict((var, prim) for (prim, name), var in self.names.items())
+        for prim in self.netlist.prims:
+            self.deps = set()
+            self.lines = []
+            self._sampled = set()
+            emit = getattr(self, '_emit_' + prim.kind.replace(':', '_').replace(' ', '_'), None)
+            if emit is None:
+                raise circsim.CircuitException("unsupported component {}".format(prim.describe()))
+            emit(prim, *[self.names.get((prim, n)) for n in self._outputs(prim)])
+            # input pins (variables without a producer) are ready at time 0
+            self.deps_of[prim] = set(producer[v] for v in self.deps if v in producer) - set([prim])
+            self.sampled_of[prim] = set(producer[v] for v in self._sampled if v in producer)
+            self.inputs_of[prim] = len([n for n in prim.ports if n.startswith('in') and self.connected(prim, n)])
+        return self
+
+class Path(object):
+    """
+        A path ending at a clocked part: steps are (primitive, its delay, arrival time at its
+        output); required is the arrival at the endpoint plus setup.
+    """
+
+    def __init__(self, endpoint, steps, required):
+        self.endpoint = endpoint
+        self.steps = steps
+        self.required = required
+
+    def as_dict(self):
+        return {
+            'endpoint': self.endpoint.describe(),
+            'required': self.required,
+            'steps': [{'component': prim.describe(), 'kind': prim.kind, 'delay': d, 'arrival': t}
+                      for prim, d, t in self.steps],
+        }
+
+class Timing(object):
+    """
+        Arrival times of every primitive of a circuit, and the paths into its clocked parts.
+    """
+
+    def __init__(self, circfile, circuit=None, delays=None):
+        self.delays = dict(DEFAULT_DELAYS)
+        self.delays.update(delays or {})
+        netlist = circsim.Netlist(circsim.Loader().load(circfile), circuit)
+        self.compiler = TimingCompiler(netlist).analyze()
+        self.arrival = {}
+        self.worst_input = {}
+        for prim in netlist.prims:
+            self._arrive(prim)
+        self.paths = sorted((self._path(prim) for prim in netlist.prims
+                             if prim.kind in CLOCKED and self.compiler.sampled_of[prim]),
+                            key=lambda p: -p.required)
+
+    def _arrive(self, start):
+        # depth first, without recursion: subcircuit nesting makes the paths long
+        deps_of = self.compiler.deps_of
+        stack = [start]
+        visiting = set()
+        while stack:
+            prim = stack[-1]
+            if prim in self.arrival:
+                stack.pop()
+                continue
+            waiting = [d for d in deps_of[prim] if d not in self.arrival]
+            if waiting and prim not in visiting:
+                visiting.add(prim)
+                for d in waiting:
+                    if d in visiting:
+                        raise circsim.CircuitException("combinational loop through {}".format(d.describe()))
+                    stack.append(d)
+                continue
+            visiting.discard(prim)
+            stack.pop()
+            launch = self.delays['clk_to_q'] if prim.kind in CLOCKED else 0.0
+            worst = max(deps_of[prim], key=lambda d: self.arrival[d]) if deps_of[prim] else None
+            ready = max(launch, self.arrival[worst]) if worst is not None else launch
+            if worst is not None and self.arrival[worst] < launch:
+                worst = None
+            self.worst_input[prim] = worst
+            self.arrival[prim] = ready + self.delay(prim)
+
+    def _path(self, endpoint):
+        sampled = self.compiler.sampled_of[endpoint]
+        last = max(sampled, key=lambda d: self.arrival[d])
+        steps = []
+        prim = last
+        while prim is not None:
+            steps.append((prim, self.delay(prim), self.arrival[prim]))
+            prim = self.worst_input[prim]
+        steps.reverse()
+        return Path(endpoint, steps, self.arrival[last] + self.delays['setup'])
+
+    def delay(self, prim):
+        kind = prim.kind
+        if kind in circsim.GATES:
+            inputs = self.compiler.inputs_of[prim]
+            return self.delays['gate'] + max(0, inputs - 2) * self.delays['gate_input']
+        if kind not in self.delays:
+            raise circsim.CircuitException("no delay given for {}".format(prim.describe()))
+        return self.delays[kind]
+
+    @property
+    def period(self):
+        return self.paths[0].required if self.paths else 0.0
+
+    @property
+    def fmax(self):
+        # MHz for a period in ns
+        return 1000.0 / self.period if self.period else None
+
+    def as_dict(self, paths):
+        return {'period_ns': self.period, 'fmax_mhz': self.fmax, 'delays': self.delays,
+                'paths': [p.as_dict() for p in self.paths[:paths]]}
+
+def report(timing, paths, out=sys.stdout):
+    if not timing.paths:
+        out.write("no paths into clocked parts\n")
+        return
+    out.write("critical path {:.2f} ns, maximum clock {:.1f} MHz\n".format(timing.period, timing.fmax))
+    for n, path in enumerate(timing.paths[:paths], 1):
+        out.write("\n{}. {:.2f} ns into {}\n".format(n, path.required, path.endpoint.describe()))
+        for prim, d, t in path.steps:
+            out.write("  {:8.2f} {:+7.2f}  {}\n".format(t, d, prim.describe()))
+        out.write("  {:8.2f} {:+7.2f}  setup\n".format(path.required, timing.delays['setup']))
+
+def main():
+    parser = argparse.ArgumentParser(description="Finds the critical paths of a circuit and its maximum clock rate.")
+    parser.add_argument('circfile')
+    parser.add_argument('--circuit', help="circuit to analyze (default: the main circuit)")
+    parser.add_argument('--paths', type=int, default=3, help="slowest endpoints to show (default: %(default)s)")
+    parser.add_argument('--delays', help="JSON object of delays replacing the defaults, e.g. {\"Adder\": 4}")
+    parser.add_argument('--json', action='store_true', help="print the report as JSON")
+    args = parser.parse_args()
+
+    try:
+        delays = None
+        if args.delays:
+            with open(args.delays) as f:
+                delays = json.load(f)
+        timing = Timing(args.circfile, args.circuit, delays)
+    except (circsim.CircuitException, IOError, ValueError) as e:
+        sys.exit(str(e))
+    if args.json:
+        json.dump(timing.as_dict(args.paths), sys.stdout, indent=1, sort_keys=True)
+        sys.stdout.write('\n')
+    else:
+        report(timing, args.paths)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+"""
+    Packed binary traces: the same rows as a Logisim -tty table reference file,
+    stored as little-endian 32 bit words.
+
+    Layout:
+        magic       8 bytes  "LGTRACE1"
+        typ         1 byte length + the OutputFormat type (alu, regfile, cpu, ...)
+        columns     2 bytes
+        widths      columns * (bit width, pin width), 1 byte each
+        padding     zeros up to a multiple of 4 bytes
+        rows        columns * 4 bytes each, little-endian
+
+    Conversion to and from the text format:
+
+        python tracefile.py pack cpu reference_output/CPU-starter_kit_test.out starter.trace
+        python tracefile.py unpack starter.trace
+
+    Loading maps the file; on Python 3 the rows are a view of the mapping
+    (no copy) on little-endian machines.
+"""
+
+import argparse
+import mmap
+import struct
+import sys
+from array import array
+
+import decode_out as dec
+
+MAGIC = b'LGTRACE1'
+
+def is_trace(path):
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except IOError:
+        return False
+
+def _header(oformat):
+    typ = oformat.typ.encode('ascii')
+    head = MAGIC + struct.pack('<B', len(typ)) + typ + struct.pack('<H', len(oformat.bitwidths))
+    for bits, pins in zip(oformat.bitwidths, oformat.pinwidths):
+        head += struct.pack('<BB', bits, pins)
+    return head + b'\0' * (-len(head) % 4)
+
+def _words(values):
+    # values as little-endian 32 bit words
+    a = array(dec.WORD, values)
+    if a.itemsize != 4:
+        return struct.pack('<{}I'.format(len(a)), *a)
+    if sys.byteorder != 'little':
+        a.byteswap()
+    return a.tobytes() if hasattr(a, 'tobytes') else a.tostring()
+
+def _format(typ, bitwidths, pinwidths):
+    known = dec.get_test_format(typ)
+    if known and known.bitwidths == bitwidths and known.pinwidths == pinwidths:
+        return known
+    return dec.OutputFormat(typ, ['column {}'.format(i) for i in range(len(bitwidths))], bitwidths, pinwidths)
+
+def write(f, oformat, blocks):
+    """
+        Writes a trace of oformat rows to the binary file f.  blocks is an iterable of
+        decode_out Blocks (or of lists of rows).  Returns the number of rows written.
+    """
+    f.write(_header(oformat))
+    count = 0
+    for block in blocks:
+        if isinstance(block, dec.Block):
+            f.write(_words(block.values))
+            count += len(block)
+        else:
+            for row in block:
+                oformat.validate(row)
+                f.write(_words(row))
+                count += 1
+    return count
+
+class Trace(object):
+    """
+        A trace file opened through mmap: format is its OutputFormat and block one Block
+        holding every row.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.map = self.block = None
+        self.f = open(path, 'rb')
+        try:
+            self.map = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty file
+            self.f.close()
+            raise dec.OutputFormatException("{} is not a trace file".format(path))
+        try:
+            self.format, offset = self._read_header()
+            self.block = dec.Block(self._values(offset), len(self.format.bitwidths))
+            self._check()
+        except Exception:
+            self.close()
+            raise
+
+    def _read_header(self):
+        m = self.map
+        if m[:len(MAGIC)] != MAGIC or len(m) < len(MAGIC) + 1:
+            raise dec.OutputFormatException("{} is not a trace file".format(self.path))
+        pos = len(MAGIC)
+        n = struct.unpack('<B', m[pos:pos + 1])[0]
+        typ = m[pos + 1:pos + 1 + n].decode('ascii')
+        pos += 1 + n
+        columns = struct.unpack('<H', m[pos:pos + 2])[0]
+        pos += 2
+        widths = struct.unpack('<{}B'.format(2 * columns), m[pos:pos + 2 * columns])
+        pos += 2 * columns
+        pos += -pos % 4
+        if not columns or (len(m) - pos) % (4 * columns):
+            raise dec.OutputFormatException("{} is truncated".format(self.path))
+        return _format(typ, list(widths[0::2]), list(widths[1::2])), pos
+
+    def _values(self, offset):
+        if hasattr(memoryview, 'cast') and sys.byteorder == 'little' and array('I').itemsize == 4:
+            return memoryview(self.map)[offset:].cast('I')
+        values = array(dec.WORD)
+        data = self.map[offset:]
+        if values.itemsize != 4:
+            values.extend(struct.unpack('<{}I'.format(len(data) // 4), data))
+            return values
+        if hasattr(values, 'frombytes'):
+            values.frombytes(data)
+        else:
+            values.fromstring(data)
+        if sys.byteorder != 'little':
+            values.byteswap()
+        return values
+
+    def _check(self):
+        if not len(self.block):
+            return
+        for c, width in enumerate(self.format.bitwidths):
+            if max(self.block.column(c)) >> width:
+                raise dec.OutputFormatException("{}: values too wide for column {} ({})".format(
+                    self.path, c, self.format.headers[c]))
+
+    def __len__(self):
+        return len(self.block)
+
+    def rows(self):
+        return self.block.rows()
+
+    def close(self):
+        if self.block is not None and isinstance(self.block.values, memoryview):
+            self.block.values.release()
+        if self.map is not None:
+            self.map.close()
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def pack(textfile, tracefile, typ):
+    """
+        Converts a -tty table text file to a trace; returns the number of rows.
+    """
+    oformat = dec.get_test_format(typ)
+    if not oformat:
+        raise dec.OutputFormatException("unknown output format {}".format(typ))
+    with open(textfile, 'r') as inp:
+        with open(tracefile, 'wb') as out:
+            return write(out, oformat, dec.decode_stream(inp, oformat))
+
+def unpack(tracefile, out):
+    """
+        Writes a trace back out as -tty table text, the way Logisim prints it.
+    """
+    with Trace(tracefile) as trace:
+        for row in trace.rows():
+            out.write(trace.format.format_row(row) + '\n')
+        return len(trace)
+
+def main():
+    parser = argparse.ArgumentParser(description="Converts Logisim -tty table output to packed binary traces and back.")
+    sub = parser.add_subparsers(dest='command')
+    p = sub.add_parser('pack', help="text to trace")
+    p.add_argument('typ', help="output format (alu, regfile, cpu, cpu-lite, cpu-end, cpu-perf)")
+    p.add_argument('textfile')
+    p.add_argument('tracefile')
+    u = sub.add_parser('unpack', help="trace to text")
+    u.add_argument('tracefile')
+    u.add_argument('textfile', nargs='?', help="output file (default: standard output)")
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'pack':
+            rows = pack(args.textfile, args.tracefile, args.typ)
+            print("{}: {} rows".format(args.tracefile, rows))
+        elif args.command == 'unpack':
+            if args.textfile:
+                with open(args.textfile, 'w') as out:
+                    unpack(args.tracefile, out)
+            else:
+                unpack(args.tracefile, sys.stdout)
+        else:
+            parser.print_usage()
+            sys.exit(2)
+    except (dec.OutputFormatException, IOError) as e:
+        sys.exit("error: {}".format(e))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+"""
+    Converts logisim -tty table output into a Value Change Dump for GTKWave.
+
+        java -jar logisim.jar -tty table CPU-starter_kit_test.circ | python vcd.py cpu - run.vcd
+        python vcd.py cpu --start 100000 --end 100200 run.out window.vcd
+        python vcd.py cpu-perf run.trace run.vcd
+
+    The input is the table text (a file, or - for standard input) or a packed
+    trace from tracefile.py, with the columns of a decode_out OutputFormat;
+    every column becomes a wire as wide as its pin.  Rows are read one at a
+    time and only the wires that changed are written, so memory use does not
+    grow with the length of the run.  Undefined (x) and error (E) bits stay
+    x in the dump.
+
+    Time is the Time Step column when the format has one (one unit per
+    cycle) and the row number otherwise, or with --rows.  --start and --end
+    keep the rows whose time is in that range; the values in force at --start
+    are dumped at --start, and reading stops after --end.
+
+    test.py --vcd DIR writes the rows of every failing test here too, the
+    student's and the expected ones side by side.
+"""
+
+import argparse
+import re
+import sys
+
+import decode_out as dec
+import tracefile
+
+class VCDException(Exception):
+    pass
+
+def identifiers():
+    # VCD identifier codes: printable ASCII from ! to ~, counted in base 94
+    n = 0
+    while True:
+        code = ''
+        i = n
+        while True:
+            code += chr(33 + i % 94)
+            i = i // 94 - 1
+            if i < 0:
+                break
+        yield code
+        n += 1
+
+def var_name(header):
+    return re.sub(r'[^A-Za-z0-9_]+', '_', header).strip('_') or 'value'
+
+_undefined = re.compile(r'[^01]')
+
+def bits(field):
+    """
+        A table field ("0000 0001", "xxxx xxxx", an int) as VCD digits: leading zeros left out,
+        anything but 0 and 1 as x.
+    """
+    if not isinstance(field, str):
+        return '{:b}'.format(field)
+    field = _undefined.sub('x', field.replace(' ', '').lower())
+    return field.lstrip('0') or '0'
+
+class Writer(object):
+    """
+        Writes the columns of an OutputFormat as wires, once in every scope (e.g. a run and the
+        rows it was expected to give).  change() takes the rows in time order.
+    """
+
+    def __init__(self, out, oformat, scopes=('run',), timescale='1ns', comment=None):
+        self.out = out
+        self.widths = oformat.pinwidths
+        codes = identifiers()
+        self.codes = [[next(codes) for _ in oformat.headers] for _ in scopes]
+        self.last = [[None] * len(oformat.headers) for _ in scopes]
+        # the fields as given, so an unchanged one is not converted again
+        self.raw = [[None] * len(oformat.headers) for _ in scopes]
+        self.time = None
+        self.dumped = False
+        out.write("$version tests/vcd.py {} $end\n".format(oformat.typ))
+        if comment:
+            out.write("$comment {} $end\n".format(comment))
+        out.write("$timescale {} $end\n".format(timescale))
+        for scope, codes in zip(scopes, self.codes):
+            out.write("$scope module {} $end\n".format(var_name(scope)))
+            for header, width, code in zip(oformat.headers, self.widths, codes):
+                out.write("$var wire {} {} {} $end\n".format(width, code, var_name(header)))
+            out.write("$upscope $end\n")
+        out.write("$enddefinitions $end\n")
+
+    def change(self, time, fields, scope=0):
+        if len(fields) != len(self.widths):
+            raise VCDException("{} values instead of {}".format(len(fields), len(self.widths)))
+        if self.time is not None and time < self.time:
+            raise VCDException("time goes back from {} to {}".format(self.time, time))
+        last = self.last[scope]
+        raw = self.raw[scope]
+        codes = self.codes[scope]
+        lines = []
+        for i, field in enumerate(fields):
+            if field == raw[i]:
+                continue
+            raw[i] = field
+            value = bits(field)
+            if value != last[i]:
+                last[i] = value
+                if self.widths[i] == 1:
+                    lines.append(value + codes[i])
+                else:
+                    lines.append('b{} {}'.format(value, codes[i]))
+        if not lines:
+            return
+        if time != self.time:
+            if self.dumped:
+                self.out.write('#{}\n'.format(time))
+            self.time = time
+        if not self.dumped:
+            # the first values are the initial dump
+            self.out.write('#{}\n$dumpvars\n{}\n$end\n'.format(time, '\n'.join(lines)))
+            self.dumped = True
+        else:
+            self.out.write('\n'.join(lines) + '\n')
+
+def table_rows(f, columns):
+    # the fields of every line of -tty table text, as printed
+    for n, line in enumerate(f):
+        line = line.rstrip('\r\n')
+        if not line:
+            continue
+        fields = line.split('\t')
+        if len(fields) != columns:
+            raise VCDException("line {}: {} values instead of {}".format(n + 1, len(fields), columns))
+        yield fields
+
+def convert(rows, oformat, out, start=None, end=None, use_rows=False, timescale='1ns'):
+    """
+        Writes the VCD of rows (lists of table fields or ints) to out; returns the number of rows written.
+    """
+    column = None
+    if not use_rows and 'Time Step' in oformat.headers:
+        column = oformat.headers.index('Time Step')
+    writer = None
+    before = None
+    written = 0
+    time = -1
+    for n, fields in enumerate(rows):
+        if column is None:
+            time = n
+        else:
+            step = bits(fields[column])
+            # an undefined Time Step keeps the time of the row before
+            if 'x' not in step:
+                time = int(step, 2)
+        if end is not None and time > end:
+            break
+        if start is not None and time < start:
+            before = fields
+            continue
+        if writer is None:
+            writer = Writer(out, oformat, timescale=timescale,
+                            comment='one time unit per {}'.format('row' if column is None else 'time step'))
+            if before is not None and time > start:
+                writer.change(start, before)
+        writer.change(max(time, 0), fields)
+        written += 1
+    if writer is None:
+        # nothing in the range; still a file GTKWave opens
+        Writer(out, oformat, timescale=timescale)
+    return written
+
+def read_rows(path, oformat):
+    """
+        The rows of a packed trace or of table text (- is standard input), one at a time.
+    """
+    if path != '-' and tracefile.is_trace(path):
+        with tracefile.Trace(path) as trace:
+            if trace.format.pinwidths != oformat.pinwidths:
+                raise dec.OutputFormatException("{} holds {} rows, not {} rows".format(path, trace.format.typ, oformat.typ))
+            for values in trace.rows():
+                yield values
+        return
+    f = sys.stdin if path == '-' else open(path)
+    try:
+        for fields in table_rows(f, len(oformat.headers)):
+            yield fields
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Converts logisim -tty table output into a VCD waveform.")
+    parser.add_argument('format', choices=['alu', 'regfile', 'cpu', 'cpu-lite', 'cpu-end', 'cpu-perf'])
+    parser.add_argument('input', help="table text or packed trace (- for standard input)")
+    parser.add_argument('output', nargs='?', default='-', help="VCD file (default: standard output)")
+    parser.add_argument('--start', type=int, help="first time to keep")
+    parser.add_argument('--end', type=int, help="last time to keep")
+    parser.add_argument('--rows', action='store_true', help="count time in rows, even with a Time Step column")
+    parser.add_argument('--timescale', default='1ns', help="VCD time unit (default: %(default)s)")
+    args = parser.parse_args()
+
+    oformat = dec.get_test_format(args.format)
+    out = sys.stdout if args.output == '-' else open(args.output, 'w')
+    try:
+        written = convert(read_rows(args.input, oformat), oformat, out, args.start, args.end, args.rows, args.timescale)
+    except (VCDException, dec.OutputFormatException, IOError) as e:
+        sys.exit(str(e))
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    if out is not sys.stdout:
+        sys.stderr.write("{}: {} rows\n".format(args.output, written))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+"""
+    Bit-parallel evaluation of combinational circuits with NumPy.
+
+    The netlist compiler from circsim.py generates the same settle() function,
+    but over arrays: every wire holds one value per test vector, so a single
+    call checks millions of vectors.  Two checks are built on it:
+
+        python vecsim.py alu
+        python vecsim.py regfile --vectors 1000000
+
+    Both print the mismatches in the alu / regfile OutputFormat, student row
+    then expected row, like test.py.  Needs numpy.
+
+    The Java components are not simulated but replaced by circsim.py's Python
+    versions of them (_alu above and the register array of
+    _emit_jar_RegisterFile), and alu.circ is one ALU from ALU.jar wired to
+    pins, so random vectors through it would only check _alu against itself.
+    alu therefore runs the vectors in the ROMs of the ALU_TRACES harnesses
+    through alu.circ and compares the outputs with what ALU.jar gave for them
+    in Logisim (their reference_output traces): a handful of vectors, but
+    ones that check _alu against the real component.  regfile reads random
+    register file contents through regfile.circ's four RegisterFiles, which
+    checks that its pins, tunnels and splitters route the read ports right,
+    not that cs3410.jar stores as modelled: for that, run the p1 suite of
+    test.py with the logisim backend.
+"""
+
+import argparse
+import csv
+import os.path
+import sys
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import circsim
+import decode_out as dec
+
+MASK = 0xffffffff
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+def _alu(x, y, op):
+    # circsim._alu over arrays: returns (overflow, result)
+    sh = x & 31
+    add = (x + y) & MASK
+    sub = (x - y) & MASK
+    result = np.select([op == 0, op == 1, op == 2, (op == 3) | (op == 4), (op == 5) | (op == 6),
+                        op == 7, op == 8, op == 9, op == 10, op == 11],
+                       [(y << sh) & MASK, y >> sh, _sra(y, sh, 32), add, sub, x & y, x | y, x ^ y,
+                        ((x ^ 0x80000000) < (y ^ 0x80000000)).astype(np.uint64),
+                        (x < y).astype(np.uint64)],
+                       0).astype(np.uint64)
+    overflow = np.where(op == 3, (~(x ^ y) & (x ^ add)) >> 31,
+                        np.where(op == 5, ((x ^ y) & (x ^ sub)) >> 31, 0)) & 1
+    return overflow.astype(np.uint64), result
+
+def _sra(a, d, width):
+    sign = 1 << (width - 1)
+    signed = (a ^ sign).astype(np.int64) - sign
+    return (signed >> d.astype(np.int64)).astype(np.uint64) & ((1 << width) - 1)
+
+def _bitfind(a, width, high):
+    index = np.zeros_like(a)
+    bits = range(width) if high else range(width - 1, -1, -1)
+    for b in bits:
+        index = np.where((a >> b) & 1, b, index)
+    return index.astype(np.uint64), (a != 0).astype(np.uint64)
+
+class VectorCompiler(circsim.Compiler):
+    """
+        circsim's compiler, generating NumPy expressions.  Only combinational parts and the
+        read ports of the register file are supported; its contents are set by the caller.
+    """
+
+    def __init__(self, netlist):
+        circsim.Compiler.__init__(self, netlist)
+        self.namespace.update({'np': np, '_alu': _alu, '_sra': _sra, '_bitfind': _bitfind})
+
+    def select(self, cond, a, b):
+        return 'np.where({}, {}, {})'.format(cond, a, b)
+
+    def boolean(self, cond):
+        return '({}).astype(np.uint64)'.format(cond)
+
+    def differs(self, tests):
+        return 'np.any({})'.format(' | '.join('({})'.format(t) for t in tests))
+
+    def memory(self, contents):
+        return circsim.Compiler.memory(self, np.array(contents, dtype=np.uint64))
+
+    def clocked(self, prim, nxt, apply):
+        # writes are not part of the combinational read path
+        pass
+
+    def state(self, value=0):
+        raise circsim.CircuitException("vector evaluation only handles combinational circuits")
+
+    def _emit_Clock(self, prim, out):
+        raise circsim.CircuitException("vector evaluation only handles combinational circuits")
+
+    def _emit_ROM(self, prim, out):
+        raise circsim.CircuitException("vector evaluation does not support {}".format(prim.describe()))
+
+    _emit_RAM = _emit_ROM
+
+    def _emit_Shifter(self, prim, out):
+        if prim.comp.get('shift', 'll') != 'ar':
+            return circsim.Compiler._emit_Shifter(self, prim, out)
+        self.emit('{} = _sra({}, {}, {})', out, self.inp(prim, 'in'), self.inp(prim, 'dist'),
+                  prim.ports['out'][1].width)
+
+    def _emit_BitFinder(self, prim, index, present):
+        a = self.inp(prim, 'in')
+        width = prim.ports['in'][1].width
+        typ = prim.comp.get('type', 'low1')
+        if typ.endswith('0'):
+            a = '({} ^ {})'.format(a, circsim._hex(circsim._mask(width)))
+        self.emit('{}, {} = _bitfind({}, {}, {})', index, present, a, width, typ.startswith('high'))
+
+class VectorCircuit(object):
+    """
+        A circuit evaluated over arrays.  evaluate() maps input pin labels to arrays (or ints)
+        and returns a dict from output pin label to array.
+    """
+
+    def __init__(self, circfile):
+        if np is None:
+            raise circsim.CircuitException("vector evaluation needs numpy")
+        netlist = circsim.Netlist(circsim.Loader().load(circfile))
+        compiler = VectorCompiler(netlist).compile()
+        self.namespace = compiler.namespace
+        exec(compile(compiler.source, '<{}>'.format(circfile), 'exec'), self.namespace)
+        self.inputs = compiler.inputs
+        self.headers = compiler.headers
+        self.regfiles = [prim.memory for prim in netlist.prims if prim.kind == 'jar:RegisterFile']
+
+    def set_registers(self, values):
+        for name in self.regfiles:
+            self.namespace[name][:] = values
+
+    def evaluate(self, inputs):
+        args = {}
+        for label, width, var in self.inputs:
+            if label in inputs:
+                args[var] = np.asarray(inputs[label], dtype=np.uint64) & circsim._mask(width)
+        outputs = self.namespace['settle']([], 0, **args)
+        n = max(len(np.atleast_1d(v)) for v in args.values()) if args else 1
+        return dict((label, np.broadcast_to(np.asarray(v, dtype=np.uint64), (n,)))
+                    for label, v in zip(self.headers, outputs))
+
+# --- references --------------------------------------------------------------
+
+# ALU harnesses with a trace of their run in Logisim: the ROMs hold the vectors, the trace what ALU.jar made of them
+ALU_TRACES = [(os.path.join(HERE, name + '.circ'), os.path.join(HERE, 'reference_output', name + '.out'))
+              for name in ('alu-add', 'alu-sra')]
+
+def recorded_alu_vectors(harness, reference):
+    """
+        (x, y, op, [overflow, equal, result]) arrays of an ALU harness run in Logisim: the inputs are the
+        words at each Test # of the ROMs wired to the ALU's X, Y and Switch, the outputs the rows of its trace.
+    """
+    netlist = circsim.Netlist(circsim.Loader().load(harness))
+    alus = [p for p in netlist.prims if p.kind == 'jar:ALU']
+    if len(alus) != 1:
+        raise circsim.CircuitException("{} does not hold exactly one ALU".format(harness))
+    find = netlist.uf.find
+    roms = dict((find(p.ports['data'][0]), circsim.read_contents(p.comp.get('contents', 'addr/data: 8 8\n')))
+                for p in netlist.prims if p.kind == 'ROM')
+    inputs = []
+    for port in ('X', 'Y', 'Switch'):
+        rom = roms.get(find(alus[0].ports[port][0]))
+        if rom is None:
+            raise circsim.CircuitException("the ALU's {} in {} is not driven by a ROM".format(port, harness))
+        inputs.append(rom)
+    with open(reference) as f:
+        rows = [values for block in dec.decode_stream(f, dec.get_test_format('alu')) for values in block.rows()]
+    tests = [row[0] for row in rows]
+    x, y, op = [np.array([rom[t] if t < len(rom) else 0 for t in tests], dtype=np.uint64) for rom in inputs]
+    return x, y, op, [np.array([row[i] for row in rows], dtype=np.uint64) for i in (1, 2, 3)]
+
+def check_alu(circfile, vectors, seed=0):
+    """
+        Returns (vectors checked, list of (index, inputs, student row, expected row)) for the vectors of
+        ALU_TRACES, expected as ALU.jar gave them in Logisim.  There are only as many as the traces hold, so
+        vectors and seed are not used.
+    """
+    circuit = VectorCircuit(circfile)
+    checked = 0
+    mismatches = []
+    for harness, reference in ALU_TRACES:
+        x, y, op, expected = recorded_alu_vectors(harness, reference)
+        out = circuit.evaluate({'X': x, 'Y': y, 'Switch': op})
+        student = [out['Signed Overflow'], out['Equal'], out['Result']]
+        bad = np.zeros(len(x), dtype=bool)
+        for s, e in zip(student, expected):
+            bad |= s != e
+        mismatches.extend((checked + int(i), '{} test {}: X={:#x} Y={:#x} Switch={}'.format(os.path.basename(harness), i, int(x[i]), int(y[i]), int(op[i])),
+                           [int(i)] + [int(s[i]) for s in student], [int(i)] + [int(e[i]) for e in expected])
+                          for i in np.nonzero(bad)[0])
+        checked += len(x)
+    return checked, mismatches
+
+def check_regfile(circfile, vectors, seed=0):
+    circuit = VectorCircuit(circfile)
+    rng = np.random.RandomState(seed)
+    regs = rng.randint(0, 1 << 32, size=32, dtype=np.uint64)
+    regs[0] = 0
+    circuit.set_registers(regs)
+    ra = np.concatenate([np.repeat(np.arange(32, dtype=np.uint64), 32), rng.randint(0, 32, size=vectors).astype(np.uint64)])
+    rb = np.concatenate([np.tile(np.arange(32, dtype=np.uint64), 32), rng.randint(0, 32, size=vectors).astype(np.uint64)])
+    out = circuit.evaluate({'Read Register 1': ra, 'Read Register 2': rb})
+    labels = ['$s0 Value', '$s1 Value', '$s2 Value', '$ra Value', '$sp Value', 'Read Data 1', 'Read Data 2']
+    student = [out[label] for label in labels]
+    expected = [np.full(len(ra), regs[r]) for r in (16, 17, 18, 31, 29)] + [regs[ra], regs[rb]]
+    bad = np.zeros(len(ra), dtype=bool)
+    for s, e in zip(student, expected):
+        bad |= s != e
+    mismatches = [(i, 'Read Register 1={} Read Register 2={}'.format(int(ra[i]), int(rb[i])),
+                   [i] + [int(s[i]) for s in student], [i] + [int(e[i]) for e in expected])
+                  for i in np.nonzero(bad)[0]]
+    return len(ra), mismatches
+
+# check name: (default circuit, check function, what a pass shows)
+CHECKS = {
+    'alu': ('alu.circ', check_alu, "circsim's model of ALU.jar against the outputs Logisim recorded"),
+    'regfile': ('regfile.circ', check_regfile, "read-port wiring only, with circsim's model of the register files"),
+}
+
+def main():
+    parser = argparse.ArgumentParser(description="Checks alu.circ against the ALU outputs Logisim recorded in reference_output, "
+                                     "or the read-port wiring of regfile.circ over many vectors at once. "
+                                     "The ALU.jar and cs3410.jar components are replaced by circsim.py's Python models of them.")
+    parser.add_argument('check', choices=sorted(CHECKS))
+    parser.add_argument('--circ', help="circuit to check (default: alu.circ or regfile.circ)")
+    parser.add_argument('--vectors', type=int, default=1000000, help="random vectors for regfile, on top of every pair of read ports (default: %(default)s)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--show', type=int, default=20, help="mismatches to print (default: %(default)s)")
+    args = parser.parse_args()
+
+    circfile, check, scope = CHECKS[args.check]
+    circfile = args.circ or circfile
+    start = time.time()
+    try:
+        count, mismatches = check(circfile, args.vectors, args.seed)
+    except (circsim.CircuitException, dec.OutputFormatException, IOError) as e:
+        sys.exit("{}: {}".format(circfile, e))
+    elapsed = time.time() - start
+
+    if mismatches:
+        oformat = dec.get_test_format(args.check)
+        print("Format is student then expected")
+        wtr = csv.writer(sys.stdout, delimiter='\t')
+        oformat.header(wtr)
+        for index, inputs, student, expected in mismatches[:args.show]:
+            print("# vector {}: {}".format(index, inputs))
+            wtr.writerow(['{0:x}'.format(b) for b in student])
+            wtr.writerow(['{0:x}'.format(b) for b in expected])
+    print("{}: {} mismatches in {} vectors ({:.2f}s, {:.0f} vectors/s); {}".format(
+        circfile, len(mismatches), count, elapsed, count / max(elapsed, 1e-9), scope))
+    sys.exit(1 if mismatches else 0)
+
+if __name__ == '__main__':
+    main()